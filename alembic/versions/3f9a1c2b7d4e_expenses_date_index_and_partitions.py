@@ -0,0 +1,127 @@
+"""Expenses date index and monthly partitions
+
+Revision ID: 3f9a1c2b7d4e
+Revises: 054b205157c5
+Create Date: 2025-04-14 10:12:41.503218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c2b7d4e'
+down_revision: Union[str, None] = '054b205157c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Fixed so the migration creates the same schema everywhere; partitions.ensure_partitions
+# extends the horizon to PARTITION_MONTHS_AHEAD at startup or from cron.
+INITIAL_MONTHS_AHEAD = 12
+
+
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION expenses_create_partition(month_start date) RETURNS void AS $$
+DECLARE
+    partition_name text := 'expenses_' || to_char(month_start, 'YYYY_MM');
+    month_end date := (month_start + interval '1 month')::date;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    -- Rows that landed in the default partition must move out before the range can be attached.
+    EXECUTE format('CREATE TABLE %I (LIKE expenses INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM expenses_default WHERE date >= %L AND date < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+    EXECUTE format('ALTER TABLE expenses ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, month_start, month_end);
+END
+$$ LANGUAGE plpgsql
+"""
+
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION expenses_ensure_partitions(from_date date, months_ahead integer) RETURNS void AS $$
+DECLARE
+    month_start date;
+BEGIN
+    FOR month_start IN SELECT DISTINCT date_trunc('month', date)::date FROM expenses_default LOOP
+        PERFORM expenses_create_partition(month_start);
+    END LOOP;
+
+    FOR i IN 0..months_ahead LOOP
+        PERFORM expenses_create_partition((date_trunc('month', from_date) + make_interval(months => i))::date);
+    END LOOP;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("UPDATE expenses SET date = CURRENT_TIMESTAMP WHERE date IS NULL")
+    op.drop_index(op.f('ix_expenses_id'), table_name='expenses')
+
+    if op.get_bind().dialect.name != 'postgresql':
+        with op.batch_alter_table('expenses') as batch_op:
+            batch_op.alter_column('date', existing_type=sa.DateTime(), nullable=False)
+        op.create_index('ix_expenses_date_id', 'expenses', ['date', 'id'], unique=False)
+        return
+
+    op.execute("ALTER TABLE expenses RENAME TO expenses_unpartitioned")
+    op.execute("ALTER TABLE expenses_unpartitioned RENAME CONSTRAINT expenses_pkey TO expenses_unpartitioned_pkey")
+    op.execute("""
+        CREATE TABLE expenses (
+            id integer NOT NULL DEFAULT nextval('expenses_id_seq'),
+            name varchar NOT NULL,
+            amount double precision NOT NULL,
+            amount_usd double precision,
+            date timestamp without time zone NOT NULL DEFAULT now(),
+            CONSTRAINT expenses_pkey PRIMARY KEY (id, date)
+        ) PARTITION BY RANGE (date)
+    """)
+    op.execute("CREATE TABLE expenses_default PARTITION OF expenses DEFAULT")
+    op.execute("CREATE INDEX ix_expenses_date_id ON expenses (date, id)")
+    op.execute(CREATE_PARTITION_FUNCTION)
+    op.execute(ENSURE_PARTITIONS_FUNCTION)
+
+    op.execute("INSERT INTO expenses (id, name, amount, amount_usd, date) "
+               "SELECT id, name, amount, amount_usd, date FROM expenses_unpartitioned")
+    op.execute(sa.text("SELECT expenses_ensure_partitions(CAST(now() AS date), :months)")
+               .bindparams(months=INITIAL_MONTHS_AHEAD))
+
+    op.execute("ALTER SEQUENCE expenses_id_seq OWNED BY expenses.id")
+    op.execute("DROP TABLE expenses_unpartitioned")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index('ix_expenses_date_id', table_name='expenses')
+        with op.batch_alter_table('expenses') as batch_op:
+            batch_op.alter_column('date', existing_type=sa.DateTime(), nullable=True)
+        op.create_index(op.f('ix_expenses_id'), 'expenses', ['id'], unique=False)
+        return
+
+    op.execute("ALTER TABLE expenses RENAME TO expenses_partitioned")
+    op.execute("ALTER TABLE expenses_partitioned RENAME CONSTRAINT expenses_pkey TO expenses_partitioned_pkey")
+    op.execute("""
+        CREATE TABLE expenses (
+            id integer NOT NULL DEFAULT nextval('expenses_id_seq'),
+            name varchar NOT NULL,
+            amount double precision NOT NULL,
+            amount_usd double precision,
+            date timestamp without time zone,
+            CONSTRAINT expenses_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("INSERT INTO expenses (id, name, amount, amount_usd, date) "
+               "SELECT id, name, amount, amount_usd, date FROM expenses_partitioned")
+    op.execute("ALTER SEQUENCE expenses_id_seq OWNED BY expenses.id")
+    op.execute("DROP TABLE expenses_partitioned CASCADE")
+    op.execute("DROP FUNCTION IF EXISTS expenses_ensure_partitions(date, integer)")
+    op.execute("DROP FUNCTION IF EXISTS expenses_create_partition(date)")
+    op.create_index(op.f('ix_expenses_id'), 'expenses', ['id'], unique=False)
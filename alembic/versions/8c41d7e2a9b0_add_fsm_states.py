@@ -0,0 +1,34 @@
+"""Add fsm_states
+
+Revision ID: 8c41d7e2a9b0
+Revises: 3f9a1c2b7d4e
+Create Date: 2025-04-22 18:35:09.611402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41d7e2a9b0'
+down_revision: Union[str, None] = '3f9a1c2b7d4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('fsm_states',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('state', sa.String(), nullable=True),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('fsm_states')
@@ -0,0 +1,33 @@
+"""Add data_version
+
+Revision ID: a7d3e9f25c18
+Revises: f1c6a8d93b57
+Create Date: 2025-05-10 11:04:37.816204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e9f25c18'
+down_revision: Union[str, None] = 'f1c6a8d93b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    data_version = op.create_table('data_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(data_version, [{'id': 1, 'value': 0}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('data_version')
@@ -0,0 +1,74 @@
+"""Add daily and monthly expense rollups
+
+Revision ID: b71e5d0c93fa
+Revises: 8c41d7e2a9b0
+Create Date: 2025-04-24 11:02:47.318560
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71e5d0c93fa'
+down_revision: Union[str, None] = '8c41d7e2a9b0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BACKFILL = {
+    'postgresql': (
+        """
+        INSERT INTO expense_daily_totals (day, amount, amount_usd, count)
+        SELECT CAST(date AS date), sum(amount), coalesce(sum(amount_usd), 0), count(id)
+        FROM expenses GROUP BY CAST(date AS date)
+        """,
+        """
+        INSERT INTO expense_monthly_totals (month, amount, amount_usd, count)
+        SELECT CAST(date_trunc('month', day) AS date), sum(amount), sum(amount_usd), sum(count)
+        FROM expense_daily_totals GROUP BY CAST(date_trunc('month', day) AS date)
+        """,
+    ),
+    'sqlite': (
+        """
+        INSERT INTO expense_daily_totals (day, amount, amount_usd, count)
+        SELECT date(date), sum(amount), coalesce(sum(amount_usd), 0), count(id)
+        FROM expenses GROUP BY date(date)
+        """,
+        """
+        INSERT INTO expense_monthly_totals (month, amount, amount_usd, count)
+        SELECT date(day, 'start of month'), sum(amount), sum(amount_usd), sum(count)
+        FROM expense_daily_totals GROUP BY date(day, 'start of month')
+        """,
+    ),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('expense_daily_totals',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('amount_usd', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table('expense_monthly_totals',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('amount_usd', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month')
+    )
+
+    # Other backends start empty; fill them with `python rollups.py rebuild`.
+    for statement in BACKFILL.get(op.get_bind().dialect.name, ()):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('expense_monthly_totals')
+    op.drop_table('expense_daily_totals')
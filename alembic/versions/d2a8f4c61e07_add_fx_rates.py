@@ -0,0 +1,32 @@
+"""Add fx_rates
+
+Revision ID: d2a8f4c61e07
+Revises: b71e5d0c93fa
+Create Date: 2025-04-26 09:41:13.502118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8f4c61e07'
+down_revision: Union[str, None] = 'b71e5d0c93fa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('fx_rates',
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rate', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('date')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('fx_rates')
@@ -0,0 +1,79 @@
+"""Store amounts in integer minor units
+
+Revision ID: e4b9c7a15d32
+Revises: d2a8f4c61e07
+Create Date: 2025-04-28 16:20:05.874213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b9c7a15d32'
+down_revision: Union[str, None] = 'd2a8f4c61e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('expenses', 'expense_daily_totals', 'expense_monthly_totals')
+ROLLUP_BACKFILL = {
+    'postgresql': (
+        """
+        INSERT INTO expense_daily_totals (day, amount_minor, amount_usd_minor, count)
+        SELECT CAST(date AS date), sum(amount_minor), coalesce(sum(amount_usd_minor), 0), count(id)
+        FROM expenses GROUP BY CAST(date AS date)
+        """,
+        """
+        INSERT INTO expense_monthly_totals (month, amount_minor, amount_usd_minor, count)
+        SELECT CAST(date_trunc('month', day) AS date), sum(amount_minor), sum(amount_usd_minor), sum(count)
+        FROM expense_daily_totals GROUP BY CAST(date_trunc('month', day) AS date)
+        """,
+    ),
+    'sqlite': (
+        """
+        INSERT INTO expense_daily_totals (day, amount_minor, amount_usd_minor, count)
+        SELECT date(date), sum(amount_minor), coalesce(sum(amount_usd_minor), 0), count(id)
+        FROM expenses GROUP BY date(date)
+        """,
+        """
+        INSERT INTO expense_monthly_totals (month, amount_minor, amount_usd_minor, count)
+        SELECT date(day, 'start of month'), sum(amount_minor), sum(amount_usd_minor), sum(count)
+        FROM expense_daily_totals GROUP BY date(day, 'start of month')
+        """,
+    ),
+}
+
+
+def _convert(table: str, old: str, new: str, type_, expression: str) -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # One rewrite per table; on the partitioned expenses table this cascades to every partition.
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {old} TYPE {type_.compile(dialect=op.get_bind().dialect)} "
+                   f"USING {expression.format(column=old)}")
+        op.alter_column(table, old, new_column_name=new)
+        return
+
+    op.execute(f"UPDATE {table} SET {old} = {expression.format(column=old)}")
+    with op.batch_alter_table(table) as batch_op:
+        batch_op.alter_column(old, new_column_name=new, type_=type_)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        _convert(table, 'amount', 'amount_minor', sa.BigInteger(), "round({column} * 100)")
+        _convert(table, 'amount_usd', 'amount_usd_minor', sa.BigInteger(), "round({column} * 100)")
+
+    # Rollups must equal the sums of the rounded rows, not the rounded float sums.
+    op.execute("DELETE FROM expense_monthly_totals")
+    op.execute("DELETE FROM expense_daily_totals")
+    for statement in ROLLUP_BACKFILL.get(op.get_bind().dialect.name, ()):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        _convert(table, 'amount_minor', 'amount', sa.Float(), "{column} / 100.0")
+        _convert(table, 'amount_usd_minor', 'amount_usd', sa.Float(), "{column} / 100.0")
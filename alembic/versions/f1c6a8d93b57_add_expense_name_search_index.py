@@ -0,0 +1,74 @@
+"""Add expense name search index
+
+Revision ID: f1c6a8d93b57
+Revises: e4b9c7a15d32
+Create Date: 2025-05-03 16:22:48.190374
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c6a8d93b57'
+down_revision: Union[str, None] = 'e4b9c7a15d32'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger(__name__)
+
+# External-content FTS5 table over expenses.name, kept in sync by triggers; trigram MATCH is a substring test.
+SQLITE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE expenses_fts USING fts5(name, content='expenses', content_rowid='id', tokenize='trigram')",
+    """
+    CREATE TRIGGER expenses_fts_ai AFTER INSERT ON expenses BEGIN
+        INSERT INTO expenses_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER expenses_fts_ad AFTER DELETE ON expenses BEGIN
+        INSERT INTO expenses_fts(expenses_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER expenses_fts_au AFTER UPDATE OF name ON expenses BEGIN
+        INSERT INTO expenses_fts(expenses_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO expenses_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    "INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for statement in SQLITE_STATEMENTS:
+            op.execute(statement)
+        return
+    if bind.dialect.name != 'postgresql':
+        return
+
+    available = bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first()
+    if not available:
+        # Search still works without it, by scanning; downgrade and upgrade this revision once contrib is installed.
+        logger.warning("pg_trgm is not available on this server; skipping the expense name search index")
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Created on the partitioned parent, so every existing and future partition gets its own copy.
+    op.execute("CREATE INDEX IF NOT EXISTS ix_expenses_name_trgm ON expenses USING gin (name gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for trigger in ('expenses_fts_au', 'expenses_fts_ad', 'expenses_fts_ai'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS expenses_fts")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_expenses_name_trgm")
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING, AsyncIterator, Iterable, Optional, Tuple, Union
+
+import aiohttp
+
+from config import BOT_BACKEND, API_BASE_URL, API_TIMEOUT, API_MAX_CONNECTIONS, API_KEEPALIVE_TIMEOUT, API_RETRIES, API_RETRY_BACKOFF
+
+if TYPE_CHECKING:
+    from local_client import LocalExpenseClient
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {502, 503, 504}
+ETAG_CACHE_SIZE = 128
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, detail: str = '', retried: bool = False):
+        super().__init__(f"{status} {detail}".strip())
+        self.status = status
+        self.detail = detail
+        # Set when an earlier attempt of the same request may have reached the API.
+        self.retried = retried
+
+
+class NotFoundError(ApiError):
+    pass
+
+
+class HttpExpenseClient:
+    """Long-lived client for the expense API with a pooled keep-alive session."""
+
+    backend = 'http'
+
+    def __init__(self, base_url: str = API_BASE_URL, timeout: float = API_TIMEOUT,
+                 max_connections: int = API_MAX_CONNECTIONS, keepalive_timeout: float = API_KEEPALIVE_TIMEOUT,
+                 retries: int = API_RETRIES, backoff: float = API_RETRY_BACKOFF):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+        # (path, params) -> (etag, body) of the last GET, revalidated with If-None-Match.
+        self._etags: 'OrderedDict[tuple, tuple]' = OrderedDict()
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_timeout,
+                                             ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                base_url=self.base_url, connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _open(self, method: str, path: str, idempotent: bool, **kwargs) -> aiohttp.ClientResponse:
+        if self._session is None:
+            await self.start()
+
+        attempt = 0
+        while True:
+            try:
+                response = await self._session.request(method, path, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                if not idempotent or attempt >= self.retries:
+                    raise ApiError(0, str(exc), retried=attempt > 0) from exc
+                logger.warning("%s %s failed (%s), retrying", method, path, exc)
+            else:
+                if response.status < 400:
+                    return response
+
+                detail = await response.text()
+                response.release()
+                if response.status == 404:
+                    raise NotFoundError(response.status, detail, retried=attempt > 0)
+                if not idempotent or response.status not in RETRY_STATUSES or attempt >= self.retries:
+                    raise ApiError(response.status, detail, retried=attempt > 0)
+                logger.warning("%s %s returned %s, retrying", method, path, response.status)
+
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    async def _request(self, method: str, path: str, idempotent: bool = True, **kwargs):
+        key = cached = None
+        if method == 'GET':
+            key = (path, repr(kwargs.get('params')))
+            cached = self._etags.get(key)
+            if cached is not None:
+                kwargs['headers'] = {**kwargs.get('headers', {}), 'If-None-Match': cached[0]}
+
+        response = await self._open(method, path, idempotent, **kwargs)
+        async with response:
+            if response.status == 304 and cached is not None:
+                self._etags.move_to_end(key)
+                return json.loads(cached[1])
+            body = await response.text()
+
+        etag = response.headers.get('ETag')
+        if key is not None and etag:
+            self._etags[key] = (etag, body)
+            self._etags.move_to_end(key)
+            if len(self._etags) > ETAG_CACHE_SIZE:
+                self._etags.popitem(last=False)
+        return json.loads(body)
+
+    async def _stream(self, path: str, **kwargs) -> AsyncIterator[dict]:
+        response = await self._open('GET', path, True, **kwargs)
+        async with response:
+            async for line in response.content:
+                if line.strip():
+                    yield json.loads(line)
+
+    async def create_expense(self, name: str, amount: float, date: str) -> dict:
+        data = {'name': name, 'amount': amount, 'date': date}
+        return await self._request('POST', 'expense/', idempotent=False, json=data)
+
+    async def get_expense(self, expense_id: int) -> dict:
+        return await self._request('GET', f'expense/{expense_id}/')
+
+    async def update_expense(self, expense_id: int, name: str, amount: float) -> dict:
+        return await self._request('PUT', f'expense/update/{expense_id}/', json={'name': name, 'amount': amount})
+
+    async def delete_expense(self, expense_id: int) -> dict:
+        try:
+            return await self._request('DELETE', f'expense/delete/{expense_id}/')
+        except NotFoundError as exc:
+            # The first attempt deleted it but its response was lost.
+            if exc.retried:
+                return {'message': 'Expense deleted successfully'}
+            raise
+
+    async def delete_expenses(self, ids: Iterable[int] = (), ranges: Iterable[Tuple[int, int]] = ()) -> dict:
+        return await self._request('POST', 'expense/delete/', json={'ids': list(ids), 'ranges': list(ranges)})
+
+    async def period_summary(self, start_date: str, end_date: str, group_by: Iterable[str] = ()) -> dict:
+        params = [('start_date', start_date), ('end_date', end_date), *(('group_by', g) for g in group_by)]
+        return await self._request('GET', 'expense/summary/', params=params)
+
+    async def list_expenses(self, limit: int = 100, cursor: Optional[str] = None) -> dict:
+        params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+        return await self._request('GET', 'expense/all/', params=params)
+
+    async def search_expenses(self, query: str, fuzzy: bool = False, limit: int = 20) -> dict:
+        params = {'q': query, 'fuzzy': 'true' if fuzzy else 'false', 'limit': limit}
+        return await self._request('GET', 'expense/search/', params=params)
+
+    def stream_period(self, start_date: str, end_date: str) -> AsyncIterator[dict]:
+        return self._stream(f'expense/{start_date}/{end_date}/', params={'stream': 'true'})
+
+
+ExpenseClient = Union[HttpExpenseClient, 'LocalExpenseClient']
+
+
+def create_expense_client(backend: str = BOT_BACKEND) -> ExpenseClient:
+    if backend == 'local':
+        # Imported here: the local backend brings in SQLAlchemy and the service layer, which an HTTP bot never uses.
+        from local_client import LocalExpenseClient
+
+        return LocalExpenseClient()
+    if backend == 'http':
+        return HttpExpenseClient()
+    raise ValueError(f"Unknown BOT_BACKEND {backend!r}, expected 'http' or 'local'")
@@ -0,0 +1 @@
+"""Benchmarks and load tests; every script writes JSON results that `benchmarks.compare` can diff across commits."""
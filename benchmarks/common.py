@@ -0,0 +1,62 @@
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+import numpy as np
+from sqlalchemy.engine import make_url
+
+from config import DATABASE_URL
+
+
+def summarize(samples: Sequence[float], elapsed: Optional[float] = None) -> dict:
+    """Latency stats in milliseconds for ``samples`` given in seconds."""
+    if not len(samples):
+        return {'count': 0}
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    result = {
+        'count': len(ms),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+    if elapsed:
+        result['rps'] = round(len(ms) / elapsed, 2)
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision.stdout.strip() + ('-dirty' if dirty.stdout.strip() else '')
+
+
+def environment(database_url: Optional[str] = DATABASE_URL) -> dict:
+    return {
+        'commit': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'database': make_url(database_url).get_backend_name() if database_url else None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def write_results(benchmark: str, params: dict, results: dict, output: str = '-',
+                  database_url: Optional[str] = DATABASE_URL):
+    document = {'benchmark': benchmark, 'environment': environment(database_url), 'params': params,
+                'results': results}
+    text = json.dumps(document, indent=2, ensure_ascii=False)
+    if output == '-':
+        print(text)
+    else:
+        with open(output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+        print(f"Results written to {output}", file=sys.stderr)
@@ -0,0 +1,58 @@
+"""Compare two benchmark JSON files, e.g. from the base commit and from a branch.
+
+Usage: python -m benchmarks.compare BASE.json NEW.json [--threshold 10]
+
+Prints every latency/throughput figure present in both files with its relative
+change, marking changes beyond --threshold percent. Exits with status 1 when a
+latency grew or throughput fell past the threshold, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'rps')
+
+
+def flatten(results: dict, prefix: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif key in METRICS and isinstance(value, (int, float)):
+            yield f'{prefix}{key}', value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10, help="percent change to flag")
+    args = parser.parse_args()
+
+    documents = []
+    for path in (args.base, args.new):
+        with open(path, encoding='utf-8') as file:
+            documents.append(json.load(file))
+    base, new = documents
+    if base['benchmark'] != new['benchmark']:
+        raise SystemExit(f"Cannot compare {base['benchmark']!r} results with {new['benchmark']!r}")
+
+    print(f"{base['benchmark']}: {base['environment'].get('commit')} -> {new['environment'].get('commit')}")
+    new_values: Dict[str, float] = dict(flatten(new['results']))
+    regressions = 0
+    for name, old in flatten(base['results']):
+        if name not in new_values or not old:
+            continue
+        change = (new_values[name] - old) / old * 100
+        worse = -change if name.endswith('rps') else change
+        flag = ''
+        if abs(change) >= args.threshold:
+            flag = '  REGRESSION' if worse > 0 else '  improved'
+            regressions += worse > 0
+        print(f"{name:48} {old:12.3f} -> {new_values[name]:12.3f}  {change:+7.1f}%{flag}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
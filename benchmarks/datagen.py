@@ -0,0 +1,138 @@
+"""Fill `expenses` with deterministic synthetic data and rebuild the rollups.
+
+Usage: python -m benchmarks.datagen --rows 10k|1m|10m|N [--years 3] [--seed 42] [--truncate] [--create]
+
+Uses DATABASE_URL. On PostgreSQL rows are loaded with COPY after creating the
+monthly partitions they fall into; elsewhere with batched INSERTs. The same
+--rows/--years/--seed always produce the same data.
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, text
+
+from models import AsyncSessionLocal, Base, DailyTotal, Expense, MonthlyTotal, dispose_engines, get_engine
+from rollups import rebuild
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+END_DATE = date(2024, 12, 31)
+RATE = 0.024
+NAMES = [
+    'Продукти', 'Кава', 'Таксі', 'Метро', 'Обід', 'Вечеря', 'Аптека', 'Інтернет', 'Мобільний', 'Комуналка',
+    'Оренда', 'Спортзал', 'Кіно', 'Книги', 'Одяг', 'Взуття', 'Подарунок', 'Ремонт', 'Пальне', 'Парковка',
+    'Підписка', 'Ресторан', 'Піца', 'Суші', 'Фрукти', 'Овочі', "М'ясо", 'Хліб', 'Молоко', 'Сир',
+]
+COLUMNS = ('name', 'amount_minor', 'amount_usd_minor', 'date')
+
+
+def parse_rows(value: str) -> int:
+    return SIZES.get(value.lower()) or int(value)
+
+
+def start_date(years: int) -> date:
+    return END_DATE - timedelta(days=365 * years - 1)
+
+
+def generate(rows: int, years: int, seed: int, batch_size: int) -> Iterator[List[Tuple]]:
+    """Batches of (name, amount_minor, amount_usd_minor, date) tuples."""
+    rng = np.random.default_rng(seed)
+    first = datetime.combine(start_date(years), datetime.min.time())
+    days = (END_DATE - start_date(years)).days + 1
+    names = np.array(NAMES, dtype=object)
+
+    for offset in range(0, rows, batch_size):
+        size = min(batch_size, rows - offset)
+        # Log-normal amounts: mostly tens to hundreds of hryvnias with a long tail.
+        amounts = np.maximum(rng.lognormal(mean=10, sigma=1.2, size=size).astype(np.int64), 100)
+        amounts_usd = np.rint(amounts * RATE).astype(np.int64)
+        day_offsets = rng.integers(0, days, size=size)
+        picks = names[rng.integers(0, len(NAMES), size=size)]
+        yield [(name, int(amount), int(usd), first + timedelta(days=int(day)))
+               for name, amount, usd, day in zip(picks, amounts, amounts_usd, day_offsets)]
+
+
+async def _prepare(dialect: str, years: int, create: bool, truncate: bool):
+    async with get_engine().begin() as conn:
+        if create:
+            await conn.run_sync(Base.metadata.create_all)
+        if truncate:
+            if dialect == 'postgresql':
+                await conn.execute(text("TRUNCATE expenses, expense_daily_totals, expense_monthly_totals "
+                                        "RESTART IDENTITY"))
+            else:
+                for model in (Expense, DailyTotal, MonthlyTotal):
+                    await conn.execute(delete(model))
+        if dialect == 'postgresql':
+            has_partitions = (await conn.execute(text(
+                "SELECT 1 FROM pg_proc WHERE proname = 'expenses_ensure_partitions'"))).first()
+            if has_partitions:
+                await conn.execute(text("SELECT expenses_ensure_partitions(:start, :months)"),
+                                   {'start': start_date(years).replace(day=1), 'months': years * 12 + 1})
+
+
+async def _copy(batches: Iterator[List[Tuple]]) -> int:
+    loaded = 0
+    async with get_engine().begin() as conn:
+        raw = await conn.get_raw_connection()
+        for batch in batches:
+            await raw.driver_connection.copy_records_to_table('expenses', records=batch, columns=COLUMNS)
+            loaded += len(batch)
+    return loaded
+
+
+async def _insert(batches: Iterator[List[Tuple]]) -> int:
+    loaded = 0
+    async with get_engine().begin() as conn:
+        for batch in batches:
+            await conn.execute(insert(Expense), [dict(zip(COLUMNS, row)) for row in batch])
+            loaded += len(batch)
+    return loaded
+
+
+async def load(rows: int, years: int = 3, seed: int = 42, batch_size: int = 50_000, create: bool = False,
+               truncate: bool = False) -> dict:
+    dialect = get_engine().dialect.name
+    await _prepare(dialect, years, create, truncate)
+
+    started = time.perf_counter()
+    batches = generate(rows, years, seed, batch_size)
+    loaded = await (_copy(batches) if dialect == 'postgresql' else _insert(batches))
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await rebuild(db)
+    if dialect == 'postgresql':
+        async with get_engine().connect() as conn:
+            await conn.execution_options(isolation_level='AUTOCOMMIT')
+            await conn.execute(text("ANALYZE expenses"))
+    rollup_seconds = time.perf_counter() - started
+
+    return {'rows': loaded, 'load_seconds': round(load_seconds, 2), 'rollup_seconds': round(rollup_seconds, 2),
+            'rows_per_second': round(loaded / load_seconds) if load_seconds else None}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=parse_rows, default='10k')
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    parser.add_argument('--create', action='store_true', help="create missing tables from the models")
+    parser.add_argument('--truncate', action='store_true', help="remove existing expenses and rollups first")
+    args = parser.parse_args()
+
+    try:
+        result = await load(args.rows, args.years, args.seed, args.batch_size, args.create, args.truncate)
+    finally:
+        await dispose_engines()
+    print(f"Loaded {result['rows']:,} rows in {result['load_seconds']}s "
+          f"({result['rows_per_second']:,} rows/s), rollups in {result['rollup_seconds']}s")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""Stand-in FX upstream so benchmarks never depend on the real rate API.
+
+In-process benchmarks override the rate provider with StaticRateProvider. For a
+separately started API server, run this endpoint and point FX_API_URL at it:
+
+    python -m benchmarks.fx_stub --port 8099 [--rate 0.024] [--delay-ms 0]
+    FX_API_URL=http://127.0.0.1:8099/ uvicorn main:app
+"""
+import argparse
+import asyncio
+
+from aiohttp import web
+
+from config import FX_CURRENCY
+
+DEFAULT_RATE = 0.024
+
+
+class StaticRateProvider:
+    """Drop-in for ExchangeRateProvider that always returns the same rate."""
+
+    def __init__(self, rate: float = DEFAULT_RATE):
+        self.rate = rate
+
+    async def get_rate(self) -> float:
+        return self.rate
+
+    async def close(self):
+        pass
+
+
+def create_app(rate: float = DEFAULT_RATE, delay_ms: float = 0) -> web.Application:
+    async def latest(request):
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        return web.json_response({'base': 'UAH', 'rates': {FX_CURRENCY: rate}})
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', latest)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE)
+    parser.add_argument('--delay-ms', type=float, default=0, help="simulated upstream latency")
+    args = parser.parse_args()
+    web.run_app(create_app(args.rate, args.delay_ms), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
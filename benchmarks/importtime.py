@@ -0,0 +1,105 @@
+"""Measure import-time startup cost of the entry modules with ``python -X importtime``.
+
+Usage: python -m benchmarks.importtime [--repeat 5] [--top 10] [--output FILE] [MODULE ...]
+
+Imports each module (default: main, webhook, telegram, models) in a fresh
+interpreter --repeat times and reports the import time of the module itself,
+the process wall time and the heaviest packages it pulled in. Exits with status 1
+if a module loads one of the dependencies that must stay lazy (see LAZY), so a
+regression in startup work fails CI even before `benchmarks.compare` flags the
+timings.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks.common import summarize, write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('main', 'webhook', 'telegram', 'models')
+
+# Dependencies only needed by occasional work (reports, FX recompute, upstream FX fetches), per entry module.
+LAZY = {
+    'main': ('openpyxl', 'numpy', 'aiohttp', 'aiogram'),
+    'webhook': ('openpyxl', 'numpy'),
+    'telegram': ('openpyxl', 'numpy'),
+    'models': ('openpyxl', 'numpy', 'aiohttp', 'asyncpg', 'aiosqlite'),
+}
+
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)')
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, depth, cumulative microseconds) for every line of ``-X importtime`` output."""
+    entries = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            entries.append((match.group(4), (len(match.group(3)) - 1) // 2, int(match.group(2))))
+    return entries
+
+
+def measure(module: str) -> Tuple[float, float, List[Tuple[str, int, int]]]:
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))}
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if process.returncode:
+        raise SystemExit(f"import {module} failed:\n{process.stderr[-2000:]}")
+    entries = parse_importtime(process.stderr)
+    own = next((cumulative for name, depth, cumulative in entries if name == module and depth == 0), 0)
+    return own / 1e6, wall, entries
+
+
+def run(modules: List[str], repeat: int, top: int) -> Tuple[dict, Dict[str, List[str]]]:
+    results, violations = {}, {}
+    for module in modules:
+        imports, walls = [], []
+        packages: Dict[str, List[int]] = defaultdict(list)
+        loaded = set()
+        for _ in range(repeat):
+            seconds, wall, entries = measure(module)
+            imports.append(seconds)
+            walls.append(wall)
+            for name, _depth, cumulative in entries:
+                loaded.add(name)
+                if '.' not in name:
+                    packages[name].append(cumulative)
+
+        heaviest = sorted(((sum(values) / len(values), name) for name, values in packages.items()
+                           if name != module), reverse=True)[:top]
+        results[module] = {
+            'import': summarize(imports),
+            'process': summarize(walls),
+            'modules_loaded': len(loaded),
+            'heaviest_ms': {name: round(micros / 1000, 1) for micros, name in heaviest},
+        }
+        unexpected = [name for name in LAZY.get(module, ()) if name in loaded]
+        if unexpected:
+            violations[module] = unexpected
+    return results, violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=list(MODULES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="heaviest top-level packages to list")
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args()
+
+    results, violations = run(args.modules, args.repeat, args.top)
+    write_results('importtime', vars(args), results, args.output, database_url=None)
+    for module, names in violations.items():
+        print(f"{module} imports {', '.join(names)} at startup; these should load lazily", file=sys.stderr)
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == '__main__':
+    main()
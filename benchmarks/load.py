@@ -0,0 +1,134 @@
+"""Async HTTP load generator for a running API.
+
+Usage:
+    python -m benchmarks.fx_stub --port 8099 &
+    FX_API_URL=http://127.0.0.1:8099/ uvicorn main:app --port 8000 &
+    python -m benchmarks.load --url http://127.0.0.1:8000/ --concurrency 32 --duration 30 \\
+        [--mix by_id=5,page=3,period=2,summary=2,create=0] [--output FILE]
+
+Each worker keeps one request in flight and draws scenarios from the weighted
+mix with a seeded RNG. Reports p50/p95/p99 latency and requests per second,
+overall and per scenario, for requests started after the warmup. The create
+scenario is off by default; the rows it adds are named "bench: load".
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import aiohttp
+
+from benchmarks.common import summarize, write_results
+
+DEFAULT_MIX = 'by_id=5,page=3,period=2,summary=2,create=0'
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        mix[name.strip()] = int(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def _day(value: datetime) -> str:
+    return value.strftime('%d.%m.%Y')
+
+
+def _month(rng: random.Random, data: dict):
+    start = data['first'] + timedelta(days=rng.randrange(max(1, (data['last'] - data['first']).days)))
+    start = start.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return _day(start), _day(end)
+
+
+SCENARIOS = {
+    'by_id': lambda rng, data: ('GET', f"expense/{rng.choice(data['ids'])}/", {}),
+    'page': lambda rng, data: ('GET', 'expense/all/', {'params': {'limit': 100}}),
+    'period': lambda rng, data: ('GET', 'expense/{}/{}/'.format(*_month(rng, data)), {}),
+    'summary': lambda rng, data: ('GET', 'expense/summary/', {'params': [
+        ('start_date', _day(data['first'])), ('end_date', _day(data['last'])), ('group_by', 'month')]}),
+    'create': lambda rng, data: ('POST', 'expense/', {'json': {
+        'name': 'bench: load', 'amount': round(rng.uniform(1, 1000), 2), 'date': _day(data['last'])}}),
+}
+
+
+async def discover(session: aiohttp.ClientSession) -> dict:
+    async with session.get('expense/all/', params={'limit': 1000}) as response:
+        response.raise_for_status()
+        items = (await response.json())['items']
+    if not items:
+        raise SystemExit("No expenses found; load data with `python -m benchmarks.datagen` first")
+    dates = [datetime.fromisoformat(item['date']) for item in items]
+    last = max(dates)
+    return {'ids': [item['id'] for item in items], 'first': last - timedelta(days=365), 'last': last}
+
+
+async def worker(session: aiohttp.ClientSession, rng: random.Random, mix: Dict[str, int], data: dict,
+                 deadline: float, measure_from: float, samples: Dict[str, List[float]], statuses: Dict[str, int]):
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, kwargs = SCENARIOS[name](rng, data)
+        started = time.perf_counter()
+        try:
+            async with session.request(method, path, **kwargs) as response:
+                await response.read()
+                status = str(response.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            status = type(exc).__name__
+        if started >= measure_from:
+            samples[name].append(time.perf_counter() - started)
+            statuses[status] += 1
+
+
+async def run(url: str, concurrency: int, duration: float, warmup: float, mix: Dict[str, int], seed: int) -> dict:
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(base_url=url, connector=connector) as session:
+        data = await discover(session)
+        samples: Dict[str, List[float]] = defaultdict(list)
+        statuses: Dict[str, int] = defaultdict(int)
+
+        started = time.perf_counter()
+        measure_from = started + warmup
+        deadline = measure_from + duration
+        await asyncio.gather(*(
+            worker(session, random.Random(seed + i), mix, data, deadline, measure_from, samples, statuses)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - measure_from
+
+    everything = [sample for values in samples.values() for sample in values]
+    return {
+        'overall': {**summarize(everything, elapsed), 'statuses': dict(statuses)},
+        'scenarios': {name: summarize(values, elapsed) for name, values in samples.items()},
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000/')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=3, help="unmeasured seconds before the run")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args()
+
+    results = await run(args.url, args.concurrency, args.duration, args.warmup, args.mix, args.seed)
+    overall = results['overall']
+    print(f"{overall['count']} requests, {overall.get('rps', 0)} req/s, p50 {overall.get('p50_ms')}ms "
+          f"p95 {overall.get('p95_ms')}ms p99 {overall.get('p99_ms')}ms", file=sys.stderr)
+    # The server's database is not visible from here; record the URL under test instead.
+    write_results('load', vars(args), results, args.output, database_url=None)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""Compare period queries on a plain vs. a month-partitioned `expenses` copy.
+
+Usage: python -m benchmarks.partition_bench [--rows 1000000 10000000] [--years 5]
+
+Runs against DATABASE_URL (PostgreSQL only) using scratch tables that are
+dropped afterwards, so the real `expenses` table is never touched.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import DATABASE_URL
+
+PLAIN = 'bench_expenses_plain'
+PARTITIONED = 'bench_expenses_part'
+
+QUERIES = {
+    'month rows': "SELECT id, name, amount_minor, amount_usd_minor, date FROM {table} "
+                  "WHERE date BETWEEN :start AND :end",
+    'month totals': "SELECT sum(amount_minor), sum(amount_usd_minor), count(*) FROM {table} "
+                    "WHERE date BETWEEN :start AND :end",
+}
+
+
+async def create_tables(conn, rows: int, years: int):
+    columns = "id integer NOT NULL, name varchar NOT NULL, amount_minor bigint NOT NULL, " \
+              "amount_usd_minor bigint, date timestamp without time zone NOT NULL"
+    await conn.execute(text(f"CREATE TABLE {PLAIN} ({columns}, PRIMARY KEY (id))"))
+    await conn.execute(text(f"CREATE TABLE {PARTITIONED} ({columns}, PRIMARY KEY (id, date)) "
+                            f"PARTITION BY RANGE (date)"))
+    await conn.execute(text(f"""
+        DO $$
+        BEGIN
+            FOR i IN 0..{years * 12 - 1} LOOP
+                EXECUTE format('CREATE TABLE {PARTITIONED}_%s PARTITION OF {PARTITIONED} FOR VALUES FROM (%L) TO (%L)',
+                               i, date '2020-01-01' + make_interval(months => i),
+                               date '2020-01-01' + make_interval(months => i + 1));
+            END LOOP;
+        END $$
+    """))
+
+    await conn.execute(text(f"""
+        INSERT INTO {PLAIN}
+        SELECT g, 'expense ' || (g % 500), (random() * 500000)::bigint, NULL,
+               timestamp '2020-01-01' + random() * interval '{years * 365} days'
+        FROM generate_series(1, :rows) g
+    """), {'rows': rows})
+    await conn.execute(text(f"UPDATE {PLAIN} SET amount_usd_minor = round(amount_minor * 0.024)"))
+    await conn.execute(text(f"INSERT INTO {PARTITIONED} SELECT * FROM {PLAIN}"))
+
+    await conn.execute(text(f"CREATE INDEX ON {PLAIN} (date, id)"))
+    await conn.execute(text(f"CREATE INDEX ON {PARTITIONED} (date, id)"))
+    await conn.execute(text(f"ANALYZE {PLAIN}"))
+    await conn.execute(text(f"ANALYZE {PARTITIONED}"))
+
+
+async def drop_tables(conn):
+    await conn.execute(text(f"DROP TABLE IF EXISTS {PLAIN}"))
+    await conn.execute(text(f"DROP TABLE IF EXISTS {PARTITIONED}"))
+
+
+async def run_size(engine, rows: int, years: int, repeat: int):
+    print(f"\n=== {rows:,} rows ===")
+    async with engine.begin() as conn:
+        await drop_tables(conn)
+        started = time.perf_counter()
+        await create_tables(conn, rows, years)
+        print(f"load: {time.perf_counter() - started:.1f}s")
+
+    params = {'start': datetime(2022, 3, 1), 'end': datetime(2022, 3, 31)}
+    try:
+        async with engine.connect() as conn:
+            for label, sql in QUERIES.items():
+                for table in (PLAIN, PARTITIONED):
+                    query = sql.format(table=table)
+                    plan = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"), params)
+                    print(f"\n-- {label} on {table}")
+                    print('\n'.join(row[0] for row in plan))
+
+                    timings = []
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        (await conn.execute(text(query), params)).all()
+                        timings.append((time.perf_counter() - started) * 1000)
+                    timings.sort()
+                    print(f"timing: best {timings[0]:.2f}ms, median {timings[len(timings) // 2]:.2f}ms")
+    finally:
+        async with engine.begin() as conn:
+            await drop_tables(conn)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_async_engine(DATABASE_URL)
+    if engine.dialect.name != 'postgresql':
+        raise SystemExit("Partition benchmark requires a PostgreSQL DATABASE_URL")
+    try:
+        for rows in args.rows:
+            await run_size(engine, rows, args.years, args.repeat)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Benchmark the bot's XLSX report handlers end to end over the local (in-process) client.
+
+Usage: python -m benchmarks.report_bench [--repeat 5] [--output FILE]
+
+Runs telegram.generate_expense_report for the newest month and for the whole
+data range, both with every detail row, with the report cache cleared before
+each call, then the month again as a cache hit. Run `python -m benchmarks.datagen`
+first.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from benchmarks.common import summarize, write_results
+from benchmarks.fx_stub import StaticRateProvider
+from local_client import LocalExpenseClient
+from models import AsyncSessionLocal, Expense, dispose_engines
+from report_jobs import report_queue
+import telegram
+
+
+class FakeMessage:
+    """Collects what a handler would send instead of calling the Bot API."""
+
+    def __init__(self):
+        self.documents = []
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.answers.append(text)
+
+    async def answer_document(self, document, **kwargs):
+        self.documents.append(document)
+
+
+class FakeState:
+    async def clear(self):
+        pass
+
+
+async def time_report(make_call, repeat: int, before=None) -> dict:
+    samples, size = [], 0
+    for _ in range(repeat):
+        if before:
+            before()
+        message = FakeMessage()
+        started = time.perf_counter()
+        await make_call(message)
+        samples.append(time.perf_counter() - started)
+        if not message.documents:
+            raise SystemExit(f"Report produced no document: {message.answers}")
+        size = len(message.documents[-1].data)
+    return {**summarize(samples), 'xlsx_bytes': size}
+
+
+async def run(repeat: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        first, last, count = (await db.execute(select(func.min(Expense.date), func.max(Expense.date),
+                                                      func.count(Expense.id)))).one()
+    if not count:
+        raise SystemExit("No expenses found; load data with `python -m benchmarks.datagen` first")
+    first, last = [value if isinstance(value, datetime) else datetime.fromisoformat(value) for value in (first, last)]
+
+    api = LocalExpenseClient(StaticRateProvider())
+    state = FakeState()
+    periods = {'report_month': (last.replace(day=1), last), 'report_full_range': (first, last)}
+
+    results = {}
+    for name, (start, end) in periods.items():
+        results[name] = await time_report(
+            lambda message: telegram.generate_expense_report(message, start, end, state, api), repeat,
+            before=report_queue.cache.clear)
+        results[name]['period'] = [start.date().isoformat(), end.date().isoformat()]
+    start, end = periods['report_month']
+    await telegram.generate_expense_report(FakeMessage(), start, end, state, api)
+    results['report_month_cached'] = await time_report(
+        lambda message: telegram.generate_expense_report(message, start, end, state, api), repeat)
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args()
+
+    try:
+        results = await run(args.repeat)
+    finally:
+        await dispose_engines()
+        report_queue.close()
+    write_results('reports', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,179 @@
+"""Micro-benchmarks for every route in main.py, driven in-process over httpx's ASGI transport.
+
+Usage: python -m benchmarks.routes [--iterations 200] [--warmup 20] [--only NAME ...] [--output FILE]
+
+Run `python -m benchmarks.datagen` first. FX is served by StaticRateProvider.
+Cacheable GETs are measured cold (response cache cleared before each call),
+warm, and as a revalidated 304. Rows created by the write benchmarks are named
+"bench: ..." and removed, with their rollup deltas, when the run ends.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+from sqlalchemy import delete, select
+
+import main
+from benchmarks.common import summarize, write_results
+from benchmarks.fx_stub import StaticRateProvider
+from cache import data_version, response_cache
+from models import AsyncSessionLocal, Expense, dispose_engines
+from rollups import add_delta, apply_deltas, new_deltas
+
+BENCH_PREFIX = 'bench: '
+
+
+async def measure(call: Callable[[int], Awaitable[httpx.Response]], iterations: int, warmup: int,
+                  before: Callable[[], None] = None) -> dict:
+    for i in range(warmup):
+        if before:
+            before()
+        response = await call(i)
+        if response.is_error:
+            response.raise_for_status()
+
+    samples = []
+    statuses: Dict[int, int] = {}
+    for i in range(iterations):
+        if before:
+            before()
+        started = time.perf_counter()
+        response = await call(warmup + i)
+        samples.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return {**summarize(samples), 'statuses': statuses}
+
+
+async def discover(client: httpx.AsyncClient) -> dict:
+    page = (await client.get('/expense/all/', params={'limit': 1000})).json()['items']
+    if not page:
+        raise SystemExit("No expenses found; load data with `python -m benchmarks.datagen` first")
+    newest = datetime.fromisoformat(page[0]['date'])
+    month_start = newest.replace(day=1)
+    return {
+        'ids': [item['id'] for item in page],
+        'name': page[0]['name'],
+        'month': (month_start.strftime('%d.%m.%Y'), newest.strftime('%d.%m.%Y')),
+        'year': (newest.replace(month=1, day=1).strftime('%d.%m.%Y'), newest.strftime('%d.%m.%Y')),
+        'cursor': (await client.get('/expense/all/', params={'limit': 100})).json()['next_cursor'],
+    }
+
+
+def bulk_payload(rows: int, date: str) -> bytes:
+    return ''.join(json.dumps({'name': f'{BENCH_PREFIX}bulk {i}', 'amount': 10 + i % 500, 'date': date}) + '\n'
+                   for i in range(rows)).encode()
+
+
+async def consume(client: httpx.AsyncClient, path: str, **params) -> httpx.Response:
+    async with client.stream('GET', path, params={**params, 'stream': 'true'}) as response:
+        async for _ in response.aiter_raw():
+            pass
+    return response
+
+
+async def cleanup():
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(Expense.date, Expense.amount_minor, Expense.amount_usd_minor)
+                                 .where(Expense.name.startswith(BENCH_PREFIX)))).all()
+        deltas = new_deltas()
+        for row_date, amount_minor, amount_usd_minor in rows:
+            add_delta(deltas, row_date, -amount_minor, -(amount_usd_minor or 0), -1)
+        await db.execute(delete(Expense).where(Expense.name.startswith(BENCH_PREFIX)))
+        await apply_deltas(db, deltas)
+        # Cached responses and reports still include the bench rows.
+        await data_version.commit(db, changed=bool(rows))
+
+
+async def run(iterations: int, warmup: int, bulk_rows: int, only: List[str]) -> dict:
+    main.app.dependency_overrides[main.get_rate_provider] = StaticRateProvider
+    transport = httpx.ASGITransport(app=main.app)
+    results = {}
+    cold = response_cache.clear
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        data = await discover(client)
+        ids, (month_from, month_to), (year_from, year_to) = data['ids'], data['month'], data['year']
+        pick = random.Random(0)
+        created: List[int] = []
+
+        async def create(i):
+            response = await client.post('/expense/', json={'name': f'{BENCH_PREFIX}{i}', 'amount': 123.45,
+                                                            'date': month_to})
+            created.append(response.json()['expense']['id'])
+            return response
+
+        by_id_etag = (await client.get(f'/expense/{ids[0]}/')).headers['etag']
+        page_etag = (await client.get('/expense/all/')).headers['etag']
+
+        # Reads run before any write so the captured ETags are still current.
+        cases = {
+            'summary_month': (lambda i: client.get('/expense/summary/', params={
+                'start_date': month_from, 'end_date': month_to}), None),
+            'summary_year_grouped': (lambda i: client.get('/expense/summary/', params=[
+                ('start_date', year_from), ('end_date', year_to),
+                ('group_by', 'month'), ('group_by', 'week'), ('group_by', 'name')]), None),
+            'period_month_cold': (lambda i: client.get(f'/expense/{month_from}/{month_to}/'), cold),
+            'period_month_warm': (lambda i: client.get(f'/expense/{month_from}/{month_to}/'), None),
+            'period_month_stream': (lambda i: consume(client, f'/expense/{month_from}/{month_to}/'), None),
+            'all_first_page_cold': (lambda i: client.get('/expense/all/'), cold),
+            'all_first_page_warm': (lambda i: client.get('/expense/all/'), None),
+            'all_first_page_304': (lambda i: client.get('/expense/all/', headers={'If-None-Match': page_etag}), None),
+            'all_cursor_page_cold': (lambda i: client.get('/expense/all/', params={'cursor': data['cursor']}), cold),
+            'search_prefix_cold': (lambda i: client.get('/expense/search/', params={'q': data['name'][:3]}), cold),
+            'search_fuzzy_cold': (lambda i: client.get('/expense/search/', params={'q': data['name'],
+                                                                                    'fuzzy': 'true'}), cold),
+            'by_id_cold': (lambda i: client.get(f'/expense/{pick.choice(ids)}/'), cold),
+            'by_id_warm': (lambda i: client.get(f'/expense/{ids[0]}/'), None),
+            'by_id_304': (lambda i: client.get(f'/expense/{ids[0]}/', headers={'If-None-Match': by_id_etag}), None),
+            'create': (create, None),
+            'bulk_ndjson': (lambda i: client.post('/expense/bulk/', content=bulk_payload(bulk_rows, month_to),
+                                                  headers={'content-type': 'application/x-ndjson'}), None),
+            'update': (lambda i: client.put(f'/expense/update/{created[i % len(created)]}/',
+                                            json={'name': f'{BENCH_PREFIX}updated', 'amount': 99.99}), None),
+            'delete': (lambda i: client.delete(f'/expense/delete/{created.pop()}/'), None),
+            'metrics': (lambda i: client.get('/metrics'), None),
+        }
+
+        try:
+            for name, (call, before) in cases.items():
+                if only and name not in only:
+                    continue
+                rounds, warmups = iterations, warmup
+                if name == 'bulk_ndjson':
+                    rounds, warmups = max(1, iterations // 20), 1
+                if name in ('update', 'delete'):
+                    # Only touch rows this run created.
+                    while len(created) < rounds + warmups:
+                        await create(len(created))
+                results[name] = await measure(call, rounds, warmups, before)
+                print(f"{name:24} p50 {results[name].get('p50_ms', 0):8.2f}ms  "
+                      f"p95 {results[name].get('p95_ms', 0):8.2f}ms", file=sys.stderr)
+        finally:
+            await cleanup()
+    return results
+
+
+async def amain():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--bulk-rows', type=int, default=1000)
+    parser.add_argument('--only', nargs='*', default=[], help="benchmark names to run (default: all)")
+    parser.add_argument('--output', default='-')
+    args = parser.parse_args()
+
+    try:
+        results = await run(args.iterations, args.warmup, args.bulk_rows, args.only)
+    finally:
+        await dispose_engines()
+    write_results('routes', vars(args), results, args.output)
+
+
+if __name__ == '__main__':
+    asyncio.run(amain())
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import DATABASE_REPLICA_LAG, DATABASE_REPLICA_URL, DATA_VERSION_TTL, RESPONSE_CACHE_SIZE
+from metrics import CallbackMetric, registry
+from models import AsyncSessionLocal, DataVersionRow, upsert_insert
+
+DATA_VERSION_ID = 1
+
+
+class DataVersion:
+    """Counter of committed expense writes; cached reads from older versions are stale.
+
+    The counter lives in the `data_version` row, bumped in the same transaction as
+    each write, so every API worker and CLI shares it and it survives restarts.
+    ``current()`` re-reads it at most every ``ttl`` seconds, so other processes
+    notice a write within ttl; the writing process sees it at once.
+    """
+
+    def __init__(self, ttl: float = DATA_VERSION_TTL):
+        self.ttl = ttl
+        self.value = 0
+        self.changed_at = float('-inf')
+        self._checked_at = float('-inf')
+        self._inflight: Optional[asyncio.Task] = None
+
+    @staticmethod
+    async def read(db: AsyncSession) -> int:
+        result = await db.execute(select(DataVersionRow.value).where(DataVersionRow.id == DATA_VERSION_ID))
+        return result.scalar() or 0
+
+    async def current(self) -> int:
+        if time.monotonic() - self._checked_at < self.ttl:
+            return self.value
+        loop = asyncio.get_running_loop()
+        if self._inflight is None or self._inflight.done() or self._inflight.get_loop() is not loop:
+            self._inflight = loop.create_task(self._refresh())
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self) -> int:
+        started = time.monotonic()
+        async with AsyncSessionLocal() as db:
+            value = await self.read(db)
+        # A commit observed meanwhile is newer than what this read saw.
+        if self._checked_at < started:
+            self._observe(value)
+        return self.value
+
+    def _observe(self, value: int):
+        now = time.monotonic()
+        if value != self.value:
+            self.value = value
+            self.changed_at = now
+        self._checked_at = now
+
+    async def commit(self, db: AsyncSession, changed: bool = True) -> int:
+        """Commit ``db``, bumping the version inside the same transaction if ``changed``."""
+        if not changed:
+            await db.commit()
+            return self.value
+        # Last statement before the commit, so the row lock is held as briefly as possible.
+        insert_ = upsert_insert(db.bind.dialect.name)
+        if insert_ is None:
+            statement = (update(DataVersionRow).where(DataVersionRow.id == DATA_VERSION_ID)
+                         .values(value=DataVersionRow.value + 1))
+        else:
+            statement = insert_(DataVersionRow).values(id=DATA_VERSION_ID, value=1)
+            statement = statement.on_conflict_do_update(index_elements=['id'],
+                                                        set_={'value': DataVersionRow.value + 1})
+        value = (await db.execute(statement.returning(DataVersionRow.value))).scalar_one()
+        await db.commit()
+        self._observe(value)
+        return value
+
+
+@dataclass
+class CacheEntry:
+    version: int
+    body: bytes
+    etag: str
+
+
+class ResponseCache:
+    """LRU of rendered response bodies, valid only for the data version they were built from.
+
+    Bodies built within ``settle`` seconds of a write are served but not stored, so a
+    lagging read replica cannot pin pre-write data to the new version.
+    """
+
+    def __init__(self, version: DataVersion, maxsize: int = RESPONSE_CACHE_SIZE, settle: float = 0):
+        self.version = version
+        self.maxsize = maxsize
+        self.settle = settle
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[CacheEntry]:
+        """The entry for ``key`` if it was built from ``version``, the caller's ``DataVersion.current()``."""
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, version: int, body: bytes) -> CacheEntry:
+        entry = CacheEntry(version, body, '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest())
+        # A write that landed while the body was being built makes it stale on arrival.
+        if version != self.version.value or self.maxsize <= 0:
+            return entry
+        if self.settle and time.monotonic() - self.version.changed_at < self.settle:
+            return entry
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'version': self.version.value,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0,
+            'evictions': self.evictions,
+            'not_modified': self.not_modified,
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+data_version = DataVersion()
+response_cache = ResponseCache(data_version, settle=DATABASE_REPLICA_LAG if DATABASE_REPLICA_URL else 0)
+
+registry.register(CallbackMetric('response_cache_hits_total', 'Response cache hits.',
+                                 lambda: response_cache.hits, type='counter'))
+registry.register(CallbackMetric('response_cache_misses_total', 'Response cache misses.',
+                                 lambda: response_cache.misses, type='counter'))
+registry.register(CallbackMetric('response_cache_evictions_total', 'Response cache LRU evictions.',
+                                 lambda: response_cache.evictions, type='counter'))
+registry.register(CallbackMetric('response_cache_not_modified_total', '304 responses served from the cache.',
+                                 lambda: response_cache.not_modified, type='counter'))
@@ -3,4 +3,68 @@ from dotenv import load_dotenv
 
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+DATABASE_REPLICA_LAG = float(os.getenv('DATABASE_REPLICA_LAG', 1))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() in ('1', 'true', 'yes')
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))
 TOKEN = os.getenv('TOKEN')
+
+FX_API_URL = os.getenv('FX_API_URL', 'https://api.exchangerate-api.com/v4/latest/UAH')
+FX_CURRENCY = os.getenv('FX_CURRENCY', 'USD')
+FX_CACHE_TTL = float(os.getenv('FX_CACHE_TTL', 600))
+FX_STALE_TTL = float(os.getenv('FX_STALE_TTL', 3600))
+FX_TIMEOUT = float(os.getenv('FX_TIMEOUT', 5))
+FX_FALLBACK_RATE = float(os.getenv('FX_FALLBACK_RATE')) if os.getenv('FX_FALLBACK_RATE') else None
+
+SQL_SLOW_QUERY_MS = float(os.getenv('SQL_SLOW_QUERY_MS')) if os.getenv('SQL_SLOW_QUERY_MS') else None
+BOT_METRICS_PORT = int(os.getenv('BOT_METRICS_PORT')) if os.getenv('BOT_METRICS_PORT') else None
+
+# Telegram's flood limits: about 30 messages/s overall, 1/s per private chat, 20/min per group.
+BOT_SEND_GLOBAL_RATE = float(os.getenv('BOT_SEND_GLOBAL_RATE', 30))
+BOT_SEND_CHAT_RATE = float(os.getenv('BOT_SEND_CHAT_RATE', 1))
+BOT_SEND_CHAT_BURST = int(os.getenv('BOT_SEND_CHAT_BURST', 3))
+BOT_SEND_GROUP_RATE = float(os.getenv('BOT_SEND_GROUP_RATE', 20 / 60))
+BOT_SEND_MAX_RETRIES = int(os.getenv('BOT_SEND_MAX_RETRIES', 3))
+# Bot processes sending with the same token, across all hosts; each gets this share of the send rates.
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', os.getenv('WEB_CONCURRENCY', 1)))
+THROTTLE_REPORT_INTERVAL = float(os.getenv('THROTTLE_REPORT_INTERVAL', 30))
+THROTTLE_REPORT_BURST = int(os.getenv('THROTTLE_REPORT_BURST', 2))
+THROTTLE_SEARCH_INTERVAL = float(os.getenv('THROTTLE_SEARCH_INTERVAL', 2))
+THROTTLE_SEARCH_BURST = int(os.getenv('THROTTLE_SEARCH_BURST', 5))
+
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 1000))
+BULK_MAX_ERRORS = int(os.getenv('BULK_MAX_ERRORS', 100))
+BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', 1000))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 500))
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 12))
+PARTITION_ON_STARTUP = os.getenv('PARTITION_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes')
+REPORT_PROCESSES = int(os.getenv('REPORT_PROCESSES', 2))
+REPORT_QUEUE_SIZE = int(os.getenv('REPORT_QUEUE_SIZE', 16))
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', 32))
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+BOT_BACKEND = os.getenv('BOT_BACKEND', 'http')
+PICKER_PAGE_SIZE = int(os.getenv('PICKER_PAGE_SIZE', 8))
+API_BASE_URL = os.getenv('API_BASE_URL', 'http://localhost:8000/')
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', 10))
+API_MAX_CONNECTIONS = int(os.getenv('API_MAX_CONNECTIONS', 20))
+API_KEEPALIVE_TIMEOUT = float(os.getenv('API_KEEPALIVE_TIMEOUT', 30))
+API_RETRIES = int(os.getenv('API_RETRIES', 3))
+API_RETRY_BACKOFF = float(os.getenv('API_RETRY_BACKOFF', 0.5))
+
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sql')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 256))
+DATA_VERSION_TTL = float(os.getenv('DATA_VERSION_TTL', 1))
+SEARCH_SIMILARITY = float(os.getenv('SEARCH_SIMILARITY', 0.6))
+SEARCH_INDEX_TTL = float(os.getenv('SEARCH_INDEX_TTL', 60))
+
+FX_LOAD_BATCH_SIZE = int(os.getenv('FX_LOAD_BATCH_SIZE', 1000))
+FX_RECOMPUTE_BATCH_SIZE = int(os.getenv('FX_RECOMPUTE_BATCH_SIZE', 50000))
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Optional
+
+from config import FX_API_URL, FX_CURRENCY, FX_CACHE_TTL, FX_STALE_TTL, FX_TIMEOUT, FX_FALLBACK_RATE
+from metrics import fx_fetch_duration, fx_lookups
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class ExchangeRateUnavailable(Exception):
+    pass
+
+
+class ExchangeRateProvider:
+    """UAH -> FX_CURRENCY rate with a TTL cache.
+
+    Fresh values are served from memory, values younger than ttl + stale_ttl are
+    served while a background refresh runs, and concurrent misses share one fetch.
+    When the upstream is down the last known rate or ``fallback`` is used.
+    """
+
+    def __init__(self, url: str = FX_API_URL, currency: str = FX_CURRENCY, ttl: float = FX_CACHE_TTL,
+                 stale_ttl: float = FX_STALE_TTL, timeout: float = FX_TIMEOUT,
+                 fallback: Optional[float] = FX_FALLBACK_RATE):
+        self.url = url
+        self.currency = currency
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.fallback = fallback
+
+        self._session: Optional['aiohttp.ClientSession'] = None
+        self._rate: Optional[float] = None
+        self._fetched_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def get_rate(self) -> float:
+        age = time.monotonic() - self._fetched_at
+
+        if self._rate is not None and age < self.ttl:
+            fx_lookups.inc(1, 'fresh')
+            return self._rate
+
+        if self._rate is not None and age < self.ttl + self.stale_ttl:
+            fx_lookups.inc(1, 'stale')
+            self._refresh()
+            return self._rate
+
+        try:
+            rate = await asyncio.shield(self._refresh())
+            fx_lookups.inc(1, 'miss')
+            return rate
+        except Exception as exc:
+            if self._rate is not None:
+                fx_lookups.inc(1, 'last_known')
+                logger.warning("FX upstream failed (%s), using last known rate", exc)
+                return self._rate
+            if self.fallback is not None:
+                fx_lookups.inc(1, 'fallback')
+                logger.warning("FX upstream failed (%s), using fallback rate", exc)
+                return self.fallback
+            fx_lookups.inc(1, 'unavailable')
+            raise ExchangeRateUnavailable(str(exc)) from exc
+
+    def _refresh(self) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch())
+            self._inflight.add_done_callback(self._log_failure)
+        return self._inflight
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("FX refresh failed: %s", task.exception())
+
+    async def _fetch(self) -> float:
+        if self._session is None or self._session.closed:
+            # Imported on the first fetch; API workers that only use historical rates never need it.
+            import aiohttp
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            async with self._session.get(self.url) as response:
+                response.raise_for_status()
+                payload = await response.json(content_type=None)
+            outcome = 'ok'
+        finally:
+            fx_fetch_duration.observe(time.perf_counter() - start, outcome)
+
+        rate = payload.get('rates', {}).get(self.currency)
+        if rate is None:
+            raise ExchangeRateUnavailable(f"{self.currency} rate missing in upstream response")
+
+        self._rate = float(rate)
+        self._fetched_at = time.monotonic()
+        return self._rate
+
+    async def close(self):
+        if self._inflight is not None and not self._inflight.done():
+            self._inflight.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+rate_provider = ExchangeRateProvider()
+
+
+def get_rate_provider() -> ExchangeRateProvider:
+    return rate_provider
@@ -0,0 +1,68 @@
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from config import FSM_STORAGE
+from models import AsyncSessionLocal, FsmState, upsert_insert
+
+
+class SQLAlchemyStorage(BaseStorage):
+    """FSM storage kept in the `fsm_states` table, shared by every bot worker."""
+
+    def __init__(self, session_maker: sessionmaker = AsyncSessionLocal, key_builder: Optional[KeyBuilder] = None):
+        self.session_maker = session_maker
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def _upsert(self, key: StorageKey, **values):
+        values['updated_at'] = func.now()
+        row_key = self.key_builder.build(key)
+
+        async with self.session_maker() as session:
+            insert = upsert_insert(session.bind.dialect.name)
+            if insert is None:
+                await self._merge(session, row_key, values)
+            else:
+                statement = insert(FsmState).values(key=row_key, **{'data': {}, **values})
+                statement = statement.on_conflict_do_update(index_elements=[FsmState.key], set_=values)
+                await session.execute(statement)
+            await session.commit()
+
+    @staticmethod
+    async def _merge(session: AsyncSession, row_key: str, values: dict):
+        record = await session.get(FsmState, row_key) or FsmState(key=row_key, data={})
+        for name, value in values.items():
+            setattr(record, name, value)
+        session.add(record)
+
+    async def _get(self, key: StorageKey, column):
+        async with self.session_maker() as session:
+            result = await session.execute(select(column).where(FsmState.key == self.key_builder.build(key)))
+            return result.scalar_one_or_none()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._upsert(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get(key, FsmState.state)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._upsert(key, data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(await self._get(key, FsmState.data) or {})
+
+    async def close(self) -> None:
+        pass
+
+
+def create_fsm_storage(backend: str = FSM_STORAGE) -> BaseStorage:
+    if backend == 'sql':
+        return SQLAlchemyStorage()
+    if backend == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown FSM_STORAGE {backend!r}, expected 'sql' or 'memory'")
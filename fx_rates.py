@@ -0,0 +1,217 @@
+import asyncio
+import csv
+import sys
+import time
+from bisect import bisect_right
+from functools import cached_property
+from itertools import compress
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional
+
+from sqlalchemy import Date, Integer, bindparam, cast, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import FX_CACHE_TTL, FX_LOAD_BATCH_SIZE, FX_RECOMPUTE_BATCH_SIZE
+from models import AsyncSessionLocal, Expense, FxRate, dispose_engines, upsert_insert
+from rollups import rebuild
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+
+PG_UPDATE_USD = text("""
+    UPDATE expenses SET amount_usd_minor = v.amount_usd_minor
+    FROM unnest(CAST(:ids AS bigint[]), CAST(:dates AS timestamp[]), CAST(:amounts_usd AS bigint[]))
+        AS v(id, date, amount_usd_minor)
+    WHERE expenses.id = v.id AND expenses.date = v.date AND expenses.id BETWEEN :first_id AND :last_id
+""")
+EPOCH = date(1970, 1, 1)
+
+
+class HistoricalRates:
+    """Sorted in-memory copy of `fx_rates`; the rate for a day is the latest one on or before it.
+
+    Days after the last loaded rate are not covered, so callers fall back to the live rate.
+    """
+
+    def __init__(self, days: List[date], rates: List[float]):
+        self._days = days
+        self._ordinals = [day.toordinal() for day in days]
+        self._rates = rates
+        self.loaded_at = time.monotonic()
+
+    # NumPy copies are only needed by the vectorized recompute, so it is imported there rather than by every worker.
+    @cached_property
+    def days(self) -> 'np.ndarray':
+        import numpy as np
+        return np.array(self._days, dtype='datetime64[D]')
+
+    @cached_property
+    def rates(self) -> 'np.ndarray':
+        import numpy as np
+        return np.array(self._rates, dtype=np.float64)
+
+    @classmethod
+    async def load(cls, db: AsyncSession) -> 'HistoricalRates':
+        rows = (await db.execute(select(FxRate.date, FxRate.rate).order_by(FxRate.date))).all()
+        return cls([row.date for row in rows], [row.rate for row in rows])
+
+    def __len__(self):
+        return len(self._rates)
+
+    def rate_on(self, when: date) -> Optional[float]:
+        ordinal = when.toordinal()
+        if not self._ordinals or ordinal > self._ordinals[-1]:
+            return None
+        index = bisect_right(self._ordinals, ordinal) - 1
+        return self._rates[index] if index >= 0 else None
+
+    def rates_on(self, days: 'np.ndarray') -> 'np.ndarray':
+        """Vectorized `rate_on` for a datetime64[D] array; uncovered days are NaN."""
+        import numpy as np
+        if not len(self):
+            return np.full(len(days), np.nan)
+        index = np.searchsorted(self.days, days, side='right') - 1
+        rates = self.rates[np.clip(index, 0, None)]
+        return np.where((index >= 0) & (days <= self.days[-1]), rates, np.nan)
+
+
+_history: Optional[HistoricalRates] = None
+
+
+async def get_history(db: AsyncSession) -> HistoricalRates:
+    # Reloaded every FX_CACHE_TTL so processes notice a `load` run elsewhere.
+    global _history
+    if _history is None or time.monotonic() - _history.loaded_at > FX_CACHE_TTL:
+        _history = await HistoricalRates.load(db)
+    return _history
+
+
+def invalidate_history():
+    global _history
+    _history = None
+
+
+def parse_date(value: str) -> date:
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognized date {value!r}")
+
+
+def parse_rates(lines: Iterable[str]) -> Iterator[dict]:
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or not {'date', 'rate'} <= set(reader.fieldnames):
+        raise ValueError("CSV header must contain date and rate")
+    for number, row in enumerate(reader, start=2):
+        try:
+            yield {'date': parse_date(row['date']), 'rate': float(row['rate'])}
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"line {number}: {exc}") from exc
+
+
+async def _upsert_rates(db: AsyncSession, batch: List[dict]):
+    insert = upsert_insert(db.bind.dialect.name)
+    if insert is None:
+        for row in batch:
+            await db.merge(FxRate(**row))
+        return
+    statement = insert(FxRate).values(batch)
+    await db.execute(statement.on_conflict_do_update(index_elements=['date'], set_={'rate': statement.excluded.rate}))
+
+
+async def load_rates(db: AsyncSession, rows: Iterable[dict], batch_size: int = FX_LOAD_BATCH_SIZE) -> int:
+    loaded = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            await _upsert_rates(db, batch)
+            loaded += len(batch)
+            batch = []
+    if batch:
+        await _upsert_rates(db, batch)
+        loaded += len(batch)
+
+    await db.commit()
+    invalidate_history()
+    return loaded
+
+
+def _epoch_day(column, dialect: str):
+    # Days since 1970-01-01 computed by the database, so rows never become Python dates.
+    if dialect == 'sqlite':
+        return cast(func.julianday(func.date(column)) - 2440587.5, Integer)
+    return cast(column, Date) - EPOCH
+
+
+async def _update_usd(db: AsyncSession, ids: 'np.ndarray', dates: List[datetime], amounts_usd: 'np.ndarray'):
+    if db.bind.dialect.name == 'postgresql':
+        # One statement per batch; `date` keeps partition pruning and the id range keeps the join on the PK.
+        await db.execute(PG_UPDATE_USD, {
+            'ids': ids.tolist(), 'dates': dates, 'amounts_usd': amounts_usd.tolist(),
+            'first_id': int(ids[0]), 'last_id': int(ids[-1]),
+        })
+        return
+
+    table = Expense.__table__
+    statement = table.update().where(table.c.id == bindparam('b_id')).values(amount_usd_minor=bindparam('b_amount_usd'))
+    await db.execute(statement, [{'b_id': i, 'b_amount_usd': usd} for i, usd in zip(ids.tolist(), amounts_usd.tolist())])
+
+
+async def recompute_usd(db: AsyncSession, batch_size: int = FX_RECOMPUTE_BATCH_SIZE) -> int:
+    """Recompute `amount_usd_minor` from historical rates for every covered expense, then rebuild the rollups."""
+    import numpy as np
+
+    history = await HistoricalRates.load(db)
+    epoch_day = _epoch_day(Expense.date, db.bind.dialect.name)
+    connection = await db.connection()
+    updated = 0
+    last_id = 0
+
+    while True:
+        query = (
+            select(Expense.id, Expense.date, Expense.amount_minor, epoch_day)
+            .where(Expense.id > last_id)
+            .order_by(Expense.id)
+            .limit(batch_size)
+        )
+        rows = (await connection.execute(query)).all()
+        if not rows:
+            break
+        ids, dates, amounts, days = zip(*rows)
+        last_id = ids[-1]
+
+        ids = np.array(ids, dtype=np.int64)
+        days = np.array(days, dtype=np.int64).astype('datetime64[D]')
+        # np.rint rounds half to even, like money.convert.
+        amounts_usd = np.rint(np.array(amounts, dtype=np.int64) * history.rates_on(days))
+        covered = ~np.isnan(amounts_usd)
+        if covered.any():
+            await _update_usd(db, ids[covered], list(compress(dates, covered)), amounts_usd[covered].astype(np.int64))
+            updated += int(covered.sum())
+
+    # Commits the USD updates together with the rebuilt rollups and the data version bump.
+    await rebuild(db)
+    return updated
+
+
+async def _main(argv: List[str]):
+    try:
+        async with AsyncSessionLocal() as db:
+            if len(argv) == 2 and argv[0] == 'load':
+                with open(argv[1], newline='', encoding='utf-8-sig') as file:
+                    print(f"Loaded {await load_rates(db, parse_rates(file))} rates")
+            elif argv == ['recompute']:
+                print(f"Recomputed amount_usd for {await recompute_usd(db)} expenses")
+            else:
+                raise SystemExit("usage: python fx_rates.py load RATES.csv | recompute")
+    finally:
+        await dispose_engines()
+
+
+if __name__ == '__main__':
+    asyncio.run(_main(sys.argv[1:]))
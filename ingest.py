@@ -0,0 +1,173 @@
+import csv
+import json
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import data_version
+from config import BULK_MAX_ERRORS
+from exchange import ExchangeRateProvider
+from fx_rates import get_history
+from models import Expense
+from money import convert
+from rollups import add_delta, apply_deltas, new_deltas
+from schemas import ExpenseCreate
+
+CSV_FIELDS = ('name', 'amount', 'date')
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8-sig').rstrip('\r')
+    if buffer:
+        yield buffer.decode('utf-8-sig').rstrip('\r')
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    body = b''.join([chunk async for chunk in chunks])
+    items = json.loads(body)
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array of expenses")
+    for number, item in enumerate(items, start=1):
+        yield number, item
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    number = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, exc
+
+
+class _NeedMoreLines(Exception):
+    pass
+
+
+class _LineFeed:
+    """Iterator for csv.reader over the lines pushed so far; running dry means the record goes on."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise _NeedMoreLines
+        return self.lines.popleft()
+
+
+async def iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    header = None
+    number = 0
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    # Physical lines of the record being read; a quoted field may hold newlines, so a record
+    # the reader could not finish is fed again with the next line.
+    record = []
+    async for line in iter_lines(chunks):
+        if not record and not line.strip():
+            continue
+        record.append(line + '\n')
+        feed.lines.extend(record)
+        try:
+            values = next(reader)
+        except _NeedMoreLines:
+            continue
+        record = []
+        if header is None:
+            header = [value.strip().lower() for value in values]
+            missing = set(CSV_FIELDS) - set(header)
+            if missing:
+                raise ValueError(f"CSV header is missing columns: {', '.join(sorted(missing))}")
+            continue
+        number += 1
+        yield number, dict(zip(header, values))
+
+    if record:
+        if header is None:
+            raise ValueError("CSV header has an unterminated quoted field")
+        yield number + 1, ValueError("Unterminated quoted field")
+
+
+def iter_rows(content_type: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonlines'):
+        return iter_ndjson(chunks)
+    if content_type in ('text/csv', 'application/csv'):
+        return iter_csv(chunks)
+    return iter_json_array(chunks)
+
+
+def parse_row(raw: object) -> dict:
+    if isinstance(raw, Exception):
+        raise raw
+    ex = ExpenseCreate.model_validate(raw)
+    return {'name': ex.name, 'amount_minor': ex.amount_minor, 'date': datetime.strptime(ex.date, '%d.%m.%Y')}
+
+
+def _error_message(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return '; '.join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in exc.errors())
+    return str(exc)
+
+
+async def _flush(db: AsyncSession, batch: list, provider: ExchangeRateProvider):
+    history = await get_history(db)
+    live_rate = None
+    deltas = new_deltas()
+    for row in batch:
+        exch_rate = history.rate_on(row['date'])
+        if exch_rate is None:
+            # Only rows past the local history need the live rate, fetched once per batch.
+            if live_rate is None:
+                live_rate = await provider.get_rate()
+            exch_rate = live_rate
+        row['amount_usd_minor'] = convert(row['amount_minor'], exch_rate)
+        add_delta(deltas, row['date'], row['amount_minor'], row['amount_usd_minor'], 1)
+    await db.execute(insert(Expense), batch)
+    await apply_deltas(db, deltas)
+
+
+async def ingest_expenses(db: AsyncSession, rows: AsyncIterator[Tuple[int, object]],
+                          provider: ExchangeRateProvider, batch_size: int) -> dict:
+    inserted = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    async for number, raw in rows:
+        try:
+            batch.append(parse_row(raw))
+        except (ValidationError, ValueError, TypeError) as exc:
+            failed += 1
+            if len(errors) < BULK_MAX_ERRORS:
+                errors.append({'row': number, 'error': _error_message(exc)})
+            continue
+
+        if len(batch) >= batch_size:
+            await _flush(db, batch, provider)
+            inserted += len(batch)
+            batch = []
+
+    if batch:
+        await _flush(db, batch, provider)
+        inserted += len(batch)
+
+    await data_version.commit(db, changed=bool(inserted))
+    # Only the first BULK_MAX_ERRORS failures are listed; errors_truncated counts the rest.
+    return {'inserted': inserted, 'failed': failed, 'errors': errors, 'errors_truncated': failed - len(errors)}
@@ -0,0 +1,96 @@
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+import services
+from api_client import ApiError, NotFoundError
+from exchange import ExchangeRateProvider, ExchangeRateUnavailable, get_rate_provider
+from models import AsyncSessionLocal, ReadSessionLocal
+from schemas import ExpenseCreate, ExpenseUpdate
+
+
+class LocalExpenseClient:
+    """Same interface as HttpExpenseClient, served by the service layer in this process.
+
+    The rate provider is shared, so it is closed by whoever owns the process (see telegram.on_shutdown).
+    """
+
+    backend = 'local'
+
+    def __init__(self, provider: Optional[ExchangeRateProvider] = None):
+        self.provider = provider or get_rate_provider()
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def create_expense(self, name: str, amount: float, date: str) -> dict:
+        ex = ExpenseCreate(name=name, amount=amount, date=date)
+        async with AsyncSessionLocal() as db:
+            try:
+                expense = await services.create_expense(db, ex, self.provider)
+            except ExchangeRateUnavailable as exc:
+                raise ApiError(503, str(exc)) from exc
+        return {'message': 'Expense created successfully', 'expense': services.expense_to_dict(expense)}
+
+    async def get_expense(self, expense_id: int) -> dict:
+        async with ReadSessionLocal() as db:
+            try:
+                return services.expense_to_dict(await services.get_expense(db, expense_id))
+            except services.ExpenseNotFound:
+                raise NotFoundError(404, "Expense not found")
+
+    async def update_expense(self, expense_id: int, name: str, amount: float) -> dict:
+        async with AsyncSessionLocal() as db:
+            try:
+                expense = await services.update_expense(db, expense_id, ExpenseUpdate(name=name, amount=amount),
+                                                        self.provider)
+            except services.ExpenseNotFound:
+                raise NotFoundError(404, "Expense not found")
+            except ExchangeRateUnavailable as exc:
+                raise ApiError(503, str(exc)) from exc
+        return {'message': 'Expense updated successfully', 'updated_expense': services.row_to_dict(expense)}
+
+    async def delete_expense(self, expense_id: int) -> dict:
+        async with AsyncSessionLocal() as db:
+            try:
+                await services.delete_expense(db, expense_id)
+            except services.ExpenseNotFound:
+                raise NotFoundError(404, "Expense not found")
+        return {'message': 'Expense deleted successfully'}
+
+    async def delete_expenses(self, ids: Iterable[int] = (), ranges: Iterable[Tuple[int, int]] = ()) -> dict:
+        async with AsyncSessionLocal() as db:
+            deleted = await services.delete_expenses(db, list(ids), list(ranges))
+        return {'message': 'Expenses deleted successfully', 'deleted': deleted}
+
+    async def period_summary(self, start_date: str, end_date: str, group_by: Iterable[str] = ()) -> dict:
+        start, end = datetime.strptime(start_date, '%d.%m.%Y'), datetime.strptime(end_date, '%d.%m.%Y')
+        async with ReadSessionLocal() as db:
+            return await services.period_summary(db, start, end, dict.fromkeys(group_by))
+
+    async def list_expenses(self, limit: int = 100, cursor: Optional[str] = None) -> dict:
+        async with ReadSessionLocal() as db:
+            try:
+                rows, next_cursor = await services.list_page(db, limit, cursor)
+            except ValueError as exc:
+                raise ApiError(400, str(exc)) from exc
+        return {'items': [services.row_to_dict(row) for row in rows], 'next_cursor': next_cursor}
+
+    async def search_expenses(self, query: str, fuzzy: bool = False, limit: int = 20) -> dict:
+        async with ReadSessionLocal() as db:
+            rows, next_cursor = await services.search_expenses(db, query, fuzzy, limit)
+        return {'items': [services.row_to_dict(row) for row in rows], 'next_cursor': next_cursor}
+
+    @staticmethod
+    async def _dicts(partitions) -> AsyncIterator[dict]:
+        async with aclosing(partitions):
+            async for partition in partitions:
+                for row in partition:
+                    yield services.row_to_dict(row)
+
+    def stream_period(self, start_date: str, end_date: str) -> AsyncIterator[dict]:
+        start, end = datetime.strptime(start_date, '%d.%m.%Y'), datetime.strptime(end_date, '%d.%m.%Y')
+        return self._dicts(services.stream_period(start, end))
@@ -1,118 +1,227 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Query, Request, status
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+import orjson
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import Expense, AsyncSessionLocal
-import requests
+from models import AsyncSessionLocal, ReadSessionLocal, dispose_engines
+from cache import data_version, etag_matches, response_cache
+from metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from config import BULK_BATCH_SIZE, PARTITION_ON_STARTUP
+from exchange import ExchangeRateProvider, ExchangeRateUnavailable, get_rate_provider
 from datetime import datetime
-from pydantic import BaseModel
-from sqlalchemy.future import select
+from ingest import ingest_expenses, iter_rows
+from partitions import ensure_partitions
+from schemas import (ExpenseBatchUpdate, ExpenseCreate, ExpenseCreated, ExpenseOut, ExpensePage, ExpenseSelection,
+                     ExpensesDeleted, ExpensesUpdated, ExpenseUpdate, ExpenseUpdated, Message)
+import services
 
-app = FastAPI()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A failure here stops startup; set PARTITION_ON_STARTUP=false and run `python partitions.py` from
+    # deploys or cron instead when the API's database user may not create tables.
+    if PARTITION_ON_STARTUP:
+        await ensure_partitions()
+    yield
+    await get_rate_provider().close()
+    await dispose_engines()
 
-class ExpenseCreate(BaseModel):
-    name: str
-    amount: float
-    date: str
 
+router = APIRouter()
 
-class ExpenseUpdate(BaseModel):
-    name: str
-    amount: float
 
+READ_METHODS = {'GET', 'HEAD'}
 
-async def get_bd_session() -> AsyncSession:
-    async with AsyncSessionLocal() as session:
+
+async def get_bd_session(request: Request) -> AsyncSession:
+    # Read-only routes go to the replica (if configured); anything that writes uses the primary.
+    session_maker = ReadSessionLocal if request.method in READ_METHODS else AsyncSessionLocal
+    async with session_maker() as session:
         yield session
 
 
-@app.post('/expense/', status_code=status.HTTP_201_CREATED)
-async def create_expense(ex: ExpenseCreate, db: AsyncSession = Depends(get_bd_session)):
-    exch_rate = requests.get(url="https://api.exchangerate-api.com/v4/latest/UAH")
+async def cached_json(request: Request, key, produce) -> Response:
+    version = await data_version.current()
+    entry = response_cache.get(key, version)
+    if entry is None:
+        entry = response_cache.put(key, version, orjson.dumps(await produce()))
 
-    if exch_rate.status_code == 200:
-        exch_rate = exch_rate.json().get('rates', {}).get("USD", 1)
+    headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('if-none-match'), entry.etag):
+        response_cache.not_modified += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry.body, media_type='application/json', headers=headers)
 
-        amount_usd = ex.amount * exch_rate
 
-        date_obj = datetime.strptime(ex.date, '%d.%m.%Y')
-        expense = Expense(name=ex.name, amount=ex.amount, amount_usd=amount_usd, date=date_obj)
+async def ndjson_lines(partitions):
+    async for partition in partitions:
+        yield b''.join(orjson.dumps(services.row_to_dict(row)) + b'\n' for row in partition)
+
+
+@router.post('/expense/', status_code=status.HTTP_201_CREATED, response_model=ExpenseCreated)
+async def create_expense(ex: ExpenseCreate, db: AsyncSession = Depends(get_bd_session),
+                         provider: ExchangeRateProvider = Depends(get_rate_provider)):
+    try:
+        expense = await services.create_expense(db, ex, provider)
+    except ExchangeRateUnavailable:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Exchange rate unavailable")
+    return ExpenseCreated(message='Expense created successfully', expense=expense)
 
-        async with db:
-            db.add(expense)
-            await db.commit()
-            await db.refresh(expense)
-        return {'message': 'Expense created successfully', 'expense': expense}
 
+@router.post('/expense/bulk/', status_code=status.HTTP_201_CREATED)
+async def bulk_create_expenses(request: Request, db: AsyncSession = Depends(get_bd_session),
+                               provider: ExchangeRateProvider = Depends(get_rate_provider)):
+    rows = iter_rows(request.headers.get('content-type', ''), request.stream())
+    try:
+        return await ingest_expenses(db, rows, provider, BULK_BATCH_SIZE)
+    except ExchangeRateUnavailable:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Exchange rate unavailable")
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
 
-@app.get('/expense/{start_date}/{end_date}/')
-async def get_period_expenses(start_date: str, end_date: str, db: AsyncSession = Depends(get_bd_session)):
-    start_date = datetime.strptime(start_date, "%d.%m.%Y")
-    end_date = datetime.strptime(end_date, "%d.%m.%Y")
 
-    query = select(Expense).where(Expense.date.between(start_date, end_date))
-    result = await db.execute(query)
-    expenses = result.scalars().all()
-    if not expenses:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    return expenses
+@router.get('/expense/summary/')
+async def get_expense_summary(start_date: str, end_date: str,
+                              group_by: List[Literal['day', 'week', 'month', 'name']] = Query([]),
+                              db: AsyncSession = Depends(get_bd_session)):
+    try:
+        start = datetime.strptime(start_date, "%d.%m.%Y")
+        end = datetime.strptime(end_date, "%d.%m.%Y")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Dates must be in DD.MM.YYYY format")
 
+    return await services.period_summary(db, start, end, dict.fromkeys(group_by))
 
-@app.get('/expense/all/')
-async def get_period_expenses(db: AsyncSession = Depends(get_bd_session)):
-    query = select(Expense)
-    result = await db.execute(query)
-    expenses = result.scalars().all()
-    if not expenses:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    return expenses
 
+@router.get('/expense/search/', response_model=ExpensePage)
+async def search_expenses(request: Request, q: str = Query(..., max_length=100), fuzzy: bool = False,
+                          limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None,
+                          db: AsyncSession = Depends(get_bd_session)):
+    if not q.strip():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Search query must not be empty")
 
-@app.get('/expense/{expense_id}/')
-async def get_expense_by_id(expense_id: int, db: AsyncSession = Depends(get_bd_session)):
-    query = select(Expense).where(Expense.id == expense_id)
-    result = await db.execute(query)
-    expense = result.scalars().first()
+    async def produce():
+        try:
+            rows, next_cursor = await services.search_expenses(db, q, fuzzy, limit, cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        return {'items': [services.row_to_dict(row) for row in rows], 'next_cursor': next_cursor}
+
+    return await cached_json(request, ('search', q.strip(), fuzzy, limit, cursor), produce)
+
+
+@router.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+@router.get('/cache/stats/')
+async def get_cache_stats():
+    return response_cache.stats()
 
-    if not expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
 
-    return expense
+@router.get('/expense/{start_date}/{end_date}/', response_model=List[ExpenseOut])
+async def get_period_expenses(request: Request, start_date: str, end_date: str, stream: bool = False,
+                              db: AsyncSession = Depends(get_bd_session)):
+    try:
+        start_date = datetime.strptime(start_date, "%d.%m.%Y")
+        end_date = datetime.strptime(end_date, "%d.%m.%Y")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Dates must be in DD.MM.YYYY format")
 
+    if stream:
+        return StreamingResponse(ndjson_lines(services.stream_period(start_date, end_date)),
+                                 media_type='application/x-ndjson')
 
-@app.put('/expense/update/{expense_id}/')
-async def update_expense(expense_id: int, update_data: ExpenseUpdate, db: AsyncSession = Depends(get_bd_session)):
-    query = select(Expense).where(Expense.id == expense_id)
-    result = await db.execute(query)
-    expense = result.scalars().first()
+    async def produce():
+        rows = await services.list_period(db, start_date, end_date)
+        if not rows:
+            raise HTTPException(status_code=404, detail="Expense not found")
+        return [services.row_to_dict(row) for row in rows]
 
-    if not expense:
+    return await cached_json(request, ('period', start_date, end_date), produce)
+
+
+@router.get('/expense/all/', response_model=ExpensePage)
+async def get_all_expenses(request: Request, limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                           stream: bool = False, db: AsyncSession = Depends(get_bd_session)):
+    if stream:
+        # The all-expenses export: NDJSON read through a server-side cursor in STREAM_CHUNK_SIZE batches and
+        # written as it goes, so neither the API nor the client holds the whole table.
+        return StreamingResponse(ndjson_lines(services.stream_all()), media_type='application/x-ndjson')
+
+    async def produce():
+        try:
+            rows, next_cursor = await services.list_page(db, limit, cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        return {'items': [services.row_to_dict(row) for row in rows], 'next_cursor': next_cursor}
+
+    return await cached_json(request, ('all', limit, cursor), produce)
+
+
+@router.get('/expense/{expense_id}/', response_model=ExpenseOut)
+async def get_expense_by_id(request: Request, expense_id: int, db: AsyncSession = Depends(get_bd_session)):
+    async def produce():
+        try:
+            return services.expense_to_dict(await services.get_expense(db, expense_id))
+        except services.ExpenseNotFound:
+            raise HTTPException(status_code=404, detail="Expense not found")
+
+    return await cached_json(request, ('expense', expense_id), produce)
+
+
+@router.put('/expense/update/{expense_id}/', response_model=ExpenseUpdated)
+async def update_expense(expense_id: int, update_data: ExpenseUpdate, db: AsyncSession = Depends(get_bd_session),
+                         provider: ExchangeRateProvider = Depends(get_rate_provider)):
+    try:
+        row = await services.update_expense(db, expense_id, update_data, provider)
+    except services.ExpenseNotFound:
         raise HTTPException(status_code=404, detail="Expense not found")
-    exch_rate = requests.get(url="https://api.exchangerate-api.com/v4/latest/UAH")
+    except ExchangeRateUnavailable:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Exchange rate unavailable")
 
-    if exch_rate.status_code == 200:
-        exch_rate = exch_rate.json().get('rates', {}).get("USD", 1)
+    return ExpenseUpdated(message="Expense updated successfully", updated_expense=services.row_to_dict(row))
 
-        amount_usd = update_data.amount * exch_rate
-    expense.name = update_data.name
-    expense.amount = update_data.amount
-    expense.amount_usd = amount_usd
 
-    await db.commit()
-    await db.refresh(expense)
+@router.put('/expense/update/', response_model=ExpensesUpdated)
+async def update_expenses(batch: ExpenseBatchUpdate, db: AsyncSession = Depends(get_bd_session),
+                          provider: ExchangeRateProvider = Depends(get_rate_provider)):
+    updates = {item.id: item for item in batch.items}
+    try:
+        rows = await services.update_expenses(db, updates, provider)
+    except ExchangeRateUnavailable:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Exchange rate unavailable")
 
-    return {"message": "Expense updated successfully", "updated_expense": expense}
+    updated = [services.row_to_dict(row) for row in rows]
+    found = {row['id'] for row in updated}
+    return {"message": "Expenses updated successfully", "updated": updated,
+            "not_found": [expense_id for expense_id in updates if expense_id not in found]}
 
 
-@app.delete('/expense/delete/{expense_id}/')
+@router.delete('/expense/delete/{expense_id}/', response_model=Message)
 async def delete_expense(expense_id: int, db: AsyncSession = Depends(get_bd_session)):
-    query = select(Expense).where(Expense.id == expense_id)
-    result = await db.execute(query)
-    expense = result.scalars().first()
-
-    if not expense:
+    try:
+        await services.delete_expense(db, expense_id)
+    except services.ExpenseNotFound:
         raise HTTPException(status_code=404, detail="Expense not found")
 
-    await db.delete(expense)
-    await db.commit()
-
     return {"message": "Expense deleted successfully"}
+
+
+@router.post('/expense/delete/', response_model=ExpensesDeleted)
+async def delete_expenses(selection: ExpenseSelection, db: AsyncSession = Depends(get_bd_session)):
+    deleted = await services.delete_expenses(db, selection.ids, selection.ranges)
+    return {"message": "Expenses deleted successfully", "deleted": deleted}
+
+
+def create_app() -> FastAPI:
+    """API app; the database engines are created on first use and disposed in its lifespan."""
+    app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
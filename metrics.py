@@ -0,0 +1,232 @@
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import SQL_SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('sql.slow')
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labelvalues):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        for labelvalues, value in self._values.items():
+            yield f'{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        # labelvalues -> [per-bucket counts..., sum, count]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labelvalues):
+        series = self._values.get(labelvalues)
+        if series is None:
+            series = self._values[labelvalues] = [0] * len(self.buckets) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        for labelvalues, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                yield f'{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(series[-2])}'
+            yield f'{self.name}_count{_labels(self.labelnames, labelvalues)} {series[-1]}'
+
+
+class CallbackMetric(Metric):
+    """Single value read from a callback at scrape time, for state another object already tracks."""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float], type: str = 'gauge'):
+        super().__init__(name, documentation)
+        self.read = read
+        self.type = type
+
+    def samples(self):
+        yield f'{self.name} {_number(self.read())}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            try:
+                lines.extend(metric.samples())
+            except Exception:
+                logger.exception("Failed to collect %s", metric.name)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route.', ('method', 'route', 'status')))
+db_query_duration = registry.register(Histogram(
+    'db_query_duration_seconds', 'SQL statement execution time.', ('operation',)))
+db_pool_wait = registry.register(Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled DB connection.',
+    buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 5, 30)))
+fx_fetch_duration = registry.register(Histogram(
+    'fx_fetch_duration_seconds', 'Upstream FX rate fetch latency.', ('outcome',)))
+fx_lookups = registry.register(Counter(
+    'fx_rate_lookups_total', 'FX rate lookups by how they were served.', ('result',)))
+bot_handler_duration = registry.register(Histogram(
+    'bot_handler_duration_seconds', 'Bot handler latency.', ('event', 'handler', 'outcome')))
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine, slow_query_ms=SQL_SLOW_QUERY_MS):
+    """Time every statement on ``engine``; log those slower than ``slow_query_ms`` if it is set."""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        db_query_duration.observe(elapsed, statement.lstrip().split(None, 1)[0].upper() if statement else '')
+        if slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+            slow_query_logger.warning("%.1f ms%s: %s", elapsed * 1000, ' (executemany)' if executemany else '',
+                                      ' '.join(statement.split())[:1000])
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def _error(context):
+        starts = context.connection.info.get('query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request under its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            http_request_duration.observe(time.perf_counter() - start, scope['method'],
+                                          getattr(route, 'path', 'unmatched'), status)
+
+
+class HandlerMetricsMiddleware:
+    """aiogram inner middleware timing each handler call."""
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Any,
+                      data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await handler(event, data)
+            outcome = 'ok'
+            return result
+        finally:
+            bot_handler_duration.observe(time.perf_counter() - start, type(event).__name__, name, outcome)
+
+
+async def start_metrics_server(port: int, host: str = '0.0.0.0'):
+    """Serve ``registry`` on its own port, for processes without an HTTP app (the polling bot)."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=registry.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
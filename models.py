@@ -1,18 +1,165 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from typing import Callable, Dict
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, Float, DateTime, func
-from config import DATABASE_URL
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, Index, JSON, event, func
+from config import (DATABASE_URL, DATABASE_REPLICA_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE)
+from metrics import CallbackMetric, TimedQueuePool, instrument_engine, registry
+from money import from_minor
 
 Base = declarative_base()
 
-engine = create_async_engine(DATABASE_URL, future=True, echo=True)
-AsyncSessionLocal  = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+def make_engine(url: str) -> AsyncEngine:
+    """Instrumented engine for ``url`` with the pool configured from the DB_* settings."""
+    connect_args = {}
+    if make_url(url).get_driver_name() == 'asyncpg':
+        # Both asyncpg's own cache and SQLAlchemy's prepared-statement cache; set 0 behind PgBouncer.
+        connect_args = {'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+                        'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE}
+    db_engine = create_async_engine(
+        url, future=True, poolclass=TimedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    instrument_engine(db_engine)
+    if db_engine.dialect.name == 'sqlite':
+        # Imported here: search imports models.
+        from search import install_sqlite_functions
+        event.listen(db_engine.sync_engine, 'connect', install_sqlite_functions)
+    return db_engine
+
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker that binds to the engine from ``get_bind`` when the first session is made."""
+
+    def __init__(self, get_bind: Callable[[], AsyncEngine], **kw):
+        super().__init__(**kw)
+        self._get_bind = get_bind
+
+    def __call__(self, **local_kw):
+        if self.kw.get('bind') is None:
+            self.configure(bind=self._get_bind())
+        return super().__call__(**local_kw)
+
+
+# Engines are built on first use rather than at import, so importing models (Alembic, scripts, workers
+# that never query) does not load the DB driver or size a pool.
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def get_engine() -> AsyncEngine:
+    if 'primary' not in _engines:
+        _engines['primary'] = make_engine(DATABASE_URL)
+    return _engines['primary']
+
+
+def get_read_engine() -> AsyncEngine:
+    """Engine for read-only routes and reports: the replica when one is configured, the primary otherwise."""
+    if not DATABASE_REPLICA_URL:
+        return get_engine()
+    if 'replica' not in _engines:
+        _engines['replica'] = make_engine(DATABASE_REPLICA_URL)
+    return _engines['replica']
+
+
+async def dispose_engines():
+    for db_engine in _engines.values():
+        await db_engine.dispose()
+
+
+def _checked_out(name: str) -> int:
+    db_engine = _engines.get(name)
+    return db_engine.pool.checkedout() if db_engine is not None else 0
+
+
+AsyncSessionLocal = LazySessionmaker(get_engine, class_=AsyncSession, expire_on_commit=False)
+ReadSessionLocal = LazySessionmaker(get_read_engine, class_=AsyncSession, expire_on_commit=False)
+
+registry.register(CallbackMetric('db_pool_checked_out', 'Connections currently checked out of the pool.',
+                                 lambda: _checked_out('primary')))
+if DATABASE_REPLICA_URL:
+    registry.register(CallbackMetric('db_replica_pool_checked_out',
+                                     'Connections currently checked out of the replica pool.',
+                                     lambda: _checked_out('replica')))
+
+
+def upsert_insert(dialect_name: str):
+    """Dialect `insert` supporting ON CONFLICT, or None if the backend has none."""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
 
 class Expense(Base):
     __tablename__ = "expenses"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # On PostgreSQL the table is partitioned by date, so its primary key is (id, date): every unique
+    # constraint there must include the partition key. The model maps id alone on purpose. The
+    # sequence keeps ids unique by themselves, lookups by id stay single-column, and on SQLite id
+    # must be the rowid to autoincrement, which a composite key would prevent.
+    id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
-    amount_usd = Column(Float, nullable=True)
-    date = Column(DateTime, default=func.now())
+    amount_minor = Column(BigInteger, nullable=False)
+    amount_usd_minor = Column(BigInteger, nullable=True)
+    date = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        Index('ix_expenses_date_id', 'date', 'id'),
+    )
+
+    @property
+    def amount(self):
+        return from_minor(self.amount_minor)
+
+    @property
+    def amount_usd(self):
+        return from_minor(self.amount_usd_minor)
+
+
+class DailyTotal(Base):
+    __tablename__ = "expense_daily_totals"
+
+    day = Column(Date, primary_key=True)
+    amount_minor = Column(BigInteger, nullable=False, default=0)
+    amount_usd_minor = Column(BigInteger, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class MonthlyTotal(Base):
+    __tablename__ = "expense_monthly_totals"
+
+    month = Column(Date, primary_key=True)
+    amount_minor = Column(BigInteger, nullable=False, default=0)
+    amount_usd_minor = Column(BigInteger, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class FxRate(Base):
+    __tablename__ = "fx_rates"
+
+    date = Column(Date, primary_key=True)
+    rate = Column(Float, nullable=False)
+
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSON, nullable=False, default=dict)
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
+
+
+class DataVersionRow(Base):
+    """Single row counting committed expense writes; see cache.DataVersion."""
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
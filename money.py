@@ -0,0 +1,20 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Optional
+
+# Amounts are stored as integer minor units: kopecks for UAH, cents for USD.
+MINOR_UNITS = 100
+
+
+def to_minor(value) -> int:
+    """12.34 -> 1234, rounding half to even."""
+    return int((Decimal(str(value)) * MINOR_UNITS).to_integral_value(ROUND_HALF_EVEN))
+
+
+def from_minor(value: Optional[int]) -> Optional[float]:
+    # int() also covers PostgreSQL's numeric sum(bigint), which arrives as Decimal.
+    return None if value is None else int(value) / MINOR_UNITS
+
+
+def convert(amount_minor: int, rate: float) -> int:
+    # Same half-to-even rounding as numpy.rint in the vectorized recompute.
+    return round(amount_minor * rate)
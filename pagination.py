@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
+
+from models import Expense
+
+# Cursors from before microseconds were kept; still accepted so stored picker pages keep working.
+LEGACY_CURSOR_DATE_FORMAT = '%Y%m%d%H%M%S'
+
+
+def encode_cursor(date: datetime, expense_id: int) -> str:
+    # Full precision: rows dated by now() differ below the second, and a truncated date skips or repeats them.
+    return f"{date.isoformat()}_{expense_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        date_part, id_part = cursor.split('_', 1)
+        if date_part.isdigit():
+            return datetime.strptime(date_part, LEGACY_CURSOR_DATE_FORMAT), int(id_part)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def newest_first(query, cursor: Optional[str] = None):
+    """Order expenses by (date, id) descending, starting after ``cursor``."""
+    query = query.order_by(Expense.date.desc(), Expense.id.desc())
+    if cursor:
+        query = query.where(tuple_(Expense.date, Expense.id) < decode_cursor(cursor))
+    return query
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import sys
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import PARTITION_MONTHS_AHEAD
+from models import dispose_engines, get_engine
+
+logger = logging.getLogger(__name__)
+
+# Held for the transaction, so workers starting together do not race to create the same partitions.
+TRY_LOCK = text("SELECT pg_try_advisory_xact_lock(hashtext('expenses_ensure_partitions'))")
+
+
+async def ensure_partitions(db_engine: Optional[AsyncEngine] = None,
+                            months_ahead: int = PARTITION_MONTHS_AHEAD) -> bool:
+    """Create monthly `expenses` partitions up to ``months_ahead`` and split the default one.
+
+    Returns False if another process is already doing it. No-op on databases other
+    than PostgreSQL, where `expenses` is a plain table.
+    """
+    db_engine = db_engine or get_engine()
+    if db_engine.dialect.name != 'postgresql':
+        return True
+
+    async with db_engine.begin() as conn:
+        if not (await conn.execute(TRY_LOCK)).scalar():
+            logger.info("Partitions are being created by another process; skipping")
+            return False
+        await conn.execute(text("SELECT expenses_ensure_partitions(CAST(now() AS date), :months)"),
+                           {'months': months_ahead})
+    return True
+
+
+async def _main(months_ahead: int):
+    try:
+        await ensure_partitions(months_ahead=months_ahead)
+    finally:
+        await dispose_engines()
+
+
+if __name__ == '__main__':
+    asyncio.run(_main(int(sys.argv[1]) if len(sys.argv) > 1 else PARTITION_MONTHS_AHEAD))
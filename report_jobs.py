@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Sequence
+
+from config import REPORT_CACHE_MAX_BYTES, REPORT_CACHE_SIZE, REPORT_PROCESSES, REPORT_QUEUE_SIZE
+from metrics import CallbackMetric, registry
+from reports import Sheet, render_workbook
+
+logger = logging.getLogger(__name__)
+
+Progress = Callable[[str], Awaitable[None]]
+
+# Stages reported to progress callbacks, in order.
+QUEUED, LOADING, RENDERING = 'queued', 'loading', 'rendering'
+
+
+class ReportQueueFull(Exception):
+    pass
+
+
+class ReportCache:
+    """LRU of finished report files, bounded by entry count and total bytes."""
+
+    def __init__(self, maxsize: int = REPORT_CACHE_SIZE, max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: 'OrderedDict[Hashable, bytes]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def put(self, key: Hashable, data: bytes):
+        if self.maxsize <= 0 or len(data) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size_bytes -= len(previous)
+        self._entries[key] = data
+        self.size_bytes += len(data)
+        while len(self._entries) > self.maxsize or self.size_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= len(evicted)
+            self.evictions += 1
+
+
+class _Job:
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.listeners: List[Progress] = []
+        self.task: Optional[asyncio.Task] = None
+
+    async def advance(self, stage: str):
+        self.stage = stage
+        for listener in list(self.listeners):
+            await _notify(listener, stage)
+
+
+async def _notify(listener: Progress, stage: str):
+    try:
+        await listener(stage)
+    except Exception:
+        logger.warning("Report progress callback failed", exc_info=True)
+
+
+class ReportJobQueue:
+    """Runs report jobs on a bounded process pool, one job per key.
+
+    Callers asking for a key that is already being built wait for the same job
+    instead of starting another; finished files are kept in a ReportCache, so
+    keys should include whatever version makes the data stale.
+    """
+
+    def __init__(self, processes: int = REPORT_PROCESSES, max_jobs: int = REPORT_QUEUE_SIZE,
+                 cache: Optional[ReportCache] = None):
+        self.processes = processes
+        self.max_jobs = max_jobs
+        self.cache = cache if cache is not None else ReportCache()
+        self._jobs: Dict[Hashable, _Job] = {}
+        self._slots = asyncio.Semaphore(processes)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._jobs)
+
+    async def run(self, key: Hashable, load: Callable[[], Awaitable[Sequence[Sheet]]],
+                  progress: Optional[Progress] = None) -> bytes:
+        """XLSX bytes for ``key``, from the cache, a running job or a new job that awaits ``load``.
+
+        ``load`` returns the sheets, which are pickled to a worker process: small
+        ones as plain lists of rows, large ones as a row source such as
+        reports.PeriodExpenses that the worker streams itself. Raises
+        ReportQueueFull when max_jobs distinct reports are already queued or running.
+        """
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        job = self._jobs.get(key)
+        if job is None:
+            if len(self._jobs) >= self.max_jobs:
+                raise ReportQueueFull(key)
+            job = self._jobs[key] = _Job(QUEUED if len(self._jobs) >= self.processes else LOADING)
+            job.task = asyncio.create_task(self._build(key, job, load))
+        if progress is not None:
+            job.listeners.append(progress)
+            await _notify(progress, job.stage)
+        # A waiter going away must not cancel the job others are waiting for.
+        return await asyncio.shield(job.task)
+
+    async def _build(self, key: Hashable, job: _Job, load: Callable[[], Awaitable[Sequence[Sheet]]]) -> bytes:
+        try:
+            async with self._slots:
+                if job.stage != LOADING:
+                    await job.advance(LOADING)
+                sheets = await load()
+                await job.advance(RENDERING)
+                data = await asyncio.get_running_loop().run_in_executor(self._pool(), render_workbook, sheets)
+            self.cache.put(key, data)
+            return data
+        finally:
+            del self._jobs[key]
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, not forked: a fork would copy the event loop, open sockets and pool connections.
+            self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+report_queue = ReportJobQueue()
+
+registry.register(CallbackMetric('report_jobs_in_flight', 'Report jobs queued or running.',
+                                 lambda: report_queue.in_flight))
+registry.register(CallbackMetric('report_cache_hits_total', 'Reports served from the report cache.',
+                                 lambda: report_queue.cache.hits, type='counter'))
+registry.register(CallbackMetric('report_cache_misses_total', 'Report requests not in the report cache.',
+                                 lambda: report_queue.cache.misses, type='counter'))
+registry.register(CallbackMetric('report_cache_bytes', 'Bytes of finished reports held in the report cache.',
+                                 lambda: report_queue.cache.size_bytes))
@@ -0,0 +1,80 @@
+import asyncio
+import io
+from contextlib import aclosing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Sequence, Union
+
+from config import BOT_BACKEND
+
+
+@dataclass
+class PeriodExpenses:
+    """Detail rows of every expense in a period, loaded by the process that renders them.
+
+    Only the period is pickled to the render worker, which streams the rows through its own
+    expense client straight into the write-only sheet, so no process holds them all at once.
+    """
+    start_date: str
+    end_date: str
+    backend: str = BOT_BACKEND
+
+    async def rows(self) -> AsyncIterator[tuple]:
+        # Imported here: only render workers read the rows.
+        from api_client import create_expense_client
+
+        api = create_expense_client(self.backend)
+        try:
+            async with aclosing(api.stream_period(self.start_date, self.end_date)) as expenses:
+                async for exp in expenses:
+                    yield exp['name'], exp['amount'], exp['amount_usd'], parse_date(exp['date'])
+        finally:
+            await api.close()
+            if self.backend == 'local':
+                from models import dispose_engines
+
+                # Pooled connections belong to this render's event loop.
+                await dispose_engines()
+
+
+@dataclass
+class Sheet:
+    title: str
+    header: Sequence[str]
+    rows: Union[Iterable[Sequence], PeriodExpenses]
+    footer: Sequence = ()
+
+
+def render_workbook(sheets: Sequence[Sheet]) -> bytes:
+    """Render ``sheets`` into XLSX bytes; runs in a report worker process (see report_jobs)."""
+    return asyncio.run(_render(sheets))
+
+
+async def _render(sheets: Sequence[Sheet]) -> bytes:
+    # openpyxl takes longer to import than the rest of the bot's own modules; load it with the first report.
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+
+    for sheet in sheets:
+        worksheet = workbook.create_sheet(sheet.title)
+        worksheet.append(list(sheet.header))
+
+        if isinstance(sheet.rows, PeriodExpenses):
+            async with aclosing(sheet.rows.rows()) as rows:
+                async for row in rows:
+                    worksheet.append(list(row))
+        else:
+            for row in sheet.rows:
+                worksheet.append(list(row))
+
+        if sheet.footer:
+            worksheet.append(list(sheet.footer))
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def parse_date(value: str):
+    return datetime.fromisoformat(value) if value else None
@@ -0,0 +1,160 @@
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import Date, cast, delete, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import data_version
+from models import AsyncSessionLocal, DailyTotal, Expense, MonthlyTotal, dispose_engines, upsert_insert
+
+# day -> [amount_minor, amount_usd_minor, count]
+Deltas = Dict[date, List[int]]
+
+
+def new_deltas() -> Deltas:
+    return defaultdict(lambda: [0, 0, 0])
+
+
+def add_delta(deltas: Deltas, when: datetime, amount_minor: int, amount_usd_minor: int, count: int):
+    delta = deltas[when.date() if isinstance(when, datetime) else when]
+    delta[0] += amount_minor
+    delta[1] += amount_usd_minor or 0
+    delta[2] += count
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def day_bounds(start_date: datetime, end_date: datetime) -> Tuple[datetime, datetime]:
+    """Half-open [from, to) datetimes covering whole days start_date..end_date, as the rollups count them."""
+    return datetime.combine(start_date.date(), time()), datetime.combine(end_date.date() + timedelta(days=1), time())
+
+
+async def _increment(db: AsyncSession, model, key: str, rows: List[dict]):
+    insert_ = upsert_insert(db.bind.dialect.name)
+    if insert_ is not None:
+        statement = insert_(model).values(rows)
+        statement = statement.on_conflict_do_update(index_elements=[key], set_={
+            'amount_minor': model.amount_minor + statement.excluded.amount_minor,
+            'amount_usd_minor': model.amount_usd_minor + statement.excluded.amount_usd_minor,
+            'count': model.count + statement.excluded.count,
+        })
+        await db.execute(statement)
+        return
+
+    for row in rows:
+        record = await db.get(model, row[key], with_for_update=True)
+        if record is None:
+            db.add(model(**row))
+        else:
+            record.amount_minor += row['amount_minor']
+            record.amount_usd_minor += row['amount_usd_minor']
+            record.count += row['count']
+    await db.flush()
+
+
+async def apply_deltas(db: AsyncSession, deltas: Deltas):
+    """Add per-day deltas to the daily and monthly rollups inside the caller's transaction."""
+    if not deltas:
+        return
+
+    months = new_deltas()
+    for day, (amount_minor, amount_usd_minor, count) in deltas.items():
+        add_delta(months, month_start(day), amount_minor, amount_usd_minor, count)
+
+    # Sorted keys keep lock order stable between concurrent writers.
+    await _increment(db, DailyTotal, 'day', [
+        {'day': day, 'amount_minor': a, 'amount_usd_minor': u, 'count': c} for day, (a, u, c) in sorted(deltas.items())
+    ])
+    await _increment(db, MonthlyTotal, 'month', [
+        {'month': month, 'amount_minor': a, 'amount_usd_minor': u, 'count': c} for month, (a, u, c) in sorted(months.items())
+    ])
+
+
+async def apply_delta(db: AsyncSession, when: datetime, amount_minor: int, amount_usd_minor: int, count: int):
+    deltas = new_deltas()
+    add_delta(deltas, when, amount_minor, amount_usd_minor, count)
+    await apply_deltas(db, deltas)
+
+
+async def period_totals(db: AsyncSession, start_date: datetime, end_date: datetime) -> Tuple[int, int, int]:
+    """Totals for the inclusive day range, read from whole months plus the partial months at the edges."""
+    first_day, last_day = start_date.date(), end_date.date()
+    full_from = first_day if first_day.day == 1 else next_month(first_day)
+    full_to = month_start(last_day + timedelta(days=1))
+
+    amount_minor, amount_usd_minor, count = 0, 0, 0
+    columns = lambda model: (func.sum(model.amount_minor), func.sum(model.amount_usd_minor), func.sum(model.count))
+
+    if full_from < full_to:
+        monthly = select(*columns(MonthlyTotal)).where(MonthlyTotal.month >= full_from, MonthlyTotal.month < full_to)
+        daily = select(*columns(DailyTotal)).where(or_(
+            DailyTotal.day.between(first_day, full_from - timedelta(days=1)),
+            DailyTotal.day.between(full_to, last_day),
+        ))
+        queries = (monthly, daily)
+    else:
+        queries = (select(*columns(DailyTotal)).where(DailyTotal.day.between(first_day, last_day)),)
+
+    for query in queries:
+        row_amount, row_usd, row_count = (await db.execute(query)).one()
+        amount_minor += row_amount or 0
+        amount_usd_minor += row_usd or 0
+        count += row_count or 0
+    return int(amount_minor), int(amount_usd_minor), int(count)
+
+
+def _day(column, dialect: str):
+    if dialect == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+
+def _month(column, dialect: str):
+    if dialect == 'sqlite':
+        return func.date(column, 'start of month')
+    return cast(func.date_trunc('month', column), Date)
+
+
+async def rebuild(db: AsyncSession):
+    """Recompute both rollup tables from `expenses` and commit, bumping the data version."""
+    dialect = db.bind.dialect.name
+    columns = ['amount_minor', 'amount_usd_minor', 'count']
+
+    await db.execute(delete(MonthlyTotal))
+    await db.execute(delete(DailyTotal))
+
+    day = _day(Expense.date, dialect)
+    await db.execute(insert(DailyTotal).from_select(['day', *columns], select(
+        day, func.sum(Expense.amount_minor), func.coalesce(func.sum(Expense.amount_usd_minor), 0), func.count(Expense.id),
+    ).group_by(day)))
+
+    month = _month(DailyTotal.day, dialect)
+    await db.execute(insert(MonthlyTotal).from_select(['month', *columns], select(
+        month, func.sum(DailyTotal.amount_minor), func.sum(DailyTotal.amount_usd_minor), func.sum(DailyTotal.count),
+    ).group_by(month)))
+
+    # Summaries read the rollups, so cached ones in every process are stale now.
+    await data_version.commit(db)
+
+
+async def _main(argv: Iterable[str]):
+    if list(argv) != ['rebuild']:
+        raise SystemExit("usage: python rollups.py rebuild")
+    try:
+        async with AsyncSessionLocal() as db:
+            await rebuild(db)
+    finally:
+        await dispose_engines()
+
+
+if __name__ == '__main__':
+    asyncio.run(_main(sys.argv[1:]))
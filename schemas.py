@@ -0,0 +1,104 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from config import BATCH_MAX_IDS
+from money import to_minor
+
+
+class ExpenseCreate(BaseModel):
+    name: str
+    amount: float
+    date: str
+
+    @property
+    def amount_minor(self) -> int:
+        return to_minor(self.amount)
+
+
+class ExpenseUpdate(BaseModel):
+    name: str
+    amount: float
+
+    @property
+    def amount_minor(self) -> int:
+        return to_minor(self.amount)
+
+
+class ExpenseUpdateItem(ExpenseUpdate):
+    id: int
+
+
+class ExpenseBatchUpdate(BaseModel):
+    items: List[ExpenseUpdateItem] = Field(min_length=1, max_length=BATCH_MAX_IDS)
+
+
+class ExpenseSelection(BaseModel):
+    """Expense IDs given one by one and as inclusive ``(first, last)`` ranges."""
+
+    ids: List[int] = []
+    ranges: List[Tuple[int, int]] = []
+
+    @model_validator(mode='after')
+    def check_size(self):
+        if any(first > last for first, last in self.ranges):
+            raise ValueError("Range start must not exceed its end")
+        size = len(self.ids) + sum(last - first + 1 for first, last in self.ranges)
+        if not size:
+            raise ValueError("No expense IDs given")
+        if size > BATCH_MAX_IDS:
+            raise ValueError(f"At most {BATCH_MAX_IDS} expense IDs per request")
+        return self
+
+    @classmethod
+    def parse(cls, text: str) -> 'ExpenseSelection':
+        """Parse input like ``3,7,10-25``; raises ValueError."""
+        ids, ranges = [], []
+        for part in text.replace(' ', '').split(','):
+            first, dash, last = part.partition('-')
+            if dash:
+                ranges.append((int(first), int(last)))
+            elif part:
+                ids.append(int(part))
+        return cls(ids=ids, ranges=ranges)
+
+
+class ExpenseOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    amount: float
+    amount_usd: Optional[float] = None
+    date: datetime
+
+
+class ExpensePage(BaseModel):
+    items: List[ExpenseOut]
+    next_cursor: Optional[str] = None
+
+
+class ExpenseCreated(BaseModel):
+    message: str
+    expense: ExpenseOut
+
+
+class ExpenseUpdated(BaseModel):
+    message: str
+    updated_expense: ExpenseOut
+
+
+class ExpensesUpdated(BaseModel):
+    message: str
+    updated: List[ExpenseOut]
+    not_found: List[int]
+
+
+class ExpensesDeleted(BaseModel):
+    message: str
+    deleted: List[int]
+
+
+class Message(BaseModel):
+    message: str
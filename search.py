@@ -0,0 +1,117 @@
+import re
+import time
+import weakref
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from sqlalchemy import column, func, literal, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import SEARCH_INDEX_TTL, SEARCH_SIMILARITY
+from models import Expense
+
+# Written by the f1c6a8d93b57 migration; absent on create_all databases.
+expenses_fts = table('expenses_fts', column('rowid'), column('name'))
+
+_WORD = re.compile(r'\w+')
+
+# Engine -> (whether the search index exists, when that was checked); rechecked every SEARCH_INDEX_TTL
+# so an index created or dropped later is noticed.
+_indexed: 'weakref.WeakKeyDictionary[object, Tuple[bool, float]]' = weakref.WeakKeyDictionary()
+
+
+def trigrams(value: str) -> set:
+    """pg_trgm-style trigrams: lowercased words padded with two leading spaces and one trailing."""
+    result = set()
+    for word in _WORD.findall(value.lower()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+@lru_cache(maxsize=4096)
+def word_similarity(query: str, name: str) -> float:
+    """Share of the query's trigrams found in the best-matching word of ``name``.
+
+    Approximates pg_trgm's word_similarity (which also considers partial words) for SQLite.
+    Cached, since expense names repeat heavily.
+    """
+    wanted = trigrams(query)
+    if not wanted or not name:
+        return 0.0
+    best = max((len(wanted & trigrams(word)) for word in _WORD.findall(name)), default=0)
+    return max(best, len(wanted & trigrams(name))) / len(wanted)
+
+
+def install_sqlite_functions(dbapi_connection, connection_record):
+    """'connect' listener that models.make_engine adds to its SQLite engines."""
+    dbapi_connection.create_function('word_similarity', 2, word_similarity, deterministic=True)
+    dbapi_connection.create_function('casefold', 1, lambda value: value and value.casefold(), deterministic=True)
+
+
+async def _has_index(db: AsyncSession) -> bool:
+    bind, now = db.bind, time.monotonic()
+    cached = _indexed.get(bind)
+    if cached is not None and now - cached[1] < SEARCH_INDEX_TTL:
+        return cached[0]
+
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        query = "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+    elif dialect == 'sqlite':
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses_fts'"
+    else:
+        query = None
+    indexed = query is not None and (await db.execute(text(query))).first() is not None
+    _indexed[bind] = (indexed, now)
+    return indexed
+
+
+def invalidate_index():
+    """Recheck for the search index on the next query, e.g. after migrating."""
+    _indexed.clear()
+
+
+def _fts_phrase(value: str) -> str:
+    return '"%s"' % value.replace('"', '""')
+
+
+def _fts_any_trigram(query: str) -> Optional[str]:
+    """FTS5 MATCH expression for rows sharing any 3-character run with ``query``."""
+    grams = {query[i:i + 3].lower() for i in range(len(query) - 2)}
+    return ' OR '.join(_fts_phrase(gram) for gram in grams if gram.strip()) or None
+
+
+async def name_filter(db: AsyncSession, query: str, fuzzy: bool = False):
+    """WHERE clause for names starting with ``query``, or similar to it if ``fuzzy``."""
+    dialect = db.bind.dialect.name
+    indexed = await _has_index(db)
+
+    if dialect == 'postgresql':
+        if fuzzy and indexed:
+            # `<%` is word_similarity >= pg_trgm.word_similarity_threshold and can use the GIN index.
+            await db.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :value, true)"),
+                             {'value': str(SEARCH_SIMILARITY)})
+            return literal(query).op('<%')(Expense.name)
+        # Without pg_trgm these are plain scans, and fuzzy degrades to a substring match.
+        if fuzzy:
+            return Expense.name.icontains(query, autoescape=True)
+        return Expense.name.istartswith(query, autoescape=True)
+
+    if dialect == 'sqlite':
+        # SQLite's LIKE and lower() only fold ASCII, so names are compared by the Python functions above.
+        if fuzzy:
+            condition = func.word_similarity(query, Expense.name) >= SEARCH_SIMILARITY
+            match = _fts_any_trigram(query)
+        else:
+            condition = func.casefold(Expense.name).startswith(query.casefold(), autoescape=True)
+            # Trigram MATCH is a case-insensitive substring test and needs at least 3 characters.
+            match = _fts_phrase(query) if len(query) >= 3 else None
+        if indexed and match is not None:
+            # The FTS index narrows the rows the Python functions have to look at.
+            candidates = select(expenses_fts.c.rowid).where(text('expenses_fts MATCH :match').bindparams(match=match))
+            condition = Expense.id.in_(candidates) & condition
+        return condition
+
+    return Expense.name.istartswith(query, autoescape=True)
+
@@ -0,0 +1,247 @@
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Row, bindparam, delete, or_, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from cache import data_version
+from config import STREAM_CHUNK_SIZE
+from exchange import ExchangeRateProvider, ExchangeRateUnavailable
+from fx_rates import get_history
+from models import Expense, ReadSessionLocal
+from money import convert, from_minor
+from pagination import encode_cursor, newest_first
+from rollups import add_delta, apply_delta, apply_deltas, day_bounds, new_deltas
+from search import name_filter
+from schemas import ExpenseCreate, ExpenseOut, ExpenseUpdate
+from summary import period_summary
+
+
+class ExpenseNotFound(Exception):
+    pass
+
+
+# List and stream queries select these columns instead of Expense entities, skipping ORM identity-map work.
+EXPENSE_COLUMNS = (Expense.id, Expense.name, Expense.amount_minor, Expense.amount_usd_minor, Expense.date)
+
+# Locks the old rows, converts each new amount at the rate on the row's day and returns the old amounts for
+# the rollups, in one statement. Days past the last loaded rate (see HistoricalRates.rate_on) are left NULL
+# for update_expenses to fill from the live rate. round() on double precision rounds half to even, like
+# money.convert.
+PG_UPDATE_EXPENSES = text("""
+    UPDATE expenses SET name = old.new_name, amount_minor = old.new_amount_minor,
+        amount_usd_minor = round(old.new_amount_minor * old.rate)
+    FROM (
+        SELECT e.id, e.date, e.amount_minor, e.amount_usd_minor, v.name AS new_name, v.amount_minor AS new_amount_minor,
+            (SELECT fx.rate FROM fx_rates fx
+             WHERE fx.date <= CAST(e.date AS date) AND CAST(e.date AS date) <= (SELECT max(date) FROM fx_rates)
+             ORDER BY fx.date DESC LIMIT 1) AS rate
+        FROM expenses e
+        JOIN unnest(CAST(:ids AS bigint[]), CAST(:names AS varchar[]), CAST(:amounts AS bigint[]))
+            AS v(id, name, amount_minor) ON e.id = v.id
+        ORDER BY e.id
+        FOR UPDATE OF e
+    ) AS old
+    WHERE expenses.id = old.id AND expenses.date = old.date
+    RETURNING expenses.id, expenses.name, expenses.amount_minor, expenses.amount_usd_minor, expenses.date,
+        old.amount_minor, old.amount_usd_minor
+""")
+
+
+def expense_to_dict(expense: Expense) -> dict:
+    return ExpenseOut.model_validate(expense).model_dump(mode='json')
+
+
+def row_to_dict(row) -> dict:
+    """Same shape as expense_to_dict for an EXPENSE_COLUMNS row."""
+    expense_id, name, amount_minor, amount_usd_minor, date = row
+    return {
+        'id': expense_id,
+        'name': name,
+        'amount': from_minor(amount_minor),
+        'amount_usd': from_minor(amount_usd_minor),
+        'date': date.isoformat() if date else None,
+    }
+
+
+async def create_expense(db: AsyncSession, ex: ExpenseCreate, provider: ExchangeRateProvider) -> Expense:
+    """Raises ExchangeRateUnavailable only if the date is past the historical rates and the live rate is down."""
+    date_obj = datetime.strptime(ex.date, '%d.%m.%Y')
+    exch_rate = (await get_history(db)).rate_on(date_obj)
+    if exch_rate is None:
+        exch_rate = await provider.get_rate()
+    expense = Expense(name=ex.name, amount_minor=ex.amount_minor,
+                      amount_usd_minor=convert(ex.amount_minor, exch_rate), date=date_obj)
+
+    db.add(expense)
+    await apply_delta(db, expense.date, expense.amount_minor, expense.amount_usd_minor, 1)
+    await data_version.commit(db)
+    await db.refresh(expense)
+    return expense
+
+
+async def get_expense(db: AsyncSession, expense_id: int) -> Expense:
+    result = await db.execute(select(Expense).where(Expense.id == expense_id))
+    expense = result.scalars().first()
+    if not expense:
+        raise ExpenseNotFound(expense_id)
+    return expense
+
+
+def _period_query(start_date: datetime, end_date: datetime):
+    # Whole days, so the rows add up to period_summary's rollup totals.
+    first, after = day_bounds(start_date, end_date)
+    return select(*EXPENSE_COLUMNS).where(Expense.date >= first, Expense.date < after)
+
+
+async def list_period(db: AsyncSession, start_date: datetime, end_date: datetime) -> List[Row]:
+    result = await db.execute(_period_query(start_date, end_date))
+    return result.all()
+
+
+async def list_page(db: AsyncSession, limit: int, cursor: Optional[str] = None) -> Tuple[List[Row], Optional[str]]:
+    result = await db.execute(newest_first(select(*EXPENSE_COLUMNS), cursor).limit(limit))
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+    return rows, next_cursor
+
+
+async def search_expenses(db: AsyncSession, query: str, fuzzy: bool = False, limit: int = 20,
+                          cursor: Optional[str] = None) -> Tuple[List[Row], Optional[str]]:
+    statement = select(*EXPENSE_COLUMNS).where(await name_filter(db, query.strip(), fuzzy))
+    result = await db.execute(newest_first(statement, cursor).limit(limit))
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+    return rows, next_cursor
+
+
+async def _stream(query, chunk_size: int) -> AsyncIterator[List[Row]]:
+    # Streams outlive request-scoped sessions, so they own theirs.
+    async with ReadSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=chunk_size))
+        async for partition in result.partitions():
+            yield partition
+
+
+def stream_period(start_date: datetime, end_date: datetime,
+                  chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[List[Row]]:
+    return _stream(_period_query(start_date, end_date).order_by(Expense.date, Expense.id), chunk_size)
+
+
+def stream_all(chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[List[Row]]:
+    return _stream(newest_first(select(*EXPENSE_COLUMNS)), chunk_size)
+
+
+async def _update_rows(db: AsyncSession, updates: Dict[int, ExpenseUpdate]) -> List[tuple]:
+    """Apply ``updates``; returns (EXPENSE_COLUMNS row, old amount_minor, old amount_usd_minor) per updated expense.
+
+    amount_usd_minor is left NULL for days past the historical rates.
+    """
+    if db.bind.dialect.name == 'postgresql':
+        result = await db.execute(PG_UPDATE_EXPENSES, {
+            'ids': list(updates), 'names': [data.name for data in updates.values()],
+            'amounts': [data.amount_minor for data in updates.values()],
+        })
+        return [(row[:5], row[5], row[6]) for row in result.all()]
+
+    # RETURNING elsewhere (SQLite) cannot see a FROM clause, so the old rows are read first.
+    history = await get_history(db)
+    old_rows = await db.execute(
+        select(Expense.id, Expense.date, Expense.amount_minor, Expense.amount_usd_minor)
+        .where(Expense.id.in_(list(updates))).order_by(Expense.id)
+    )
+    updated = []
+    for expense_id, date, old_amount, old_usd in old_rows.all():
+        data = updates[expense_id]
+        rate = history.rate_on(date)
+        statement = (
+            update(Expense).where(Expense.id == expense_id)
+            .values(name=data.name, amount_minor=data.amount_minor,
+                    amount_usd_minor=None if rate is None else convert(data.amount_minor, rate))
+            .returning(*EXPENSE_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        updated.append(((await db.execute(statement)).one(), old_amount, old_usd))
+    return updated
+
+
+async def _fill_live_usd(db: AsyncSession, rows: List[tuple], live_rate: float) -> List[tuple]:
+    """Convert the updated rows left without a historical rate at ``live_rate``."""
+    filled, params = [], []
+    for row, old_amount, old_usd in rows:
+        if row[3] is None:
+            row = (*row[:3], convert(row[2], live_rate), row[4])
+            params.append({'b_id': row[0], 'b_date': row[4], 'b_amount_usd': row[3]})
+        filled.append((row, old_amount, old_usd))
+
+    table = Expense.__table__
+    # `date` keeps partition pruning on PostgreSQL.
+    statement = (table.update().where(table.c.id == bindparam('b_id'), table.c.date == bindparam('b_date'))
+                 .values(amount_usd_minor=bindparam('b_amount_usd')))
+    await db.execute(statement, params)
+    return filled
+
+
+async def update_expenses(db: AsyncSession, updates: Dict[int, ExpenseUpdate],
+                          provider: ExchangeRateProvider) -> List[tuple]:
+    """Update expenses by ID in one transaction; returns the EXPENSE_COLUMNS rows that existed."""
+    rows = await _update_rows(db, updates)
+    if any(row[3] is None for row, _, _ in rows):
+        # Only expenses past the last historical rate need the live one.
+        try:
+            live_rate = await provider.get_rate()
+        except ExchangeRateUnavailable:
+            await db.rollback()
+            raise
+        rows = await _fill_live_usd(db, rows, live_rate)
+
+    deltas = new_deltas()
+    for (_, _, amount_minor, amount_usd_minor, date), old_amount, old_usd in rows:
+        add_delta(deltas, date, amount_minor - old_amount, amount_usd_minor - (old_usd or 0), 0)
+    await apply_deltas(db, deltas)
+    await data_version.commit(db, changed=bool(rows))
+    return [row for row, _, _ in rows]
+
+
+async def update_expense(db: AsyncSession, expense_id: int, update_data: ExpenseUpdate,
+                         provider: ExchangeRateProvider) -> tuple:
+    rows = await update_expenses(db, {expense_id: update_data}, provider)
+    if not rows:
+        raise ExpenseNotFound(expense_id)
+    return rows[0]
+
+
+async def delete_expenses(db: AsyncSession, ids: Sequence[int] = (),
+                          ranges: Sequence[Tuple[int, int]] = ()) -> List[int]:
+    """Delete expenses by ID and inclusive ID range in one transaction; returns the deleted IDs."""
+    conditions = [Expense.id.between(first, last) for first, last in ranges]
+    if ids:
+        conditions.append(Expense.id.in_(list(ids)))
+    if not conditions:
+        return []
+
+    result = await db.execute(
+        delete(Expense).where(or_(*conditions))
+        .returning(Expense.id, Expense.date, Expense.amount_minor, Expense.amount_usd_minor)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+
+    deltas = new_deltas()
+    for _, date, amount_minor, amount_usd_minor in rows:
+        add_delta(deltas, date, -amount_minor, -(amount_usd_minor or 0), -1)
+    await apply_deltas(db, deltas)
+    await data_version.commit(db, changed=bool(rows))
+    return sorted(row.id for row in rows)
+
+
+async def delete_expense(db: AsyncSession, expense_id: int):
+    if not await delete_expenses(db, [expense_id]):
+        raise ExpenseNotFound(expense_id)
@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import data_version
+from models import DailyTotal, Expense
+from money import from_minor
+from rollups import day_bounds, period_totals
+
+
+def group_key(group_by: str, dialect: str, column=Expense.date):
+    if group_by == 'name':
+        return Expense.name
+
+    if dialect == 'sqlite':
+        if group_by == 'day':
+            return func.strftime('%Y-%m-%d', column)
+        if group_by == 'week':
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m', column)
+
+    if group_by == 'day':
+        return func.to_char(column, 'YYYY-MM-DD')
+    if group_by == 'week':
+        return func.to_char(func.date_trunc('week', column), 'YYYY-MM-DD')
+    return func.to_char(column, 'YYYY-MM')
+
+
+def _group_query(grouping: str, dialect: str, start_date: datetime, end_date: datetime):
+    # Calendar groupings only need per-day totals; grouping by name still has to scan expenses.
+    if grouping == 'name':
+        key = group_key(grouping, dialect).label('key')
+        first, after = day_bounds(start_date, end_date)
+        return (
+            select(key, func.sum(Expense.amount_minor), func.sum(Expense.amount_usd_minor), func.count(Expense.id))
+            .where(Expense.date >= first, Expense.date < after)
+            .group_by(key)
+            .order_by(key)
+        )
+
+    key = group_key(grouping, dialect, DailyTotal.day).label('key')
+    return (
+        select(key, func.sum(DailyTotal.amount_minor), func.sum(DailyTotal.amount_usd_minor), func.sum(DailyTotal.count))
+        .where(DailyTotal.day.between(start_date.date(), end_date.date()), DailyTotal.count != 0)
+        .group_by(key)
+        .order_by(key)
+    )
+
+
+async def period_summary(db: AsyncSession, start_date: datetime, end_date: datetime,
+                         group_by: Iterable[str] = ()) -> dict:
+    dialect = db.bind.dialect.name
+    # Read from the database in this session, so it is the same in every process and across restarts;
+    # read before querying, so a write landing mid-query shows up as a newer version, never an older one.
+    version = await data_version.read(db)
+    total_amount, total_usd, count = await period_totals(db, start_date, end_date)
+
+    groups = {}
+    for grouping in group_by:
+        result = await db.execute(_group_query(grouping, dialect, start_date, end_date))
+        groups[grouping] = [
+            {'key': row_key, 'amount': from_minor(amount), 'amount_usd': from_minor(amount_usd or 0), 'count': int(row_count)}
+            for row_key, amount, amount_usd, row_count in result
+        ]
+
+    return {
+        'start_date': start_date.strftime('%d.%m.%Y'),
+        'end_date': end_date.strftime('%d.%m.%Y'),
+        'total_amount': from_minor(total_amount),
+        'total_amount_usd': from_minor(total_usd),
+        'count': count,
+        'groups': groups,
+        'data_version': version,
+    }
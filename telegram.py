@@ -1,26 +1,27 @@
-from config import TOKEN
+from config import TOKEN, BOT_METRICS_PORT, PICKER_PAGE_SIZE
 import logging
-import requests
-import aiofiles
-import aiohttp
-import pandas as pd
 import asyncio
 import re
-from aiogram import Bot, Dispatcher, F
-from aiogram.filters import Command
-from aiogram.types import Message, ReplyKeyboardRemove
-from aiogram.utils.keyboard import ReplyKeyboardBuilder
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import BufferedInputFile, CallbackQuery, InlineKeyboardButton, Message, ReplyKeyboardRemove
+from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from datetime import datetime
-from models import Expense, AsyncSessionLocal
-from sqlalchemy.future import select
-from aiogram.types import FSInputFile
-
-bot = Bot(token=TOKEN)
-dp = Dispatcher()
-
-API_URL = "http://localhost:8000/expense/"
+from api_client import ApiError, ExpenseClient, NotFoundError, create_expense_client
+from exchange import get_rate_provider
+from fsm_storage import create_fsm_storage
+from metrics import HandlerMetricsMiddleware, start_metrics_server
+from models import dispose_engines
+from report_jobs import LOADING, QUEUED, RENDERING, ReportQueueFull, report_queue
+from reports import PeriodExpenses, Sheet
+from schemas import ExpenseSelection
+from throttling import THROTTLE_LIMITS, ThrottlingMiddleware, send_scheduler, separate_message
+
+# Handlers live on a router; the Bot and Dispatcher are built by the factories below when the bot starts.
+router = Router(name='expenses')
 
 logging.basicConfig(level=logging.INFO)
 
@@ -34,13 +35,7 @@ class ExpenseForm(StatesGroup):
     waiting_for_update_id = State()
     waiting_for_new_amount = State()
     waiting_for_new_name = State()
-
-
-async def get_all_expenses():
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Expense))
-        expenses = result.scalars().all()
-        return expenses
+    waiting_for_search = State()
 
 
 add_button = '➕ Додати витрату'
@@ -58,7 +53,28 @@ builder.adjust(1, 1, 1)
 menu_keyboard = builder.as_markup(resize_keyboard=True)
 
 
-@dp.message(Command('start'))
+class PickerPage(CallbackData, prefix='pick_page'):
+    purpose: str
+    page: int
+
+
+class PickExpense(CallbackData, prefix='pick'):
+    purpose: str
+    expense_id: int
+
+
+class ConfirmDelete(CallbackData, prefix='del'):
+    expense_id: int
+    confirmed: bool
+
+
+PICKER_PROMPTS = {
+    'delete': "Оберіть витрату, яку хочете видалити, або введіть ID (можна кілька: 3,7,10-25):",
+    'update': "Оберіть витрату, яку хочете змінити, або введіть її ID:",
+}
+
+
+@router.message(Command('start'))
 async def start_handler(message: Message):
     await message.answer(
         "Вітаю! Я бот для контролю твоїх витрат.\n"
@@ -67,21 +83,68 @@ async def start_handler(message: Message):
     )
 
 
+# SEARCH COMMAND
+SEARCH_RESULTS_LIMIT = 10
+
+
+@router.message(Command('search'), flags={'throttle': 'search'})
+async def search_step1(message: Message, command: CommandObject, state: FSMContext, api: ExpenseClient):
+    await state.clear()
+    if command.args:
+        await send_search_results(message, command.args, api)
+        return
+    await message.answer('Введіть назву витрати або її початок:', reply_markup=ReplyKeyboardRemove())
+    await state.set_state(ExpenseForm.waiting_for_search)
+
+
+@router.message(ExpenseForm.waiting_for_search, flags={'throttle': 'search'})
+async def search_step2(message: Message, state: FSMContext, api: ExpenseClient):
+    await state.clear()
+    await send_search_results(message, message.text or '', api)
+
+
+async def send_search_results(message: Message, query: str, api: ExpenseClient):
+    query = query.strip()
+    if not query:
+        await message.answer('Порожній запит. Приклад: /search кава', reply_markup=menu_keyboard)
+        return
+
+    try:
+        page = await api.search_expenses(query, limit=SEARCH_RESULTS_LIMIT)
+        fuzzy = not page['items']
+        if fuzzy:
+            page = await api.search_expenses(query, fuzzy=True, limit=SEARCH_RESULTS_LIMIT)
+    except ApiError as exc:
+        await message.answer(f"Помилка запиту: {exc.status}", reply_markup=menu_keyboard)
+        return
+
+    if not page['items']:
+        await message.answer(f'За запитом «{query}» нічого не знайдено.', reply_markup=menu_keyboard)
+        return
+
+    lines = ['Схожі витрати:' if fuzzy else 'Знайдені витрати:']
+    lines += [f"ID {exp['id']}: {exp['name']} — {exp['amount']}₴ / {exp['amount_usd']}$ ({exp['date'][:10]})"
+              for exp in page['items']]
+    if page['next_cursor']:
+        lines.append(f'Показано останні {SEARCH_RESULTS_LIMIT}. Уточніть запит, щоб побачити інші.')
+    await message.answer('\n'.join(lines), reply_markup=menu_keyboard)
+
+
 # ADD BUTTON
-@dp.message(F.text == add_button)
+@router.message(F.text == add_button)
 async def add_expense_step1(message: Message, state: FSMContext):
     await message.answer('Введіть назву витрати', reply_markup=ReplyKeyboardRemove())
     await state.set_state(ExpenseForm.waiting_for_name)
 
 
-@dp.message(ExpenseForm.waiting_for_name)
+@router.message(ExpenseForm.waiting_for_name)
 async def add_expense_step2(message: Message, state: FSMContext):
     await state.update_data(name=message.text)
     await message.answer('Введіть дату витрати DD.MM.YYYY:')
     await state.set_state(ExpenseForm.waiting_for_date)
 
 
-@dp.message(ExpenseForm.waiting_for_date)
+@router.message(ExpenseForm.waiting_for_date)
 async def add_expense_step3(message: Message, state: FSMContext):
     date_pattern = r"^\d{2}\.\d{2}\.\d{4}$"
     if not re.match(date_pattern, message.text):
@@ -93,8 +156,8 @@ async def add_expense_step3(message: Message, state: FSMContext):
     await state.set_state(ExpenseForm.waiting_for_amount)
 
 
-@dp.message(ExpenseForm.waiting_for_amount)
-async def add_expense_finish(message: Message, state: FSMContext):
+@router.message(ExpenseForm.waiting_for_amount)
+async def add_expense_finish(message: Message, state: FSMContext, api: ExpenseClient):
     try:
         amount = float(message.text.replace(",", "."))
     except ValueError:
@@ -102,32 +165,28 @@ async def add_expense_finish(message: Message, state: FSMContext):
         return
 
     user_data = await state.get_data()
-    expense_data = {
-        "name": user_data["name"],
-        "date": user_data["date"],
-        "amount": amount
-    }
-
-    response = requests.post(API_URL, json=expense_data, headers={"Content-Type": "application/json"})
-    print(response, "RESPONSE")
-    if response.status_code == 201:
-        await message.answer("✅ Витрата успішно додана!", reply_markup=menu_keyboard)
-    else:
+
+    try:
+        await api.create_expense(name=user_data["name"], amount=amount, date=user_data["date"])
+    except ApiError as exc:
+        logging.warning("Failed to create expense: %s", exc)
         await message.answer("❌ Помилка при додаванні витрати. Спробуйте ще раз.", reply_markup=menu_keyboard)
+    else:
+        await message.answer("✅ Витрата успішно додана!", reply_markup=menu_keyboard)
 
     await state.clear()
 
 
 # VIEW BUTTON
-@dp.message(F.text == view_button)
+@router.message(F.text == view_button)
 async def get_expenses_step1(message: Message, state: FSMContext):
     await message.answer('Введіть дату з якої хочете отримати витрати!Приклад DD.MM.YYYY-DD.MM.YYYY',
                          reply_markup=ReplyKeyboardRemove())
     await state.set_state(ExpenseForm.waiting_for_period_date)
 
 
-@dp.message(ExpenseForm.waiting_for_period_date)
-async def get_expenses_step2(message: Message, state: FSMContext):
+@router.message(ExpenseForm.waiting_for_period_date, flags={'throttle': 'report'})
+async def get_expenses_step2(message: Message, state: FSMContext, api: ExpenseClient):
     date_pattern = r"^(\d{2}\.\d{2}\.\d{4})\s*-\s*(\d{2}\.\d{2}\.\d{4})$"
     match = re.match(date_pattern, message.text)
 
@@ -148,181 +207,274 @@ async def get_expenses_step2(message: Message, state: FSMContext):
         await message.answer('Початкова дата не може бути більша за кінцеву! Введіть знову.')
         return
 
-    await state.update_data(start_date=start_date, end_date=end_date)
+    await state.update_data(start_date=start_date_str, end_date=end_date_str)
 
-    await message.answer('Генерую звіт...')
+    await generate_expense_report(message, start_date, end_date, state, api)
 
-    await generate_expense_report(message, start_date, end_date, state)
 
+REPORT_STAGES = {
+    QUEUED: 'Звіт у черзі...',
+    LOADING: 'Генерую звіт...',
+    RENDERING: 'Формую файл...',
+}
 
-async def generate_expense_report(message: Message, start_date: datetime, end_date: datetime, state: FSMContext):
-    api_url = f"{API_URL}{start_date.strftime('%d.%m.%Y')}/{end_date.strftime('%d.%m.%Y')}/"
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(api_url) as response:
-            if response.status == 404:
-                await message.answer('За вказаний період витрати не знайдені.',reply_markup=menu_keyboard)
-                await state.clear()
-                return
+def report_progress(message: Message):
+    """Progress callback that posts one status message and edits it as the report job advances."""
+    status, shown = None, None
 
-            if response.status != 200:
-                await message.answer(f"Помилка запиту: {response.status}",reply_markup=menu_keyboard)
-                return
+    async def progress(stage: str):
+        nonlocal status, shown
+        text = REPORT_STAGES[stage]
+        if text == shown:
+            return
+        if status is None:
+            # Edited below, so it must not be merged with other replies.
+            with separate_message():
+                status = await message.answer(text)
+        else:
+            await status.edit_text(text)
+        shown = text
 
-            expenses = await response.json()
+    return progress
 
-    if not expenses:
-        await message.answer('За вказаний період витрат нема.',reply_markup=menu_keyboard)
-        await state.clear()
-        return
 
-    data = [(exp['name'], exp['amount'], exp['amount_usd'], exp["date"]) for exp in expenses]
-    df = pd.DataFrame(data, columns=["Назва", "Сума (₴)", "Сума ($)", "Дата"])
+async def generate_expense_report(message: Message, start_date: datetime, end_date: datetime, state: FSMContext,
+                                  api: ExpenseClient):
+    start, end = start_date.strftime('%d.%m.%Y'), end_date.strftime('%d.%m.%Y')
 
-    total_amount = sum(exp['amount'] for exp in expenses)
-    total_usd = sum(exp['amount_usd'] for exp in expenses)
-
-    df.loc[len(df)] = ["Итого", total_amount, total_usd, ""]
-
-    file_path = "expenses_report.xlsx"
-    async with aiofiles.open(file_path, "wb") as f:
-        df.to_excel(file_path, index=False)
+    try:
+        summary = await api.period_summary(start, end, group_by=('name', 'month'))
+
+        if not summary['count']:
+            await message.answer('За вказаний період витрат нема.',reply_markup=menu_keyboard)
+            await state.clear()
+            return
+
+        total_amount = summary['total_amount']
+        total_usd = summary['total_amount_usd']
+
+        async def load_sheets():
+            summary_columns = ["Сума (₴)", "Сума ($)", "Кількість"]
+            return [
+                Sheet("Підсумки", ["Місяць", *summary_columns], summary_rows(summary, 'month'),
+                      footer=["Итого", total_amount, total_usd, summary['count']]),
+                Sheet("За назвою", ["Назва", *summary_columns], summary_rows(summary, 'name')),
+                # Streamed by the render worker itself, however many expenses the period has.
+                Sheet("Витрати", ["Назва", "Сума (₴)", "Сума ($)", "Дата"], PeriodExpenses(start, end, api.backend),
+                      footer=["Итого", total_amount, total_usd, ""]),
+            ]
+
+        # Same period and data version (the database counter) means the same file, so concurrent and
+        # repeated requests share one job.
+        data = await report_queue.run(('period', start, end, summary['data_version']), load_sheets,
+                                      progress=report_progress(message))
+    except ReportQueueFull:
+        await message.answer("Зараз формується забагато звітів. Спробуйте трохи пізніше.",
+                             reply_markup=menu_keyboard)
+        await state.clear()
+        return
+    except ApiError as exc:
+        await message.answer(f"Помилка запиту: {exc.status}",reply_markup=menu_keyboard)
+        await state.clear()
+        return
 
-    file = FSInputFile(file_path)
     await message.answer_document(
-        file, caption=f"Звіт за період {start_date.strftime('%d.%m.%Y')} - "
-                      f"{end_date.strftime('%d.%m.%Y')}\n\nЗагальна сума: {total_amount}₴ ({total_usd:.2f}$)",
+        BufferedInputFile(data, filename="expenses_report.xlsx"), caption=f"Звіт за період {start} - {end}\n\nЗагальна сума: {total_amount}₴ ({total_usd:.2f}$)",
         reply_markup=menu_keyboard
     )
 
     await state.clear()
 
 
-# DELETE BUTTON
-@dp.message(F.text == del_button)
-async def get_expenses_all_step1(message: Message, state: FSMContext):
-    await message.answer('Генерую звіт...', reply_markup=ReplyKeyboardRemove())
-    api_url = f"{API_URL}all/"
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(api_url) as response:
-            if response.status == 404:
-                await message.answer('За вказаний період витрати не знайдені.',reply_markup=menu_keyboard)
-                await state.clear()
-                return
-
-            if response.status != 200:
-                await message.answer(f"Помилка запиту: {response.status}",reply_markup=menu_keyboard)
-                await state.clear()
-                return
-
-            expenses = await response.json()
-
-    if not expenses:
+def summary_rows(summary: dict, group_by: str):
+    return [(g['key'], g['amount'], g['amount_usd'], g['count']) for g in summary['groups'][group_by]]
+
+
+# EXPENSE PICKER
+def expense_label(exp: dict) -> str:
+    name = exp['name'] if len(exp['name']) <= 24 else exp['name'][:23] + '…'
+    return f"{exp['id']} · {name} · {exp['amount']}₴ · {exp['date'][:10]}"
+
+
+async def send_picker_page(message: Message, state: FSMContext, api: ExpenseClient, purpose: str, page: int = 0,
+                           edit: bool = False):
+    """Show one page of the newest expenses as inline buttons.
+
+    Cursors of the pages seen so far are kept in FSM data, so callbacks only carry
+    the page index and every page is one keyset query whatever the history size.
+    """
+    cursors = (await state.get_data()).get('picker_cursors') or [None]
+    page = min(page, len(cursors) - 1)
+    try:
+        result = await api.list_expenses(limit=PICKER_PAGE_SIZE, cursor=cursors[page])
+    except ApiError as exc:
+        await message.answer(f"Помилка запиту: {exc.status}", reply_markup=menu_keyboard)
+        return
+
+    if not result['items']:
+        if page:
+            # Newer rows were deleted since the cursor was taken; start over.
+            await state.update_data(picker_cursors=[None])
+            await send_picker_page(message, state, api, purpose, 0, edit)
+            return
         await message.answer("Список витрат пустий.", reply_markup=menu_keyboard)
+        await state.clear()
         return
 
-    data = [(exp['id'], exp['name'], exp['amount'], exp['amount_usd'], exp['date']) for exp in expenses]
-    df = pd.DataFrame(data, columns=["ID", "Назва", "Сума (₴)", "Сума ($)", "Дата"])
+    cursors = cursors[:page + 1] + ([result['next_cursor']] if result['next_cursor'] else [])
+    await state.update_data(picker_cursors=cursors)
+
+    keyboard = InlineKeyboardBuilder()
+    for exp in result['items']:
+        keyboard.button(text=expense_label(exp), callback_data=PickExpense(purpose=purpose, expense_id=exp['id']))
+    navigation = []
+    if page:
+        navigation.append(InlineKeyboardButton(text='◀️ Новіші',
+                                               callback_data=PickerPage(purpose=purpose, page=page - 1).pack()))
+    if result['next_cursor']:
+        navigation.append(InlineKeyboardButton(text='Старіші ▶️',
+                                               callback_data=PickerPage(purpose=purpose, page=page + 1).pack()))
+    keyboard.adjust(1)
+    if navigation:
+        keyboard.row(*navigation)
+
+    text = PICKER_PROMPTS[purpose] + f"\nСторінка {page + 1}"
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard.as_markup())
+    else:
+        await message.answer(text, reply_markup=keyboard.as_markup())
 
-    file_path = "expenses_all_report.xlsx"
-    async with aiofiles.open(file_path, "wb") as f:
-        df.to_excel(file_path, index=False)
 
-        file = FSInputFile(file_path)
-        await message.answer_document(file, caption=f"All expenses")
-        await message.answer("Введіть ID витрати, яку хочете Видалити!:")
-        await state.set_state(ExpenseForm.waiting_for_id)
+@router.callback_query(PickerPage.filter())
+async def picker_page(callback: CallbackQuery, callback_data: PickerPage, state: FSMContext, api: ExpenseClient):
+    await callback.answer()
+    await send_picker_page(callback.message, state, api, callback_data.purpose, callback_data.page, edit=True)
 
 
-@dp.message(ExpenseForm.waiting_for_id)
-async def delete_expense(message: Message, state: FSMContext):
+@router.callback_query(PickExpense.filter(F.purpose == 'delete'))
+async def pick_expense_to_delete(callback: CallbackQuery, callback_data: PickExpense, state: FSMContext,
+                                 api: ExpenseClient):
+    await callback.answer()
     try:
-        expense_id = int(message.text)
-        api_url = f"{API_URL}delete/{expense_id}/"
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(api_url) as response:
-                if response.status == 404:
-                    await message.answer(f"Витрата з ID {expense_id} не знайдена.",reply_markup=menu_keyboard)
-                elif response.status == 200:
-                    await message.answer(f"Витрата з ID {expense_id} була успішно видалена.",reply_markup=menu_keyboard)
-                else:
-                    await message.answer(f"Сталася помилка: {response.status}", reply_markup=menu_keyboard)
+        expense = await api.get_expense(callback_data.expense_id)
+    except NotFoundError:
+        await callback.message.edit_text(f"Витрата з ID {callback_data.expense_id} не знайдена.")
+        return
+    except ApiError as exc:
+        await callback.message.answer(f"Помилка запиту: {exc.status}", reply_markup=menu_keyboard)
+        return
 
-    except ValueError:
-        await message.answer("Введіть коректний ID.", reply_markup=menu_keyboard)
+    keyboard = InlineKeyboardBuilder()
+    keyboard.button(text='🗑️ Так, видалити', callback_data=ConfirmDelete(expense_id=expense['id'], confirmed=True))
+    keyboard.button(text='✖️ Скасувати', callback_data=ConfirmDelete(expense_id=expense['id'], confirmed=False))
+    await callback.message.edit_text(f"Видалити витрату?\n{expense_label(expense)}", reply_markup=keyboard.as_markup())
 
+
+@router.callback_query(ConfirmDelete.filter())
+async def confirm_delete(callback: CallbackQuery, callback_data: ConfirmDelete, state: FSMContext, api: ExpenseClient):
+    await callback.answer()
     await state.clear()
+    if not callback_data.confirmed:
+        await callback.message.edit_text("Видалення скасовано.")
+        return
+    try:
+        await api.delete_expense(callback_data.expense_id)
+    except NotFoundError:
+        await callback.message.edit_text(f"Витрата з ID {callback_data.expense_id} не знайдена.")
+    except ApiError as exc:
+        await callback.message.edit_text(f"Сталася помилка: {exc.status}")
+    else:
+        await callback.message.edit_text(f"Витрата з ID {callback_data.expense_id} була успішно видалена.")
 
 
-# UPDATE BUTTON
-@dp.message(F.text == update_button)
-async def get_expenses_all_update_step1(message: Message, state: FSMContext):
-    await message.answer('Генерую звіт...', reply_markup=ReplyKeyboardRemove())
-    api_url = f"{API_URL}all/"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(api_url) as response:
-            if response.status == 404:
-                await message.answer('За вказаний період витрати не знайдені.', reply_markup=menu_keyboard)
-                await state.clear()
-                return
-
-            if response.status != 200:
-                await message.answer(f"Помилка запиту: {response.status}", reply_markup=menu_keyboard)
-                return
-
-            expenses = await response.json()
-
-    if not expenses:
-        await message.answer("Список витрат пустий.")
+@router.callback_query(PickExpense.filter(F.purpose == 'update'))
+async def pick_expense_to_update(callback: CallbackQuery, callback_data: PickExpense, state: FSMContext,
+                                 api: ExpenseClient):
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await ask_new_name(callback.message, state, api, callback_data.expense_id)
+
+
+# DELETE BUTTON
+@router.message(F.text == del_button)
+async def get_expenses_all_step1(message: Message, state: FSMContext, api: ExpenseClient):
+    await state.clear()
+    await state.set_state(ExpenseForm.waiting_for_id)
+    await send_picker_page(message, state, api, 'delete')
+
+
+@router.message(ExpenseForm.waiting_for_id)
+async def delete_expense(message: Message, state: FSMContext, api: ExpenseClient):
+    try:
+        selection = ExpenseSelection.parse(message.text or '')
+    except ValueError:
+        await message.answer("Введіть коректні ID, наприклад: 3,7,10-25.", reply_markup=menu_keyboard)
+        await state.clear()
         return
 
-    data = [(exp['id'], exp['name'], exp['amount'], exp['amount_usd'], exp['date']) for exp in expenses]
-    df = pd.DataFrame(data, columns=["ID", "Назва", "Сума (₴)", "Сума ($)", "Дата"])
+    try:
+        result = await api.delete_expenses(selection.ids, selection.ranges)
+    except ApiError as exc:
+        await message.answer(f"Сталася помилка: {exc.status}", reply_markup=menu_keyboard)
+    else:
+        deleted = result['deleted']
+        missing = sorted(set(selection.ids) - set(deleted))
+        if not deleted:
+            await message.answer("Витрати з такими ID не знайдені.", reply_markup=menu_keyboard)
+        elif len(deleted) == 1 and not missing:
+            await message.answer(f"Витрата з ID {deleted[0]} була успішно видалена.", reply_markup=menu_keyboard)
+        else:
+            text = f"Видалено витрат: {len(deleted)}."
+            if missing:
+                text += f"\nНе знайдені ID: {', '.join(map(str, missing))}."
+            await message.answer(text, reply_markup=menu_keyboard)
+
+    await state.clear()
 
-    file_path = "expenses_all_report.xlsx"
-    async with aiofiles.open(file_path, "wb") as f:
-        df.to_excel(file_path, index=False)
 
-        file = FSInputFile(file_path)
-        await message.answer_document(file, caption=f"All expenses")
-        await message.answer("Введіть ID витрати, яку хочете змінити:")
-        await state.set_state(ExpenseForm.waiting_for_update_id)
+# UPDATE BUTTON
+@router.message(F.text == update_button)
+async def get_expenses_all_update_step1(message: Message, state: FSMContext, api: ExpenseClient):
+    await state.clear()
+    await state.set_state(ExpenseForm.waiting_for_update_id)
+    await send_picker_page(message, state, api, 'update')
 
 
-@dp.message(ExpenseForm.waiting_for_update_id)
-async def get_expense_info(message: Message, state: FSMContext):
+@router.message(ExpenseForm.waiting_for_update_id)
+async def get_expense_info(message: Message, state: FSMContext, api: ExpenseClient):
     try:
         expense_id = int(message.text)
-        api_url = f"{API_URL}{expense_id}/"
+    except (TypeError, ValueError):
+        await message.answer("Введіть правильне ID.",reply_markup=menu_keyboard)
+        return
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api_url) as response:
-                if response.status == 404:
-                    await message.answer("Помилка: запис з таким ID не знайдено.\n Введіть ID ще раз")
-                    return
+    await ask_new_name(message, state, api, expense_id)
 
-                if response.status != 200:
-                    await message.answer(f"Помилка  запиту: {response.status}",reply_markup=menu_keyboard)
-                    return
 
-                expense = await response.json()
+async def ask_new_name(message: Message, state: FSMContext, api: ExpenseClient, expense_id: int):
+    try:
+        expense = await api.get_expense(expense_id)
+    except NotFoundError:
+        await message.answer("Помилка: запис з таким ID не знайдено.\n Введіть ID ще раз")
+        await state.set_state(ExpenseForm.waiting_for_update_id)
+        return
+    except ApiError as exc:
+        await message.answer(f"Помилка  запиту: {exc.status}",reply_markup=menu_keyboard)
+        return
 
-        await message.answer(f"Результат :\n"
-                             f"ID: {expense['id']}\n"
-                             f"Назва: {expense['name']}\n"
-                             f"Сума: {expense['amount']}₴ / {expense['amount_usd']}$\n"
-                             f"Дата: {expense['date'][:10]}\n\n"
-                             "Введіть нову назву...:")
+    await message.answer(f"Результат :\n"
+                         f"ID: {expense['id']}\n"
+                         f"Назва: {expense['name']}\n"
+                         f"Сума: {expense['amount']}₴ / {expense['amount_usd']}$\n"
+                         f"Дата: {expense['date'][:10]}\n\n"
+                         "Введіть нову назву...:")
 
-        await state.update_data(expense_id=expense["id"])
-        await state.set_state(ExpenseForm.waiting_for_new_name)
-
-    except ValueError:
-        await message.answer("Введіть правильне ID.",reply_markup=menu_keyboard)
+    await state.update_data(expense_id=expense["id"])
+    await state.set_state(ExpenseForm.waiting_for_new_name)
 
 
-@dp.message(ExpenseForm.waiting_for_new_name)
+@router.message(ExpenseForm.waiting_for_new_name)
 async def update_expense_name(message: Message, state: FSMContext):
     new_name = message.text
     if new_name:
@@ -333,35 +485,69 @@ async def update_expense_name(message: Message, state: FSMContext):
         await message.answer("Введіть коректну назву для витрати.")
 
 
-@dp.message(ExpenseForm.waiting_for_new_amount)
-async def update_expense_amount(message: Message, state: FSMContext):
+@router.message(ExpenseForm.waiting_for_new_amount)
+async def update_expense_amount(message: Message, state: FSMContext, api: ExpenseClient):
     try:
         new_amount = float(message.text)
         data = await state.get_data()
         expense_id = data.get("expense_id")
         new_name = data.get("new_name")
 
-        update_data = {
-            "name": new_name,
-            "amount": new_amount
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.put(f"{API_URL}update/{expense_id}/", json=update_data) as response:
-                if response.status == 404:
-                    await message.answer("Помилка: такої витрати не існує.",reply_markup=menu_keyboard)
-                elif response.status == 200:
-                    await message.answer(f"✅ Витрата з ID {expense_id} успішно оновлена.",reply_markup=menu_keyboard)
-                else:
-                    await message.answer(f"Помилка оновлення: {response.status}",reply_markup=menu_keyboard)
+        try:
+            await api.update_expense(expense_id, name=new_name, amount=new_amount)
+        except NotFoundError:
+            await message.answer("Помилка: такої витрати не існує.",reply_markup=menu_keyboard)
+        except ApiError as exc:
+            await message.answer(f"Помилка оновлення: {exc.status}",reply_markup=menu_keyboard)
+        else:
+            await message.answer(f"✅ Витрата з ID {expense_id} успішно оновлена.",reply_markup=menu_keyboard)
 
         await state.clear()
     except ValueError:
         await message.answer("Введіть  коректну суму.", reply_markup=menu_keyboard )
 
 
+@router.startup()
+async def on_startup(dispatcher: Dispatcher):
+    api = create_expense_client()
+    await api.start()
+    dispatcher['api'] = api
+
+
+@router.shutdown()
+async def on_shutdown(dispatcher: Dispatcher):
+    await dispatcher['api'].close()
+    await get_rate_provider().close()
+    report_queue.close()
+    send_scheduler.close()
+
+
+def create_bot(token: str = TOKEN) -> Bot:
+    """Bot whose chat-bound API calls go through the flood-limit-aware send queue."""
+    bot = Bot(token=token)
+    bot.session.middleware(send_scheduler)
+    return bot
+
+
+def create_dispatcher() -> Dispatcher:
+    """Dispatcher with FSM storage, metrics and throttling middlewares and the expense handlers."""
+    dispatcher = Dispatcher(storage=create_fsm_storage())
+    throttling = ThrottlingMiddleware(THROTTLE_LIMITS)
+    for observer in (dispatcher.message, dispatcher.callback_query):
+        observer.middleware(HandlerMetricsMiddleware())
+        observer.middleware(throttling)
+    dispatcher.include_router(router)
+    return dispatcher
+
+
 async def main():
-    await dp.start_polling(bot)
+    metrics_runner = await start_metrics_server(BOT_METRICS_PORT) if BOT_METRICS_PORT else None
+    try:
+        await create_dispatcher().start_polling(create_bot())
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await dispose_engines()
 
 
 if __name__ == "__main__":
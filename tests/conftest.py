@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+# Settings are read when config is imported, so point it at a scratch database first.
+_db_dir = tempfile.mkdtemp(prefix='expenses-tests-')
+os.environ['DATABASE_URL'] = f"sqlite+aiosqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ['BOT_WORKERS'] = '1'
+
+import pytest  # noqa: E402
+
+from cache import data_version, response_cache  # noqa: E402
+from models import AsyncSessionLocal, Base, dispose_engines, get_engine  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+async def db(anyio_backend):
+    """Session on a freshly created schema."""
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    # The new schema starts the data version over, which a running process never sees otherwise.
+    data_version._observe(0)
+    response_cache.clear()
+    async with AsyncSessionLocal() as session:
+        yield session
+    await dispose_engines()
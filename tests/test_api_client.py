@@ -0,0 +1,127 @@
+import socket
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from api_client import ApiError, HttpExpenseClient, NotFoundError
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeApi:
+    """Expense API stub whose responses are queued per route; records the requests it got."""
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        self.expenses = {1: {'id': 1, 'name': 'coffee'}}
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        self.server = TestServer(app)
+
+    def queue(self, method, path, *responses):
+        self.responses.setdefault((method, path), []).extend(responses)
+
+    async def handle(self, request):
+        self.requests.append((request.method, request.path, request.headers.get('If-None-Match')))
+        pending = self.responses.get((request.method, request.path))
+        response = pending.pop(0) if pending else None
+        if callable(response):
+            response = response(request)
+        if response == 'disconnect':
+            request.transport.close()
+            return web.Response()
+        if isinstance(response, int):
+            return web.Response(status=response, text=f'status {response}')
+        return web.json_response({'ok': True}) if response is None else response
+
+
+@pytest.fixture
+async def api(anyio_backend):
+    api = FakeApi()
+    await api.server.start_server()
+    yield api
+    await api.server.close()
+
+
+@pytest.fixture
+async def client(api):
+    client = HttpExpenseClient(base_url=str(api.server.make_url('/')), retries=2, backoff=0)
+    yield client
+    await client.close()
+
+
+async def test_idempotent_requests_are_retried(api, client):
+    api.queue('GET', '/expense/1/', 502, 'disconnect', web.json_response({'id': 1}))
+    assert await client.get_expense(1) == {'id': 1}
+    assert len(api.requests) == 3
+
+
+async def test_retries_give_up(api, client):
+    api.queue('GET', '/expense/1/', 503, 503, 503)
+    with pytest.raises(ApiError) as exc:
+        await client.get_expense(1)
+    assert exc.value.status == 503 and exc.value.retried
+    assert len(api.requests) == 3
+
+
+async def test_creates_are_not_retried(api, client):
+    api.queue('POST', '/expense/', 503)
+    with pytest.raises(ApiError) as exc:
+        await client.create_expense('coffee', 1, '01.03.2024')
+    assert exc.value.status == 503 and not exc.value.retried
+    assert len(api.requests) == 1
+
+
+async def test_client_errors_are_not_retried(api, client):
+    api.queue('GET', '/expense/all/', 400)
+    with pytest.raises(ApiError) as exc:
+        await client.list_expenses(cursor='bad')
+    assert exc.value.status == 400 and len(api.requests) == 1
+
+
+async def test_unreachable_api(anyio_backend):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    client = HttpExpenseClient(base_url=f'http://127.0.0.1:{port}/', retries=1, backoff=0)
+    try:
+        with pytest.raises(ApiError) as exc:
+            await client.get_expense(1)
+        assert exc.value.status == 0 and exc.value.retried
+    finally:
+        await client.close()
+
+
+async def test_gets_are_revalidated_with_the_etag(api, client):
+    api.queue('GET', '/expense/all/',
+              web.json_response({'items': [1]}, headers={'ETag': '"v1"'}),
+              web.Response(status=304, headers={'ETag': '"v1"'}),
+              web.json_response({'items': [2]}, headers={'ETag': '"v2"'}))
+
+    assert await client.list_expenses() == {'items': [1]}
+    assert await client.list_expenses() == {'items': [1]}
+    assert await client.list_expenses() == {'items': [2]}
+    assert [etag for _, _, etag in api.requests] == [None, '"v1"', '"v1"']
+
+    # Different parameters are cached separately.
+    await client.list_expenses(limit=5)
+    assert api.requests[-1][2] is None
+
+
+async def test_delete_whose_response_was_lost_succeeds(api, client):
+    def delete_then_fail(request):
+        api.expenses.pop(1)
+        return 504
+
+    api.queue('DELETE', '/expense/delete/1/', delete_then_fail, 404)
+    assert await client.delete_expense(1) == {'message': 'Expense deleted successfully'}
+    assert api.expenses == {} and len(api.requests) == 2
+
+
+async def test_delete_of_missing_expense_fails(api, client):
+    api.queue('DELETE', '/expense/delete/7/', 404)
+    with pytest.raises(NotFoundError) as exc:
+        await client.delete_expense(7)
+    assert not exc.value.retried
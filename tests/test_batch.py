@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import httpx
+import pytest
+from sqlalchemy import insert, select
+
+import main
+from exchange import ExchangeRateUnavailable, get_rate_provider
+from models import Expense
+from schemas import ExpenseSelection
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize('text, ids, ranges', [
+    ('3,7,10-25', [3, 7], [(10, 25)]),
+    (' 4 , 1 - 2 ,', [4], [(1, 2)]),
+    ('5-5', [], [(5, 5)]),
+])
+def test_selection_parse(text, ids, ranges):
+    selection = ExpenseSelection.parse(text)
+    assert (selection.ids, selection.ranges) == (ids, ranges)
+
+
+@pytest.mark.parametrize('text', ['', ',', 'abc', '3;4', '-5', '1-2-3', '9-2', '1-1001', '1,2-1001'])
+def test_selection_parse_rejects(text):
+    with pytest.raises(ValueError):
+        ExpenseSelection.parse(text)
+
+
+class Rate:
+    def __init__(self, rate=None):
+        self.rate = rate
+
+    async def get_rate(self) -> float:
+        if self.rate is None:
+            raise ExchangeRateUnavailable('down')
+        return self.rate
+
+
+@pytest.fixture
+async def api(db):
+    await db.execute(insert(Expense), [
+        {'id': i, 'name': f'e{i}', 'amount_minor': 100 * i, 'amount_usd_minor': i, 'date': datetime(2024, 3, i)}
+        for i in range(1, 7)
+    ])
+    await db.commit()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        yield client
+    main.app.dependency_overrides.clear()
+
+
+async def names(db):
+    db.expire_all()
+    return dict((await db.execute(select(Expense.id, Expense.name))).all())
+
+
+async def test_batch_delete(db, api):
+    response = await api.post('/expense/delete/', json={'ids': [1, 9], 'ranges': [[3, 4], [4, 5]]})
+    assert response.status_code == 200 and response.json()['deleted'] == [1, 3, 4, 5]
+    assert await names(db) == {2: 'e2', 6: 'e6'}
+
+    response = await api.post('/expense/delete/', json={'ids': [1]})
+    assert response.json()['deleted'] == []
+
+
+@pytest.mark.parametrize('body', [{}, {'ranges': [[5, 2]]}, {'ranges': [[1, 1001]]}])
+async def test_batch_delete_validates_the_selection(db, api, body):
+    assert (await api.post('/expense/delete/', json=body)).status_code == 422
+    assert len(await names(db)) == 6
+
+
+async def test_batch_update(db, api):
+    main.app.dependency_overrides[get_rate_provider] = lambda: Rate(0.5)
+    response = await api.put('/expense/update/', json={'items': [
+        {'id': 2, 'name': 'tea', 'amount': 3},
+        {'id': 5, 'name': 'taxi', 'amount': 10},
+        {'id': 42, 'name': 'x', 'amount': 1},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert [(item['id'], item['name'], item['amount'], item['amount_usd']) for item in body['updated']] == [
+        (2, 'tea', 3.0, 1.5), (5, 'taxi', 10.0, 5.0)]
+    assert body['not_found'] == [42]
+    assert (await names(db))[2] == 'tea'
+
+
+async def test_batch_update_without_a_rate_changes_nothing(db, api):
+    main.app.dependency_overrides[get_rate_provider] = lambda: Rate()
+    response = await api.put('/expense/update/', json={'items': [{'id': 2, 'name': 'tea', 'amount': 3}]})
+    assert response.status_code == 503
+    assert (await names(db))[2] == 'e2'
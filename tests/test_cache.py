@@ -0,0 +1,96 @@
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+
+import main
+from cache import DataVersion, ResponseCache, data_version, etag_matches, response_cache
+from models import Expense
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_commit_bumps_the_shared_version(db):
+    writer, reader = DataVersion(ttl=60), DataVersion(ttl=60)
+    assert await reader.current() == 0
+
+    # The schema comes from create_all, so the first bump also creates the row.
+    assert await writer.commit(db) == 1
+    assert await writer.commit(db, changed=False) == 1
+    assert await writer.commit(db) == 2
+    assert await writer.current() == 2
+
+    # Other processes see the new value once their TTL runs out.
+    assert await reader.current() == 0
+    reader.ttl = 0
+    assert await reader.current() == 2
+    assert await DataVersion.read(db) == 2
+
+
+def test_entries_expire_with_the_version():
+    version = DataVersion()
+    cache = ResponseCache(version, maxsize=2)
+    entry = cache.put('a', 0, b'{}')
+    assert cache.get('a', 0) is entry
+
+    version.value = 1
+    assert cache.get('a', 1) is None
+    assert cache.get('a', 0) is None  # a miss drops the entry
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_put_skips_bodies_built_from_an_older_version():
+    version = DataVersion()
+    version.value = 3
+    cache = ResponseCache(version)
+    cache.put('a', 2, b'old')
+    assert cache.get('a', 2) is None
+
+
+def test_put_skips_bodies_built_right_after_a_write():
+    version = DataVersion()
+    cache = ResponseCache(version, settle=60)
+    version.value, version.changed_at = 1, time.monotonic()
+    cache.put('a', 1, b'{}')
+    assert cache.get('a', 1) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(DataVersion(), maxsize=2)
+    for key in 'abc':
+        cache.put(key, 0, key.encode())
+        cache.get('a', 0)
+    assert cache.get('b', 0) is None
+    assert cache.get('a', 0).body == b'a' and cache.get('c', 0).body == b'c'
+    assert cache.evictions == 1
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False), ('*', True), ('"x"', True), ('W/"x"', True), ('"y", "x"', True), ('"y"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"x"') is expected
+
+
+async def test_api_serves_fresh_data_after_writes(db, monkeypatch):
+    response_cache.clear()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        first = await client.get('/expense/all/')
+        assert first.json()['items'] == []
+        cached = await client.get('/expense/all/', headers={'If-None-Match': first.headers['etag']})
+        assert cached.status_code == 304
+
+        # A write in this process is visible at once.
+        db.add(Expense(name='coffee', amount_minor=100, amount_usd_minor=3, date=datetime(2024, 3, 1)))
+        await data_version.commit(db)
+        response = await client.get('/expense/all/', headers={'If-None-Match': first.headers['etag']})
+        assert [item['name'] for item in response.json()['items']] == ['coffee']
+
+        # One in another process (here: another DataVersion) once the TTL runs out.
+        db.add(Expense(name='tea', amount_minor=200, amount_usd_minor=6, date=datetime(2024, 3, 2)))
+        await DataVersion().commit(db)
+        monkeypatch.setattr(data_version, 'ttl', 0)
+        response = await client.get('/expense/all/')
+        assert [item['name'] for item in response.json()['items']] == ['tea', 'coffee']
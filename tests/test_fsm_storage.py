@@ -0,0 +1,41 @@
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsm_storage import SQLAlchemyStorage, create_fsm_storage
+
+pytestmark = pytest.mark.anyio
+
+
+class Form(StatesGroup):
+    name = State()
+
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+OTHER = StorageKey(bot_id=1, chat_id=20, user_id=20)
+
+
+async def test_state_and_data_round_trip(db):
+    storage = SQLAlchemyStorage()
+    assert await storage.get_state(KEY) is None
+    assert await storage.get_data(KEY) == {}
+
+    await storage.set_state(KEY, Form.name)
+    await storage.set_data(KEY, {'expense_id': 7})
+    assert await storage.get_state(KEY) == 'Form:name'
+    assert await storage.get_data(KEY) == {'expense_id': 7}
+    assert await storage.get_state(OTHER) is None
+
+    # Clearing the state keeps the data; each is an upsert on the same row.
+    await storage.set_state(KEY, None)
+    assert await storage.update_data(KEY, {'picker_cursors': ['a']}) == {'expense_id': 7, 'picker_cursors': ['a']}
+    assert await storage.get_state(KEY) is None
+    assert await storage.get_data(KEY) == {'expense_id': 7, 'picker_cursors': ['a']}
+
+
+def test_create_fsm_storage():
+    assert isinstance(create_fsm_storage('sql'), SQLAlchemyStorage)
+    assert isinstance(create_fsm_storage('memory'), MemoryStorage)
+    with pytest.raises(ValueError):
+        create_fsm_storage('redis')
@@ -0,0 +1,98 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+from sqlalchemy import insert, select
+
+import fx_rates
+import services
+from fx_rates import HistoricalRates, get_history, load_rates, parse_rates, recompute_usd
+from models import DailyTotal, Expense
+from schemas import ExpenseCreate
+
+pytestmark = pytest.mark.anyio
+
+RATES = [
+    {'date': date(2024, 3, 1), 'rate': 0.5},
+    {'date': date(2024, 3, 4), 'rate': 0.25},
+    {'date': date(2024, 3, 10), 'rate': 0.1},
+]
+
+
+@pytest.fixture
+async def rates(db):
+    fx_rates.invalidate_history()
+    await load_rates(db, RATES, batch_size=2)
+    yield db
+    fx_rates.invalidate_history()
+
+
+def test_parse_rates():
+    rows = list(parse_rates(['date,rate\n', '2024-03-01,0.5\n', '04.03.2024, 0.25\n']))
+    assert rows == RATES[:2]
+
+    with pytest.raises(ValueError, match='line 3'):
+        list(parse_rates(['date,rate\n', '2024-03-01,0.5\n', '2024-03-02,high\n']))
+    with pytest.raises(ValueError, match='header'):
+        list(parse_rates(['day,rate\n']))
+
+
+@pytest.mark.parametrize('day, expected', [
+    (date(2024, 2, 29), None),
+    (date(2024, 3, 1), 0.5),
+    (date(2024, 3, 3), 0.5),
+    (date(2024, 3, 9), 0.25),
+    (date(2024, 3, 10), 0.1),
+    (date(2024, 3, 11), None),  # past the history: the live rate applies
+])
+def test_rate_is_the_latest_on_or_before_the_day(day, expected):
+    history = HistoricalRates([row['date'] for row in RATES], [row['rate'] for row in RATES])
+    assert history.rate_on(day) == expected
+
+    vectorized = history.rates_on(np.array([day], dtype='datetime64[D]'))[0]
+    assert np.isnan(vectorized) if expected is None else vectorized == expected
+
+
+async def test_loading_upserts_and_reloads_the_history(rates):
+    assert (await get_history(rates)).rate_on(date(2024, 3, 5)) == 0.25
+
+    assert await load_rates(rates, [{'date': date(2024, 3, 4), 'rate': 0.2}]) == 1
+    history = await get_history(rates)
+    assert len(history) == 3 and history.rate_on(date(2024, 3, 5)) == 0.2
+
+
+class NoLiveRate:
+    async def get_rate(self) -> float:
+        pytest.fail('the historical rate covers this day')
+
+
+class LiveRate:
+    async def get_rate(self) -> float:
+        return 2.0
+
+
+async def test_new_expenses_use_the_rate_of_their_day(rates):
+    covered = await services.create_expense(rates, ExpenseCreate(name='a', amount=10, date='05.03.2024'), NoLiveRate())
+    later = await services.create_expense(rates, ExpenseCreate(name='b', amount=10, date='11.03.2024'), LiveRate())
+    assert (covered.amount_usd_minor, later.amount_usd_minor) == (250, 2000)
+
+
+async def test_recompute_updates_covered_expenses_and_the_rollups(rates):
+    await rates.execute(insert(Expense), [
+        {'name': 'before', 'amount_minor': 1000, 'amount_usd_minor': 7, 'date': datetime(2024, 2, 29, 12)},
+        {'name': 'first', 'amount_minor': 1000, 'amount_usd_minor': 7, 'date': datetime(2024, 3, 1, 23, 59)},
+        {'name': 'half', 'amount_minor': 5, 'amount_usd_minor': 7, 'date': datetime(2024, 3, 2)},
+        {'name': 'second', 'amount_minor': 1000, 'amount_usd_minor': 7, 'date': datetime(2024, 3, 4)},
+        {'name': 'last', 'amount_minor': 1000, 'amount_usd_minor': 7, 'date': datetime(2024, 3, 10, 8)},
+        {'name': 'after', 'amount_minor': 1000, 'amount_usd_minor': 7, 'date': datetime(2024, 3, 11)},
+    ])
+    await rates.commit()
+
+    assert await recompute_usd(rates, batch_size=2) == 4
+    rows = dict((await rates.execute(select(Expense.name, Expense.amount_usd_minor))).all())
+    # 5 * 0.5 rounds half to even, like money.convert.
+    assert rows == {'before': 7, 'first': 500, 'half': 2, 'second': 250, 'last': 100, 'after': 7}
+
+    days = (await rates.execute(select(DailyTotal.day, DailyTotal.amount_usd_minor)
+                                .where(DailyTotal.count > 0).order_by(DailyTotal.day))).all()
+    assert [usd for _, usd in days] == [7, 500, 2, 250, 100, 7]
@@ -0,0 +1,88 @@
+import httpx
+import pytest
+from sqlalchemy import select
+
+import ingest
+import main
+from exchange import get_rate_provider
+from ingest import iter_csv, iter_ndjson
+from models import Expense
+
+pytestmark = pytest.mark.anyio
+
+CSV = (
+    '﻿Name,Amount,Date\r\n'
+    'coffee,12.5,01.03.2024\r\n'
+    '"lunch, with\r\n""friends""\r\n\r\nand more",100,02.03.2024\r\n'
+    '\r\n'
+    'taxi,7,03.03.2024\r\n'
+).encode()
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 1000])
+async def test_csv_records_may_span_lines_and_chunks(size, anyio_backend):
+    rows = await collect(iter_csv(chunked(CSV, size)))
+    assert rows == [
+        (1, {'name': 'coffee', 'amount': '12.5', 'date': '01.03.2024'}),
+        (2, {'name': 'lunch, with\n"friends"\n\nand more', 'amount': '100', 'date': '02.03.2024'}),
+        (3, {'name': 'taxi', 'amount': '7', 'date': '03.03.2024'}),
+    ]
+
+
+async def test_csv_unterminated_quote_fails_its_row(anyio_backend):
+    rows = await collect(iter_csv(chunked(b'name,amount,date\ncoffee,1,01.03.2024\n"tea,2,02.03.2024\n', 5)))
+    assert rows[0] == (1, {'name': 'coffee', 'amount': '1', 'date': '01.03.2024'})
+    assert rows[1][0] == 2 and isinstance(rows[1][1], ValueError)
+
+
+async def test_csv_header_must_name_every_column(anyio_backend):
+    with pytest.raises(ValueError, match='missing columns: date'):
+        await collect(iter_csv(chunked(b'name,amount\ncoffee,1\n', 1000)))
+
+
+async def test_ndjson_numbers_lines_and_reports_bad_ones(anyio_backend):
+    rows = await collect(iter_ndjson(chunked(b'{"name": "a"}\n\nnot json\n{"name": "b"}', 3)))
+    assert [number for number, _ in rows] == [1, 3, 4]
+    assert isinstance(rows[1][1], ValueError) and rows[2][1] == {'name': 'b'}
+
+
+class FixedRate:
+    async def get_rate(self) -> float:
+        return 0.5
+
+
+@pytest.fixture
+async def client(db):
+    main.app.dependency_overrides[get_rate_provider] = FixedRate
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        yield client
+    main.app.dependency_overrides.clear()
+
+
+async def test_bulk_csv_inserts_good_rows_and_caps_errors(db, client, monkeypatch):
+    monkeypatch.setattr(ingest, 'BULK_MAX_ERRORS', 2)
+    body = CSV + b'bad,x,04.03.2024\nworse,1,2024-03-05\ntea,,06.03.2024\n"open,1,07.03.2024\n'
+    response = await client.post('/expense/bulk/', content=chunked(body, 16), headers={'Content-Type': 'text/csv'})
+
+    assert response.status_code == 201
+    result = response.json()
+    assert (result['inserted'], result['failed'], result['errors_truncated']) == (3, 4, 2)
+    assert [error['row'] for error in result['errors']] == [4, 5]
+
+    names = (await db.execute(select(Expense.name, Expense.amount_minor).order_by(Expense.date))).all()
+    assert names == [('coffee', 1250), ('lunch, with\n"friends"\n\nand more', 10000), ('taxi', 700)]
+
+
+async def test_bulk_rejects_a_bad_header(client):
+    response = await client.post('/expense/bulk/', content=b'name;amount;date\n', headers={'Content-Type': 'text/csv'})
+    assert response.status_code == 400
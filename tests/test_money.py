@@ -0,0 +1,20 @@
+import pytest
+
+from money import convert, from_minor, to_minor
+
+
+@pytest.mark.parametrize('value, expected', [
+    (12.34, 1234), ('0.1', 10), (0.125, 12), (0.135, 14), (-2.5, -250), (150, 15000), (1e-3, 0),
+])
+def test_to_minor_rounds_half_to_even(value, expected):
+    assert to_minor(value) == expected
+
+
+def test_from_minor():
+    assert from_minor(1234) == 12.34
+    assert from_minor(None) is None
+
+
+@pytest.mark.parametrize('amount, rate, expected', [(1000, 0.025, 25), (250, 0.5, 125), (125, 0.5, 62), (375, 0.5, 188)])
+def test_convert_rounds_half_to_even(amount, rate, expected):
+    assert convert(amount, rate) == expected
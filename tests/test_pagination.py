@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+import services
+from models import Expense
+from pagination import decode_cursor, encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize('date', [datetime(2024, 3, 15, 10, 30, 5, 123456), datetime(2024, 3, 15)])
+def test_cursor_round_trip(date):
+    assert decode_cursor(encode_cursor(date, 42)) == (date, 42)
+
+
+def test_legacy_cursor_is_accepted():
+    assert decode_cursor('20240315103005_42') == (datetime(2024, 3, 15, 10, 30, 5), 42)
+
+
+@pytest.mark.parametrize('cursor', ['', 'garbage', '2024-03-15T10:30:05_x', '2024-13-01T00:00:00_1'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+async def test_pages_split_rows_within_one_second(db):
+    # Same second, different microseconds, and ids not in date order.
+    dates = [datetime(2024, 3, 15, 10, 30, 5, micro) for micro in (900000, 100, 500000, 100, 250000)]
+    await db.execute(insert(Expense), [
+        {'id': expense_id, 'name': f'e{expense_id}', 'amount_minor': 100, 'amount_usd_minor': 3, 'date': date}
+        for expense_id, date in zip((5, 1, 4, 2, 3), dates)
+    ])
+    await db.commit()
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = await services.list_page(db, 2, cursor)
+        seen += [row.id for row in rows]
+        if cursor is None:
+            break
+
+    expected = [row_id for _, row_id in sorted(zip(dates, (5, 1, 4, 2, 3)), reverse=True)]
+    assert seen == expected == [5, 4, 3, 2, 1]
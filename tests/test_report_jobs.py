@@ -0,0 +1,117 @@
+import asyncio
+import io
+from datetime import datetime
+
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import insert
+
+from models import Expense
+from report_jobs import LOADING, QUEUED, RENDERING, ReportCache, ReportJobQueue, ReportQueueFull
+from reports import PeriodExpenses, Sheet
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def queue(anyio_backend):
+    queue = ReportJobQueue(processes=1, max_jobs=2)
+    yield queue
+    queue.close()
+
+
+def sheet_rows(data: bytes, title: str) -> list:
+    return [list(row) for row in load_workbook(io.BytesIO(data), read_only=True)[title].values]
+
+
+def loader(rows, calls, started=None, release=None):
+    async def load():
+        calls.append(1)
+        if started is not None:
+            started.set()
+            await release.wait()
+        return [Sheet("S", ["n"], rows)]
+    return load
+
+
+async def test_concurrent_requests_share_one_job_and_then_the_cache(queue):
+    calls, started, release = [], asyncio.Event(), asyncio.Event()
+    stages = []
+
+    async def progress(stage):
+        stages.append(stage)
+
+    first = asyncio.create_task(queue.run('k', loader([[1], [2]], calls, started, release), progress))
+    await started.wait()
+    second = asyncio.create_task(queue.run('k', loader([[3]], calls), progress))
+    await asyncio.sleep(0)
+    assert queue.in_flight == 1
+    release.set()
+
+    first, second = await asyncio.gather(first, second)
+    assert first == second and calls == [1]
+    assert sheet_rows(first, 'S') == [['n'], [1], [2]]
+    assert stages == [LOADING, LOADING, RENDERING, RENDERING]
+
+    assert await queue.run('k', loader([[3]], calls)) == first
+    assert calls == [1] and queue.cache.hits == 1 and queue.in_flight == 0
+
+
+async def test_admission_is_bounded(queue):
+    calls, started, release = [], asyncio.Event(), asyncio.Event()
+    running = asyncio.create_task(queue.run('a', loader([[1]], calls, started, release)))
+    await started.wait()
+
+    stages = []
+
+    async def progress(stage):
+        stages.append(stage)
+
+    waiting = asyncio.create_task(queue.run('b', loader([[2]], calls), progress))
+    await asyncio.sleep(0)
+    assert stages == [QUEUED]
+    with pytest.raises(ReportQueueFull):
+        await queue.run('c', loader([[3]], calls))
+
+    release.set()
+    await asyncio.gather(running, waiting)
+    assert queue.in_flight == 0
+
+
+async def test_failed_job_is_not_cached(queue):
+    async def load():
+        raise RuntimeError('api down')
+
+    with pytest.raises(RuntimeError):
+        await queue.run('k', load)
+    assert queue.in_flight == 0 and queue.cache.get('k') is None
+
+
+def test_report_cache_evicts_by_count_and_bytes():
+    cache = ReportCache(maxsize=2, max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.get('a')
+    cache.put('c', b'12')
+    assert cache.get('b') is None and cache.get('a') == b'1234'
+
+    cache.put('d', b'123456')
+    assert cache.size_bytes <= 10 and cache.get('d') == b'123456'
+    cache.put('huge', b'x' * 11)
+    assert cache.get('huge') is None
+
+
+async def test_worker_streams_period_rows_itself(db, queue):
+    await db.execute(insert(Expense), [
+        {'name': f'e{day}', 'amount_minor': day * 100, 'amount_usd_minor': day * 3, 'date': datetime(2024, 5, day, 23)}
+        for day in range(1, 31)
+    ])
+    await db.commit()
+
+    async def load():
+        return [Sheet("Витрати", ["Назва", "Сума (₴)", "Сума ($)", "Дата"],
+                      PeriodExpenses('10.05.2024', '20.05.2024', 'local'), footer=["Итого"])]
+
+    rows = sheet_rows(await queue.run('period', load), "Витрати")
+    assert [row[0] for row in rows[1:-1]] == [f'e{day}' for day in range(10, 21)]
+    assert rows[1][1:] == [10.0, 0.3, datetime(2024, 5, 10, 23)]
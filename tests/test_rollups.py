@@ -0,0 +1,99 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import select
+
+import services
+from models import DailyTotal, MonthlyTotal
+from rollups import period_totals, rebuild
+from schemas import ExpenseCreate, ExpenseUpdate
+
+pytestmark = pytest.mark.anyio
+
+
+class FixedRate:
+    """Exchange rate provider stub; the test database has no historical rates, so every write uses it."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+
+    async def get_rate(self) -> float:
+        return self.rate
+
+
+async def rollups(db):
+    days = (await db.execute(select(DailyTotal).order_by(DailyTotal.day))).scalars().all()
+    months = (await db.execute(select(MonthlyTotal).order_by(MonthlyTotal.month))).scalars().all()
+    return ({row.day: (row.amount_minor, row.amount_usd_minor, row.count) for row in days if row.count},
+            {row.month: (row.amount_minor, row.amount_usd_minor, row.count) for row in months if row.count})
+
+
+async def assert_matches_rebuild(db):
+    incremental = await rollups(db)
+    await rebuild(db)
+    db.expire_all()
+    assert await rollups(db) == incremental
+
+
+async def create(db, name, day, amount, rate=0.5):
+    return await services.create_expense(db, ExpenseCreate(name=name, date=day, amount=amount), FixedRate(rate))
+
+
+async def test_create_adds_to_day_and_month(db):
+    await create(db, 'coffee', '31.01.2024', 12.5)
+    await create(db, 'lunch', '31.01.2024', 100)
+    await create(db, 'taxi', '01.02.2024', 7.25)
+
+    days, months = await rollups(db)
+    assert days == {date(2024, 1, 31): (11250, 5625, 2), date(2024, 2, 1): (725, 362, 1)}
+    assert months == {date(2024, 1, 1): (11250, 5625, 2), date(2024, 2, 1): (725, 362, 1)}
+    await assert_matches_rebuild(db)
+
+
+async def test_update_applies_the_difference(db):
+    first = (await create(db, 'coffee', '15.03.2024', 10)).id
+    second = (await create(db, 'tea', '16.03.2024', 4)).id
+
+    rows = await services.update_expenses(db, {first: ExpenseUpdate(name='coffee', amount=25),
+                                               second: ExpenseUpdate(name='tea', amount=4)}, FixedRate(2))
+    assert sorted(row[0] for row in rows) == [first, second]
+
+    days, months = await rollups(db)
+    assert days == {date(2024, 3, 15): (2500, 5000, 1), date(2024, 3, 16): (400, 800, 1)}
+    assert months == {date(2024, 3, 1): (2900, 5800, 2)}
+    await assert_matches_rebuild(db)
+
+
+async def test_update_of_missing_expense_changes_nothing(db):
+    await create(db, 'coffee', '15.03.2024', 10)
+    before = await rollups(db)
+
+    with pytest.raises(services.ExpenseNotFound):
+        await services.update_expense(db, 999, ExpenseUpdate(name='x', amount=1), FixedRate(1))
+    assert await rollups(db) == before
+
+
+async def test_delete_removes_from_day_and_month(db):
+    ids = [(await create(db, f'e{day}', f'{day:02}.04.2024', day)).id for day in range(1, 6)]
+
+    assert await services.delete_expenses(db, ids=[ids[0]], ranges=[(ids[2], ids[3])]) == [ids[0], ids[2], ids[3]]
+    assert await services.delete_expenses(db, ids=[ids[0]]) == []
+
+    days, months = await rollups(db)
+    assert days == {date(2024, 4, 2): (200, 100, 1), date(2024, 4, 5): (500, 250, 1)}
+    assert months == {date(2024, 4, 1): (700, 350, 2)}
+    await assert_matches_rebuild(db)
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    (datetime(2024, 1, 1), datetime(2024, 12, 31), (15000, 7500, 4)),
+    (datetime(2024, 1, 31), datetime(2024, 2, 29), (7000, 3500, 3)),
+    (datetime(2024, 2, 1), datetime(2024, 2, 29), (6000, 3000, 2)),
+    (datetime(2024, 2, 10), datetime(2024, 2, 28), (0, 0, 0)),
+    (datetime(2024, 2, 29), datetime(2024, 3, 1), (12000, 6000, 2)),
+])
+async def test_period_totals_combine_months_and_edge_days(db, start, end, expected):
+    for day, amount in (('31.01.2024', 10), ('01.02.2024', 20), ('29.02.2024', 40), ('01.03.2024', 80)):
+        await create(db, 'e', day, amount)
+
+    assert await period_totals(db, start, end) == expected
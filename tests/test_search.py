@@ -0,0 +1,142 @@
+import importlib.util
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import search
+import services
+from models import Base, Expense, make_engine
+
+pytestmark = pytest.mark.anyio
+
+NAMES = ['Coffee beans', 'coffee', 'Кава з молоком', 'кавун', 'Taxi 50%', 'taxi_home', 'Lunch']
+
+
+def _migration():
+    path = Path(__file__).parent.parent / 'alembic' / 'versions' / 'f1c6a8d93b57_add_expense_name_search_index.py'
+    spec = importlib.util.spec_from_file_location('search_index_migration', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(params=['scan', 'fts'])
+async def expenses(db, request):
+    if request.param == 'fts':
+        for statement in _migration().SQLITE_STATEMENTS:
+            await db.execute(text(statement))
+    await db.execute(insert(Expense), [
+        {'name': name, 'amount_minor': 100, 'amount_usd_minor': 3, 'date': datetime(2024, 3, day + 1)}
+        for day, name in enumerate(NAMES)
+    ])
+    await db.commit()
+    search.invalidate_index()
+    assert await search._has_index(db) is (request.param == 'fts')
+
+    yield db
+
+    if request.param == 'fts':
+        for trigger in ('expenses_fts_au', 'expenses_fts_ad', 'expenses_fts_ai'):
+            await db.execute(text(f"DROP TRIGGER {trigger}"))
+        await db.execute(text("DROP TABLE expenses_fts"))
+        await db.commit()
+    search.invalidate_index()
+
+
+async def names(db, query, fuzzy=False):
+    rows, _ = await services.search_expenses(db, query, fuzzy)
+    return sorted(row.name for row in rows)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('coff', ['Coffee beans', 'coffee']),
+    ('COFFEE B', ['Coffee beans']),
+    ('ка', ['Кава з молоком', 'кавун']),  # too short for the trigram index; still folds Cyrillic
+    ('КАВА', ['Кава з молоком']),
+    ('taxi 5', ['Taxi 50%']),
+    ('taxi_', ['taxi_home']),
+    ('beans', []),  # prefix search does not match inside names
+])
+async def test_prefix_search(expenses, query, expected):
+    assert await names(expenses, query) == expected
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('cofee', ['Coffee beans', 'coffee']),
+    ('beans', ['Coffee beans']),
+    ('молоко', ['Кава з молоком']),
+    ('zzz', []),
+])
+async def test_fuzzy_search(expenses, query, expected):
+    assert await names(expenses, query, fuzzy=True) == expected
+
+
+async def test_index_state_is_kept_per_engine(db, tmp_path):
+    search.invalidate_index()
+    assert await search._has_index(db) is False
+
+    other = make_engine(f"sqlite+aiosqlite:///{tmp_path / 'other.db'}")
+    async with other.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for statement in _migration().SQLITE_STATEMENTS:
+            await conn.execute(text(statement))
+    try:
+        async with AsyncSession(other) as session:
+            assert await search._has_index(session) is True
+            # Engines made by models can run the SQLite search functions.
+            assert (await session.execute(text("SELECT casefold('КАВА')"))).scalar() == 'кава'
+        assert await search._has_index(db) is False
+    finally:
+        await other.dispose()
+        search.invalidate_index()
+
+
+async def test_plain_engines_are_left_alone(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'plain.db'}")
+    try:
+        async with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                await conn.execute(text("SELECT casefold('x')"))
+    finally:
+        await engine.dispose()
+
+
+class PostgresBind:
+    dialect = postgresql.dialect()
+
+
+class PostgresSession:
+    """Just enough of an AsyncSession for name_filter's PostgreSQL branches."""
+
+    def __init__(self, trigram_extension: bool):
+        self.bind = PostgresBind()
+        self.trigram_extension = trigram_extension
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return SimpleNamespace(first=lambda: (1,) if self.trigram_extension else None)
+
+
+def compiled(condition) -> str:
+    return str(condition.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+@pytest.mark.parametrize('trigram_extension, fuzzy, expected', [
+    (True, True, "'cofee' <%% expenses.name"),
+    (True, False, "expenses.name ILIKE 'cof' || '%%' ESCAPE '/'"),
+    (False, True, "expenses.name ILIKE '%%' || 'cofee' || '%%' ESCAPE '/'"),
+    (False, False, "expenses.name ILIKE 'cof' || '%%' ESCAPE '/'"),
+])
+async def test_postgresql_falls_back_to_scans_without_pg_trgm(trigram_extension, fuzzy, expected, anyio_backend):
+    session = PostgresSession(trigram_extension)
+    condition = await search.name_filter(session, 'cofee' if fuzzy else 'cof', fuzzy)
+    assert compiled(condition) == expected
+    assert any('word_similarity_threshold' in statement for statement in session.statements) is (
+        trigram_extension and fuzzy)
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+import services
+from models import Expense
+from rollups import rebuild
+
+pytestmark = pytest.mark.anyio
+
+EXPENSES = [
+    ('coffee', 100, datetime(2024, 3, 4, 9)),  # a Monday
+    ('lunch', 200, datetime(2024, 3, 10, 23, 59, 59)),
+    ('coffee', 400, datetime(2024, 3, 11)),
+    ('tea', 800, datetime(2024, 4, 1, 12)),
+]
+
+
+@pytest.fixture
+async def expenses(db):
+    await db.execute(insert(Expense), [
+        {'name': name, 'amount_minor': amount, 'amount_usd_minor': amount // 4, 'date': date}
+        for name, amount, date in EXPENSES
+    ])
+    await rebuild(db)
+    return db
+
+
+async def test_period_rows_cover_the_whole_last_day(expenses):
+    start, end = datetime(2024, 3, 4), datetime(2024, 3, 10)
+    summary = await services.period_summary(expenses, start, end)
+    rows = await services.list_period(expenses, start, end)
+
+    assert [row.name for row in rows] == ['coffee', 'lunch']
+    assert (summary['total_amount'], summary['total_amount_usd'], summary['count']) == (3.0, 0.75, 2)
+    assert sum(row.amount_minor for row in rows) == 300
+
+
+async def test_groups(expenses):
+    summary = await services.period_summary(expenses, datetime(2024, 3, 1), datetime(2024, 3, 31),
+                                            ['day', 'week', 'month', 'name'])
+    keys = {grouping: [(group['key'], group['amount'], group['count']) for group in groups]
+            for grouping, groups in summary['groups'].items()}
+
+    assert keys == {
+        'day': [('2024-03-04', 1.0, 1), ('2024-03-10', 2.0, 1), ('2024-03-11', 4.0, 1)],
+        'week': [('2024-03-04', 3.0, 2), ('2024-03-11', 4.0, 1)],
+        'month': [('2024-03', 7.0, 3)],
+        'name': [('coffee', 5.0, 2), ('lunch', 2.0, 1)],
+    }
+    assert summary['count'] == 3 and summary['total_amount'] == 7.0
+
+
+async def test_empty_period(expenses):
+    summary = await services.period_summary(expenses, datetime(2024, 5, 1), datetime(2024, 5, 31), ['name', 'day'])
+    assert summary['count'] == 0 and summary['total_amount'] == 0 and summary['groups'] == {'name': [], 'day': []}
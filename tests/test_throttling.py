@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.methods import SendDocument, SendMessage
+from aiogram.types import BufferedInputFile, InlineKeyboardButton, InlineKeyboardMarkup
+
+from throttling import SendScheduler, ThrottlingMiddleware, TokenBucket, separate_message
+
+pytestmark = pytest.mark.anyio
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, capacity=3, now=0)
+    for _ in range(3):
+        assert bucket.delay(0) == 0
+        bucket.take(0)
+    assert bucket.delay(0) == 0.5
+    assert bucket.delay(0.5) == 0
+    assert bucket.full(10)
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(rate=1, capacity=5, now=0)
+    bucket.pause(0, 4)
+    assert bucket.delay(1) == 3
+    assert bucket.delay(4) == 0
+    bucket.take(4)
+    assert bucket.delay(4) == 1
+
+
+class FakeApi:
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, bot, method):
+        self.sent.append(getattr(method, 'text', type(method).__name__))
+        return self.sent[-1]
+
+
+def send(scheduler, api, text, chat_id=1, **kwargs):
+    return scheduler(api, None, SendMessage(chat_id=chat_id, text=text, **kwargs))
+
+
+async def test_texts_queued_behind_a_throttled_chat_are_merged():
+    scheduler, api = SendScheduler(chat_rate=20, chat_burst=1), FakeApi()
+    try:
+        await send(scheduler, api, 'first')
+        results = await asyncio.gather(*(send(scheduler, api, text) for text in 'abc'))
+    finally:
+        scheduler.close()
+    assert api.sent == ['first', 'a\n\nb\n\nc']
+    assert results == ['a\n\nb\n\nc'] * 3
+    assert scheduler.coalesced == 2
+
+
+async def test_edited_messages_are_not_merged():
+    scheduler, api = SendScheduler(chat_rate=20, chat_burst=1), FakeApi()
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text='x', callback_data='x')]])
+
+    async def progress(text):
+        with separate_message():
+            return await send(scheduler, api, text)
+
+    try:
+        await send(scheduler, api, 'first')
+        results = await asyncio.gather(send(scheduler, api, 'a'), progress('status'), send(scheduler, api, 'b'),
+                                       send(scheduler, api, 'picker', reply_markup=keyboard))
+    finally:
+        scheduler.close()
+    assert api.sent == ['first', 'a', 'status', 'b', 'picker']
+    assert results == ['a', 'status', 'b', 'picker']
+
+
+async def test_texts_go_ahead_of_uploads_for_other_chats():
+    scheduler, api = SendScheduler(global_rate=20, chat_burst=5), FakeApi()
+    document = SendDocument(chat_id=1, document=BufferedInputFile(b'x', filename='x.xlsx'))
+    try:
+        await send(scheduler, api, 'warm', chat_id=3)
+        await asyncio.gather(scheduler(api, None, document), send(scheduler, api, 'hi', chat_id=2))
+    finally:
+        scheduler.close()
+    assert api.sent == ['warm', 'hi', 'SendDocument']
+
+
+def test_workers_share_the_send_limits():
+    scheduler = SendScheduler(global_rate=30, chat_rate=1, chat_burst=3, group_rate=0.5, workers=4)
+    assert (scheduler.global_bucket.rate, scheduler.global_bucket.capacity) == (7.5, 7.5)
+    assert (scheduler.chat_rate, scheduler.chat_burst, scheduler.group_rate) == (0.25, 1, 0.125)
+    assert scheduler._chat(1).bucket.rate == 0.25 and scheduler._chat(-100).bucket.rate == 0.125
+
+
+class FakeMessage:
+    def __init__(self):
+        self.answers = []
+
+    async def answer(self, text):
+        self.answers.append(text)
+
+
+async def test_throttling_middleware_rejects_over_the_limit():
+    middleware = ThrottlingMiddleware({'search': (10, 2)})
+    calls = []
+
+    async def handler(event, data):
+        calls.append(event)
+        return 'handled'
+
+    flagged = {'handler': HandlerObject(handler, flags={'throttle': 'search'}),
+               'event_from_user': SimpleNamespace(id=1)}
+    event = FakeMessage()
+    assert [await middleware(handler, event, flagged) for _ in range(3)] == ['handled', 'handled', None]
+    assert len(event.answers) == 1
+
+    # Other users and unflagged handlers are not limited.
+    assert await middleware(handler, event, {**flagged, 'event_from_user': SimpleNamespace(id=2)}) == 'handled'
+    assert await middleware(handler, event, {'handler': HandlerObject(handler),
+                                             'event_from_user': SimpleNamespace(id=1)}) == 'handled'
+    assert len(calls) == 4
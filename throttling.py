@@ -0,0 +1,352 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendDocument, SendMediaGroup, SendMessage, TelegramMethod
+from aiogram.types import InlineKeyboardMarkup
+
+from config import (BOT_SEND_CHAT_BURST, BOT_SEND_CHAT_RATE, BOT_SEND_GLOBAL_RATE, BOT_SEND_GROUP_RATE,
+                    BOT_SEND_MAX_RETRIES, BOT_WORKERS, THROTTLE_REPORT_BURST, THROTTLE_REPORT_INTERVAL,
+                    THROTTLE_SEARCH_BURST, THROTTLE_SEARCH_INTERVAL)
+from metrics import CallbackMetric, Counter, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, BULK = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+# Uploads can take seconds each; they yield to text replies and edits queued for other chats.
+BULK_METHODS = (SendDocument, SendMediaGroup)
+MESSAGE_LIMIT = 4096
+PRUNE_INTERVAL = 60
+
+_separate = ContextVar('separate_message', default=False)
+
+
+@contextmanager
+def separate_message():
+    """Never merge messages sent inside with others; for callers that edit the message they get back."""
+    token = _separate.set(True)
+    try:
+        yield
+    finally:
+        _separate.reset(token)
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``capacity``."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available; 0 if one is available now."""
+        self._refill(now)
+        if now < self.updated:
+            return self.updated - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        """Hand out nothing for ``seconds``, then one token (Telegram's RetryAfter)."""
+        self._refill(now)
+        self.tokens = 1
+        self.updated = max(self.updated, now + seconds)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return now >= self.updated and self.tokens >= self.capacity
+
+
+@dataclass
+class OutgoingRequest:
+    method: TelegramMethod
+    make_request: Callable
+    bot: Any
+    priority: int
+    seq: int
+    waiters: List[Tuple[asyncio.Future, float]] = field(default_factory=list)
+    attempts: int = 0
+    mergeable: bool = True
+
+
+@dataclass
+class ChatQueue:
+    bucket: TokenBucket
+    requests: Deque[OutgoingRequest] = field(default_factory=deque)
+    busy: bool = False
+
+
+def _coalescable(first: OutgoingRequest, second: OutgoingRequest) -> bool:
+    """Two texts can go out as one message if only the second carries a keyboard and the rest matches."""
+    if not (first.mergeable and second.mergeable):
+        return False
+    first, second = first.method, second.method
+    if not (isinstance(first, SendMessage) and isinstance(second, SendMessage)):
+        return False
+    if first.reply_markup is not None or first.entities or second.entities:
+        return False
+    # Callbacks edit the message their inline keyboard is on, which would wipe the texts merged into it.
+    if isinstance(second.reply_markup, InlineKeyboardMarkup):
+        return False
+    if len(first.text) + len(second.text) + 2 > MESSAGE_LIMIT:
+        return False
+    return first.model_dump(exclude={'text', 'reply_markup'}) == second.model_dump(exclude={'text', 'reply_markup'})
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Bot session middleware that queues chat-bound Bot API calls against Telegram's flood limits.
+
+    Every request with a ``chat_id`` waits for a token from its chat's bucket and
+    from the global one; other calls (getUpdates, answerCallbackQuery, ...) pass
+    straight through. Each chat sends one request at a time in order, interactive
+    requests go ahead of uploads for other chats, and texts that pile up behind a
+    throttled chat are merged into one message, so their callers all get that
+    combined message back. Messages that get edited later are never merged, since
+    an edit would overwrite the other texts: those with an inline keyboard and
+    those sent inside ``separate_message()``. RetryAfter pauses the chat and the
+    request is retried.
+
+    Buckets live in each process, and updates for one chat may reach any webhook
+    worker, so each of the ``workers`` processes sending with the bot's token gets
+    an equal share of every rate and burst; together they stay within the
+    configured limits.
+    """
+
+    def __init__(self, global_rate: float = BOT_SEND_GLOBAL_RATE, chat_rate: float = BOT_SEND_CHAT_RATE,
+                 chat_burst: int = BOT_SEND_CHAT_BURST, group_rate: float = BOT_SEND_GROUP_RATE,
+                 max_retries: int = BOT_SEND_MAX_RETRIES, workers: int = BOT_WORKERS):
+        workers = max(workers, 1)
+        global_rate = global_rate / workers
+        self.global_bucket = TokenBucket(global_rate, max(global_rate, 1), time.monotonic())
+        self.chat_rate = chat_rate / workers
+        self.chat_burst = max(chat_burst // workers, 1)
+        self.group_rate = group_rate / workers
+        self.max_retries = max_retries
+        self.chats: Dict[Hashable, ChatQueue] = {}
+        self.coalesced = 0
+        self._seq = 0
+        self._worker: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._sending = set()
+        self._pruned_at = time.monotonic()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(chat.requests) for chat in self.chats.values())
+
+    async def __call__(self, make_request, bot, method: TelegramMethod):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        request = OutgoingRequest(method, make_request, bot, BULK if isinstance(method, BULK_METHODS) else INTERACTIVE,
+                                  self._seq, [(future, time.monotonic())], mergeable=not _separate.get())
+        self._chat(chat_id).requests.append(request)
+        self._wakeup.set()
+        return await future
+
+    def _chat(self, chat_id: Hashable) -> ChatQueue:
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            # Negative ids and @usernames are groups and channels, which Telegram limits per minute.
+            group = not isinstance(chat_id, int) or chat_id < 0
+            rate = self.group_rate if group else self.chat_rate
+            chat = self.chats[chat_id] = ChatQueue(TokenBucket(rate, 1 if group else self.chat_burst,
+                                                               time.monotonic()))
+        return chat
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run(), name='telegram-send-scheduler')
+
+    def _next(self, now: float) -> Tuple[Optional[Hashable], Optional[float]]:
+        """The chat to send for next, or how long until one may send (None: nothing queued)."""
+        best, best_key, wait = None, None, None
+        for chat_id, chat in self.chats.items():
+            if chat.busy or not chat.requests:
+                continue
+            delay = chat.bucket.delay(now)
+            if delay:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            head = chat.requests[0]
+            if best_key is None or (head.priority, head.seq) < best_key:
+                best, best_key = chat_id, (head.priority, head.seq)
+        if best is not None:
+            delay = self.global_bucket.delay(now)
+            if delay:
+                return None, delay
+        return best, wait
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            if now - self._pruned_at > PRUNE_INTERVAL:
+                self._prune(now)
+            chat_id, wait = self._next(now)
+            if chat_id is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            chat = self.chats[chat_id]
+            request = chat.requests.popleft()
+            while chat.requests and _coalescable(request, chat.requests[0]):
+                following = chat.requests.popleft()
+                request.method = request.method.model_copy(update={
+                    'text': f'{request.method.text}\n\n{following.method.text}',
+                    'reply_markup': following.method.reply_markup,
+                })
+                request.waiters.extend(following.waiters)
+                self.coalesced += 1
+
+            request.waiters = [(future, queued) for future, queued in request.waiters if not future.done()]
+            if not request.waiters:
+                continue
+            chat.bucket.take(now)
+            self.global_bucket.take(now)
+            chat.busy = True
+            task = asyncio.create_task(self._send(chat_id, chat, request))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, chat_id: Hashable, chat: ChatQueue, request: OutgoingRequest):
+        started = time.monotonic()
+        for _, queued in request.waiters:
+            send_wait.observe(started - queued, PRIORITY_NAMES[request.priority])
+        try:
+            result = await request.make_request(request.bot, request.method)
+        except TelegramRetryAfter as exc:
+            send_events.inc(1, 'retry_after')
+            request.attempts += 1
+            if request.attempts <= self.max_retries:
+                logger.warning("Flood control in chat %s, retrying in %ss", chat_id, exc.retry_after)
+                chat.bucket.pause(time.monotonic(), exc.retry_after)
+                chat.requests.appendleft(request)
+            else:
+                self._resolve(request, error=exc)
+        except Exception as exc:
+            self._resolve(request, error=exc)
+        else:
+            self._resolve(request, result=result)
+        finally:
+            chat.busy = False
+            self._wakeup.set()
+
+    @staticmethod
+    def _resolve(request: OutgoingRequest, result=None, error: BaseException = None):
+        for future, _ in request.waiters:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _prune(self, now: float):
+        """Forget idle chats whose bucket has refilled; a new bucket would start full anyway."""
+        self._pruned_at = now
+        for chat_id in [chat_id for chat_id, chat in self.chats.items()
+                        if not chat.busy and not chat.requests and chat.bucket.full(now)]:
+            del self.chats[chat_id]
+
+    def close(self):
+        """Stop the worker; requests still queued fail with CancelledError."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for chat in self.chats.values():
+            for request in chat.requests:
+                for future, _ in request.waiters:
+                    future.cancel()
+        self.chats.clear()
+
+
+class ThrottlingMiddleware:
+    """aiogram inner middleware limiting how often each user may run handlers flagged ``throttle``.
+
+    Handlers opt in with ``flags={'throttle': '<action>'}``; ``limits`` maps each
+    action to (seconds per call, burst). A throttled update gets a short reply and
+    never reaches the handler, so FSM state is left as it was. Limits apply per
+    worker process: they guard against floods rather than enforce exact quotas.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, int]]):
+        self.limits = limits
+        self.buckets: Dict[Tuple[int, str], TokenBucket] = {}
+        self._pruned_at = time.monotonic()
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Any,
+                       data: Dict[str, Any]) -> Any:
+        action = get_flag(data, 'throttle')
+        user = data.get('event_from_user')
+        if action not in self.limits or user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        if now - self._pruned_at > PRUNE_INTERVAL:
+            self._pruned_at = now
+            for key in [key for key, bucket in self.buckets.items() if bucket.full(now)]:
+                del self.buckets[key]
+
+        interval, burst = self.limits[action]
+        bucket = self.buckets.get((user.id, action))
+        if bucket is None:
+            bucket = self.buckets[user.id, action] = TokenBucket(1 / interval, burst, now)
+        delay = bucket.delay(now)
+        if delay:
+            throttled.inc(1, action)
+            await event.answer(f"Забагато запитів. Спробуйте ще раз через {math.ceil(delay)} с.")
+            return None
+        bucket.take(now)
+        return await handler(event, data)
+
+
+THROTTLE_LIMITS = {
+    'report': (THROTTLE_REPORT_INTERVAL, THROTTLE_REPORT_BURST),
+    'search': (THROTTLE_SEARCH_INTERVAL, THROTTLE_SEARCH_BURST),
+}
+
+send_scheduler = SendScheduler()
+
+send_wait = registry.register(Histogram(
+    'bot_send_wait_seconds', 'Time outgoing Bot API requests waited in the send queue.', ('priority',),
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)))
+send_events = registry.register(Counter(
+    'bot_send_events_total', 'Send queue events.', ('event',)))
+throttled = registry.register(Counter(
+    'bot_throttled_total', 'Updates rejected by per-user throttling.', ('action',)))
+registry.register(CallbackMetric('bot_send_queue_depth', 'Outgoing Bot API requests waiting in the send queue.',
+                                 lambda: send_scheduler.depth))
+registry.register(CallbackMetric('bot_send_coalesced_total', 'Text messages merged into the one before them.',
+                                 lambda: send_scheduler.coalesced, type='counter'))
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from fastapi import APIRouter, FastAPI, HTTPException, Request, Response, status
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
+from metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from models import dispose_engines
+from telegram import create_bot, create_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Updates are handled in the background so Telegram gets its 200 immediately;
+# keep references so the tasks are not garbage-collected mid-flight.
+_background_tasks = set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.bot = bot = create_bot()
+    app.state.dp = dp = create_dispatcher()
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+    if WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                              allowed_updates=dp.resolve_used_update_types())
+    yield
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+    await dp.storage.close()
+    await bot.session.close()
+    await dispose_engines()
+
+
+router = APIRouter()
+
+
+async def _feed_update(dp: Dispatcher, bot: Bot, update: Update):
+    try:
+        await dp.feed_update(bot, update)
+    except Exception:
+        logger.exception("Failed to process update %s", update.update_id)
+
+
+@router.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid secret token")
+
+    bot, dp = request.app.state.bot, request.app.state.dp
+    update = Update.model_validate(await request.json(), context={'bot': bot})
+    task = asyncio.create_task(_feed_update(dp, bot, update))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return {'ok': True}
+
+
+@router.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+def create_app() -> FastAPI:
+    """Webhook app; the bot and dispatcher are built in its lifespan, not at import.
+
+    FSM state is kept in the database, so it can run under several workers; set
+    BOT_WORKERS to the total across hosts so they share Telegram's send limits.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    return app
+
+
+app = create_app()